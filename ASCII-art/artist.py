@@ -1,9 +1,11 @@
 import images
+import os
 import random
 from PIL import Image, ImageDraw, ImageFont, ImageChops
 
 FONTSIZE = 25
-FONT = ImageFont.truetype("ASCII-art\DejaVuSansMono-Bold.ttf", FONTSIZE)
+FONT_PATH = os.path.join(os.path.dirname(__file__), "DejaVuSansMono-Bold.ttf")
+FONT = ImageFont.truetype(FONT_PATH, FONTSIZE)
 LINEHEIGHT = 25
 CHARWIDTH = 15
 
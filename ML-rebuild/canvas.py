@@ -31,15 +31,17 @@ class canvas:
         self.original = Image.open(picture_path)
         return
 
-    def sample_original(self, n):
-        """ Samples [original] for points that are known to rebuilders. """
+    def sample_original(self, n, seed=None):
+        """ Samples [original] for points that are known to rebuilders. A
+        [seed] (an int or a numpy Generator) makes the samples reproducible. """
+        rng = np.random.default_rng(seed)
 
         width, height = self.original.size
         samples = {"where": [], "what": []}
 
         for _ in range(n):
-            xi = random.randint(0, width - 1)
-            yi = random.randint(0, height - 1)
+            xi = int(rng.integers(0, width))
+            yi = int(rng.integers(0, height))
             samples["where"].append([xi, yi])
             samples["what"].append(self.original.getpixel((xi, yi)))
 
@@ -91,8 +93,9 @@ class double_canvas(canvas):
         self.original2 = Image.open(picture_path2)
         return
 
-    def sample_original_old(self, n):
+    def sample_original_old(self, n, seed=None):
         """ Samples [original] for points that are known to rebuilders. """
+        rng = np.random.default_rng(seed)
         self.samples = {"where": [], "what": []}
 
         for i, original in (self.original1, self.original2):
@@ -100,28 +103,30 @@ class double_canvas(canvas):
 
 
             for _ in range(n // 2):
-                xi = np.random.randint(0, width - 1)
-                yi = np.random.randint(0, height - 1)
+                xi = rng.integers(0, width - 1)
+                yi = rng.integers(0, height - 1)
                 self.samples["where"].append([xi, yi])
                 self.samples["what"].append(original.getpixel((xi, yi)))
 
         return
 
-    def sample_original(self, n):
-        """ Samples [original] for points that are known to rebuilders. """
+    def sample_original(self, n, seed=None):
+        """ Samples [original] for points that are known to rebuilders. A
+        [seed] (an int or a numpy Generator) makes the samples reproducible. """
+        rng = np.random.default_rng(seed)
         self.samples = {"where": [], "what": []}
 
         width, height = self.original1.size
         for _ in range(n // 2):
-            xi = np.clip(int(np.random.beta(2, self.separation) * width), 0, width - 1)
-            yi = np.clip(int(np.random.beta(2, self.separation) * height), 0, height - 1)
+            xi = np.clip(int(rng.beta(2, self.separation) * width), 0, width - 1)
+            yi = np.clip(int(rng.beta(2, self.separation) * height), 0, height - 1)
             self.samples["where"].append([xi, yi])
             self.samples["what"].append(self.original1.getpixel((xi, yi)))
                 
         width, height = self.original2.size
         for _ in range(n // 2):
-            xi = np.clip(int((1 - np.random.beta(2, self.separation)) * width), 0, width - 1)
-            yi = np.clip(int((1 - np.random.beta(2, self.separation)) * height), 0, height - 1)
+            xi = np.clip(int((1 - rng.beta(2, self.separation)) * width), 0, width - 1)
+            yi = np.clip(int((1 - rng.beta(2, self.separation)) * height), 0, height - 1)
             self.samples["where"].append([xi, yi])
             self.samples["what"].append(self.original2.getpixel((xi, yi)))
 
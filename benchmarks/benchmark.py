@@ -0,0 +1,394 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import PIL
+from PIL import Image
+
+# =============================================================================
+# Benchmarks of the generators. Every project runs in its own process, since
+# the projects use the same module names (genetics, canvas, artist, ...). The
+# images are synthetic and all generators are seeded, so two runs on the same
+# machine do the same work and can be compared to spot regressions.
+#
+#   python benchmarks/benchmark.py --out results.json
+#   python benchmarks/benchmark.py --compare results.json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONT = os.path.join(ROOT, "ASCII-art", "DejaVuSansMono-Bold.ttf")
+
+SIZES = {"small": (96, 64), "medium": (192, 128), "large": (384, 256)}
+
+# Directory of every project, relative to the root of the repository
+PROJECTS = {
+    "shape-genetics": "shape-genetics",
+    "minimal-art-evolution": "minimal-art-evolution",
+    "triangle-mesh": "triangle-mesh",
+    "ASCII-art": "ASCII-art",
+    "gradual-coloring": os.path.join("gradual-coloring", "python"),
+    "gravity-swarm": "gravity-swarm",
+    "ML-rebuild": "ML-rebuild",
+}
+
+
+def synthetic_image(w: int, h: int)-> Image:
+    """ Returns a deterministic picture with both sharp edges and smooth
+    gradients, so that no generator gets an unusually easy target. """
+    mandel = Image.effect_mandelbrot((w, h), (-2, -1.2, 1, 1.2), 64)
+    linear = Image.linear_gradient("L").resize((w, h))
+    radial = Image.radial_gradient("L").resize((w, h))
+    return Image.merge("RGB", (mandel, linear, radial))
+
+
+def seed_all(seed: int):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def measure(case: dict, run, evaluations: int, steps: int, seed: int):
+    """ Calls [run] [steps] times and returns the [case] with the timings. One
+    call does [evaluations] evaluations. The peak of traced allocations is
+    measured on an extra call, since tracing memory slows everything down.
+    Memory of images is not traced, so the peak resident memory of the whole
+    process so far is reported too. """
+    steps = max(1, steps)
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            seed_all(seed)
+            run()  # warm up caches and lazy loading
+            seed_all(seed)
+            start = time.perf_counter()
+            for _ in range(steps):
+                run()
+            seconds = time.perf_counter() - start
+
+            tracemalloc.start()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    return dict(case, steps=steps, evaluations=evaluations * steps,
+                seconds=seconds, seconds_per_step=seconds / steps,
+                evals_per_second=evaluations * steps / seconds,
+                peak_memory=peak, max_rss=max_rss())
+
+
+def max_rss()-> int:
+    """ Returns the peak resident memory of the process in bytes. """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+# =============================================================================
+# Benchmarks of single projects. Each one gets the synthetic image, the name of
+# its size, the seed and a factor for the number of steps, and returns a list
+# of measured cases.
+
+
+def bench_shape_genetics(img, size, seed, scale):
+    import array_genetics
+    import genetics
+    import evolution
+    from target import Target
+
+    target = Target(img)
+    w, h = img.size
+    gene_specs = {
+        "circle": {"mut_p": 30, "mut_r": 3, "mut_c": 40, "max_r": 40,
+                   "init_r": 15},
+        "polygon": {"mut_p": 30, "mut_n": 0.1, "mut_c": 30, "init_r": 50,
+                    "max_n": 5},
+        "letter": {"mut_p": 30, "mut_r": 5, "mut_c": 50, "max_r": 100,
+                   "init_r": 30, "mut_l": 0.3, "font": FONT},
+    }
+
+    # Ways of scoring offspring, by the suffix of their case. Snapshots of the
+    # parents pay off for metrics that are not local, where an incremental
+    # redraw is not possible, and when offspring change few genes, so they are
+    # compared with the low rates of a long evolution. They save drawing time
+    # only, which is a small part of scoring with ssim but most of it with a
+    # 4 times smaller l1 proxy.
+    ssim = Target(img, "ssim")
+    proxy = Target(img, "l1", 4)
+    low_rates = {"gene_mutation_ratio": 0.01, "combine_ratio": 0.01}
+    prefix = {"prefix_cache": True, "prefix_every": 10}
+    modes = {"": ({}, target),
+             "[incremental]": ({"incremental": True}, target),
+             "[ssim]": (low_rates, ssim),
+             "[ssim, prefix_cache]": (dict(low_rates, **prefix), ssim),
+             "[proxy]": (low_rates, proxy),
+             "[proxy, prefix_cache]": (dict(low_rates, **prefix), proxy)}
+
+    results = []
+    for kind, specs in gene_specs.items():
+        for mode, (extra, mode_target) in modes.items():
+            evo_specs = {"kind": kind, "dna_len": 100, "pop_size": 10,
+                         "gene_switch_ratio": 0.2, "gene_mutation_ratio": 0.05,
+                         "property_mutation_ratio": 0.1, "combine_ratio": 0.1}
+            evo_specs.update(extra)
+            seed_all(seed)
+            gene_tools = genetics.make_gene_tools(kind, w, h, dict(specs))
+            dna_tools = genetics.DNA(gene_tools, evo_specs)
+            pop = evolution.initial_population(dna_tools, 100, 10,
+                                               mode_target)
+            case = {"project": "shape-genetics", "size": size, "kind": kind}
+
+            if not mode:
+                dna = pop[0][1]
+                results.append(measure(
+                    dict(case, function="evaluate_dna"),
+                    lambda: dna_tools.evaluate_dna(dna, target), 1,
+                    int(200 * scale), seed))
+
+            def step():
+                nonlocal pop
+                pop, _ = evolution.evolve_pop_step(pop, dna_tools,
+                                                   mode_target)
+            results.append(measure(
+                dict(case, function="evolve_pop_step" + mode), step, 1,
+                int(500 * scale), seed))
+
+        # Array dnas, drawn by PIL and by the numpy rasterizer of raster.py
+        rasterizers = {"pil": ""} if kind == "letter" else {
+            "pil": "", "numpy": "[numpy]"}
+        for rasterizer, suffix in rasterizers.items():
+            seed_all(seed)
+            gene_tools = genetics.make_gene_tools(kind, w, h, dict(specs))
+            array_tools = array_genetics.ArrayDNA(
+                gene_tools, dict(evo_specs, rasterizer=rasterizer),
+                rng=np.random.default_rng(seed))
+            dna = array_tools.random_dnas(1, 100)[0]
+            results.append(measure(
+                dict(case, function="ArrayDNA.evaluate_dna" + suffix),
+                lambda: array_tools.evaluate_dna(dna, target), 1,
+                int(200 * scale), seed))
+
+    return results
+
+
+def bench_minimal_art(img, size, seed, scale):
+    import genetics
+    from target import Target
+
+    target = Target(img)
+    seed_all(seed)
+    image = genetics.random_image(img.width, img.height, 50)
+    case = {"project": "minimal-art-evolution", "size": size,
+            "function": "evaluate_image"}
+    return [measure(case, lambda: genetics.evaluate_image(image, target), 1,
+                    int(200 * scale), seed)]
+
+
+def bench_triangle_mesh(img, size, seed, scale):
+    import evolution
+    import mesh as meshtools
+    from target import Target
+
+    target = Target(img)
+    seed_all(seed)
+    mesh = meshtools.make_mesh(img.width, img.height, 6, 8)
+    vertices, colors = mesh
+    mutable = sum(v["mutable"] for row in vertices for v in row)
+    wiggles = 2
+
+    case = {"project": "triangle-mesh", "size": size,
+            "function": "wiggle_mesh"}
+    return [measure(
+        case, lambda: evolution.wiggle_mesh(mesh, target, wiggles, 0.4),
+        1 + (len(colors) + mutable) * wiggles, int(3 * scale), seed)]
+
+
+def bench_ascii_art(img, size, seed, scale):
+    import artist
+
+    w, h = img.size
+    chars, lines = w // artist.CHARWIDTH, h // artist.LINEHEIGHT
+    letter_pool = r" .:,-/()%#@"
+    color_pool = [(0, 0, 0), (128, 128, 128)]
+    art = {"dimensions": (w, h, lines, chars), "background": (255, 255, 255),
+           "letters": [letter_pool[0] for _ in range(chars*lines)],
+           "letter_pool": letter_pool, "color_pool": color_pool,
+           "colors": [color_pool[0] for _ in range(chars*lines)]}
+
+    case = {"project": "ASCII-art", "size": size,
+            "function": "optimize_letter"}
+    return [measure(
+        case, lambda: artist.optimize_letter(art, img, lines // 2, chars // 2),
+        1 + len(letter_pool) * len(color_pool), int(10 * scale), seed)]
+
+
+def bench_gradual_coloring(img, size, seed, scale):
+    from artist import artist
+
+    steps, tries = 100, 10
+    painter = artist(steps, tries)
+    case = {"project": "gradual-coloring", "size": size, "function": "paint"}
+    return [measure(case, lambda: painter.paint(img, seed=seed),
+                    steps * tries, int(3 * scale), seed)]
+
+
+def bench_gravity_swarm(img, size, seed, scale):
+    import core.swarm as swarm
+
+    w, h = img.size
+    canvas = np.zeros(shape=(h, w, 3))
+    influences = [{"kind": "grav", "x": w // 3, "y": h // 3, "wx": 15,
+                   "wy": 15},
+                  {"kind": "vec", "x": w // 2, "y": h, "wx": 5, "wy": -5}]
+    swarm_data = {"steps": 1000, "step_len": 2}
+
+    case = {"project": "gravity-swarm", "size": size,
+            "function": "simulate_zergling"}
+    return [measure(
+        case, lambda: swarm.simulate_zergling(w // 2, h // 2, 0.2, 0.1, canvas,
+                                              influences, swarm_data),
+        swarm_data["steps"], int(10 * scale), seed)]
+
+
+def bench_ml_rebuild(img, size, seed, scale):
+    case = {"project": "ML-rebuild", "size": size, "function": "rebuild"}
+    try:
+        from rebuilder import rebuilder
+    except ImportError as error:
+        return [dict(case, skipped=str(error))]
+
+    w, h = img.size
+    seed_all(seed)
+    where = [[random.randrange(w), random.randrange(h)] for _ in range(200)]
+    what = [img.getpixel((x, y))[0] for x, y in where]
+    model = rebuilder()
+    model.set_type("knn", {})
+    model.inform({"where": where, "what": what}, img.size)
+    return [measure(case, model.rebuild, w * h, int(3 * scale), seed)]
+
+
+BENCHMARKS = {
+    "shape-genetics": bench_shape_genetics,
+    "minimal-art-evolution": bench_minimal_art,
+    "triangle-mesh": bench_triangle_mesh,
+    "ASCII-art": bench_ascii_art,
+    "gradual-coloring": bench_gradual_coloring,
+    "gravity-swarm": bench_gravity_swarm,
+    "ML-rebuild": bench_ml_rebuild,
+}
+
+
+def run_project(project, sizes, seed, scale):
+    """ Runs the benchmarks of a project in this process. """
+    path = os.path.join(ROOT, PROJECTS[project])
+    sys.path.insert(0, path)
+    os.chdir(path)
+
+    results = []
+    for size in sizes:
+        img = synthetic_image(*SIZES[size])
+        results += BENCHMARKS[project](img, size, seed, scale)
+    return results
+
+
+# =============================================================================
+# Running and comparing
+
+
+def run_all(projects, sizes, seed, scale):
+    """ Runs the benchmarks of every project in a separate process. """
+    results = []
+    for project in projects:
+        command = [sys.executable, os.path.abspath(__file__),
+                   "--child", project, "--seed", str(seed),
+                   "--scale", str(scale), "--sizes", *sizes]
+        done = subprocess.run(command, capture_output=True, text=True)
+        if done.returncode != 0:
+            error = done.stderr.strip().splitlines()[-1:]
+            results.append({"project": project, "failed": " ".join(error)})
+            continue
+        results += json.loads(done.stdout)
+    return results
+
+
+def case_name(result):
+    keys = ("project", "function", "kind", "size")
+    return " ".join(str(result[k]) for k in keys if k in result)
+
+
+def compare(results, baseline, tolerance):
+    """ Prints the change of throughput against the [baseline] results and
+    returns the names of cases that got slower by more than [tolerance]. """
+    old = {case_name(r): r for r in baseline["results"]
+           if "evals_per_second" in r}
+    slower = []
+    for result in results:
+        name = case_name(result)
+        if name not in old or "evals_per_second" not in result:
+            continue
+        ratio = result["evals_per_second"] / old[name]["evals_per_second"]
+        print(f"{name:60} {ratio:6.2f}x")
+        if ratio < 1 - tolerance:
+            slower.append(name)
+    return slower
+
+
+def report(results):
+    for result in results:
+        name = case_name(result)
+        if "evals_per_second" in result:
+            print(f"{name:60} {result['evals_per_second']:12.1f} eval/s "
+                  f"{result['seconds_per_step']*1000:10.3f} ms/step "
+                  f"{result['peak_memory']/2**20:8.2f} MiB")
+        elif "skipped" in result:
+            print(f"{name:60} skipped: {result['skipped']}")
+        else:
+            print(f"{name:60} failed: {result['failed']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the generators.")
+    parser.add_argument("--projects", nargs="+", default=list(PROJECTS),
+                        choices=list(PROJECTS))
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"],
+                        choices=list(SIZES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="factor for the number of steps of every case")
+    parser.add_argument("--out", help="json file for the results")
+    parser.add_argument("--compare", help="json file of earlier results")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        results = run_project(args.child, args.sizes, args.seed, args.scale)
+        print(json.dumps(results))
+        return
+
+    results = run_all(args.projects, args.sizes, args.seed, args.scale)
+    report(results)
+
+    if args.out:
+        data = {"python": platform.python_version(),
+                "numpy": np.__version__, "pillow": PIL.__version__,
+                "machine": platform.machine(), "seed": args.seed,
+                "scale": args.scale, "results": results}
+        with open(args.out, "w") as jfile:
+            jfile.write(json.dumps(data, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r") as jfile:
+            baseline = json.loads(jfile.read())
+        slower = compare(results, baseline, args.tolerance)
+        if slower:
+            print(f"{len(slower)} cases are slower than the baseline.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,3 @@
-from numpy.random import randint
 import numpy as np
 import PIL
 
@@ -14,7 +13,10 @@ class artist:
         self.max_tries = max_tries
         return
 
-    def paint(self, ideal_picture):
+    def paint(self, ideal_picture, seed=None):
+        """ Paints the picture with rectangles. A [seed] (an int or a numpy
+        Generator) makes the painting reproducible. """
+        self.rng = np.random.default_rng(seed)
 
         max_x, max_y = ideal_picture.size
 
@@ -52,9 +54,9 @@ class artist:
         return gen
 
     def generate_option(self, step, max_x, max_y):
-        dx = 1 + randint(0, high=50)
-        dy = 1 + randint(0, high=50)
-        x1, y1 = randint(0, high=max_x-dx), randint(0, high=max_y-dy)
+        dx = 1 + self.rng.integers(0, 50)
+        dy = 1 + self.rng.integers(0, 50)
+        x1, y1 = self.rng.integers(0, max_x-dx), self.rng.integers(0, max_y-dy)
         return ((x1, y1), (x1 + dx, y1 + dy))
 
     def option_evaluator(self, raw_pic, raw_can):
@@ -1,7 +1,6 @@
 from PIL import Image
 from artist import artist
 from lineartist import lineartist
-import random
 
 
 class canvas:
@@ -16,8 +15,8 @@ class canvas:
         self.ideal_picture = Image.open(picture_path)
         return
 
-    def paint(self):
-        self.drawn_picture = self.artist.paint(self.ideal_picture)
+    def paint(self, seed=None):
+        self.drawn_picture = self.artist.paint(self.ideal_picture, seed)
         return
 
     def show(self):
@@ -1,4 +1,3 @@
-from numpy.random import randint
 import numpy
 import PIL
 
@@ -14,7 +13,10 @@ class lineartist:
         self.max_tries = max_tries
         return
 
-    def paint(self, ideal_picture):
+    def paint(self, ideal_picture, seed=None):
+        """ Paints the picture with curves. A [seed] (an int or a numpy
+        Generator) makes the painting reproducible. """
+        self.rng = numpy.random.default_rng(seed)
 
         max_x, max_y = ideal_picture.size
 
@@ -68,14 +70,15 @@ class lineartist:
         return gen
 
     def generate_option(self, max_x, max_y):
-        degree = randint(1, 4)
-        initial = numpy.random.uniform(0, max_y)
-        linear = numpy.random.uniform(-5, 5)
-        offset = numpy.random.uniform(0, max_x)
+        degree = self.rng.integers(1, 4)
+        initial = self.rng.uniform(0, max_y)
+        linear = self.rng.uniform(-5, 5)
+        offset = self.rng.uniform(0, max_x)
         poly = [initial] + [linear] + \
-            [numpy.random.uniform(-0.001, 0.001) for _ in range(degree - 1)]
-        length = randint(0, max_x // (1 + 3*(self.step / self.max_steps)))
-        start = randint(0, max_x - length)
+            [self.rng.uniform(-0.001, 0.001) for _ in range(degree - 1)]
+        max_length = int(max_x // (1 + 3*(self.step / self.max_steps)))
+        length = self.rng.integers(0, max_length)
+        start = self.rng.integers(0, max_x - length)
         option = {"max_coords": (max_x, max_y), "poly": poly,
                   "offset": offset, "xrange": (start, start + length)}
         return option
@@ -1,45 +1,51 @@
-import random
 import numpy
 
+# All generators draw from the numpy Generator [rng], or from a fresh one. Pass
+# the same Generator (or an int seed) to get reproducible influences.
 
-def random_coords(width, height):
-    return (random.randint(0, width-1), random.randint(0, height-1))
 
+def random_coords(width, height, rng=None):
+    rng = numpy.random.default_rng(rng)
+    return (int(rng.integers(0, width)), int(rng.integers(0, height)))
 
-def random_grav(width, height, kind, approx_pow):
-    x, y = random_coords(width, height)
+
+def random_grav(width, height, kind, approx_pow, rng=None):
+    rng = numpy.random.default_rng(rng)
+    x, y = random_coords(width, height, rng)
 
     if kind == "sym":
-        px = random.normalvariate(approx_pow, 0.1*approx_pow)
-        py = random.normalvariate(approx_pow, 0.1*approx_pow)
+        px = float(rng.normal(approx_pow, 0.1*approx_pow))
+        py = float(rng.normal(approx_pow, 0.1*approx_pow))
     elif kind == "asym":
-        diry = 2 * random.randint(0, 1)
-        px = random.normalvariate(approx_pow, 0.2*approx_pow)
-        py = random.normalvariate(approx_pow, 0.2*approx_pow) * (1-diry)
+        diry = 2 * int(rng.integers(0, 2))
+        px = float(rng.normal(approx_pow, 0.2*approx_pow))
+        py = float(rng.normal(approx_pow, 0.2*approx_pow)) * (1-diry)
     else:
-        px = random.normalvariate(0, approx_pow)
-        py = random.normalvariate(0, approx_pow)
+        px = float(rng.normal(0, approx_pow))
+        py = float(rng.normal(0, approx_pow))
 
     return {"kind": "grav", "x": x, "y": y, "wx": px, "wy": py}
 
 
-def random_vec(width, height, approx_pow):
-    x, y = random_coords(width, height)
+def random_vec(width, height, approx_pow, rng=None):
+    rng = numpy.random.default_rng(rng)
+    x, y = random_coords(width, height, rng)
 
-    dirc = random.random() * 2 * numpy.pi
-    r = random.normalvariate(approx_pow, 0.3*approx_pow)
-    px = numpy.sin(dirc)*r
-    py = numpy.cos(dirc)*r
+    dirc = rng.random() * 2 * numpy.pi
+    r = rng.normal(approx_pow, 0.3*approx_pow)
+    px = float(numpy.sin(dirc)*r)
+    py = float(numpy.cos(dirc)*r)
 
     return {"kind": "vec", "x": x, "y": y, "wx": px, "wy": py}
 
 
-def random_wind(approx_pow):
+def random_wind(approx_pow, rng=None):
+    rng = numpy.random.default_rng(rng)
     x, y = 0, 0
-    dirc = random.random() * 2 * numpy.pi
-    r = random.normalvariate(approx_pow, 0.1*approx_pow)
-    px = numpy.sin(dirc)*r
-    py = numpy.cos(dirc)*r
+    dirc = rng.random() * 2 * numpy.pi
+    r = rng.normal(approx_pow, 0.1*approx_pow)
+    px = float(numpy.sin(dirc)*r)
+    py = float(numpy.cos(dirc)*r)
 
     wind = {"kind": "wind", "x": x, "y": y,
             "wx": px, "wy": py, "resistance": 0.01}
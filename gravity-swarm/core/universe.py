@@ -1,12 +1,13 @@
 import numpy
-import random
 import core.swarm as swarm
 from PIL import Image
 
 
 class universe:
 
-    def __init__(self):
+    def __init__(self, seed=None):
+        # a seed (an int or a numpy Generator) makes random swarms reproducible
+        self.rng = numpy.random.default_rng(seed)
         self.canvas = None
         self.width = 0
         self.height = 0
@@ -33,9 +34,9 @@ class universe:
 
     def draw_random_swarm(self, n):
         for _ in range(n):
-            x = random.randint(0, self.width)
-            y = random.randint(0, self.height)
-            v_x, v_y = (2*random.random() - 1, 2*random.random() - 1)
+            x = int(self.rng.integers(0, self.width + 1))
+            y = int(self.rng.integers(0, self.height + 1))
+            v_x, v_y = (2*self.rng.random() - 1, 2*self.rng.random() - 1)
             swarm.simulate_zergling(
                 x, y, v_x, v_y, self.canvas, self.influences, self.swarm_data)
         self.log_drawing({"kind": "random", "n": n})
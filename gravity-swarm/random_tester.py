@@ -13,11 +13,11 @@ print("Ok!")
 print("========= Setting Influences =========")
 
 for i in range(3):
-    inf = random_grav(width, height, "rand", 10)
+    inf = random_grav(width, height, "rand", 10, test_universe.rng)
     test_universe.add_influence(inf)
 
 for i in range(3):
-    inf = random_vec(width, height, 5)
+    inf = random_vec(width, height, 5, test_universe.rng)
     test_universe.add_influence(inf)
 
 #test_universe.add_influence(random_wind(0.001))
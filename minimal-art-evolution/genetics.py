@@ -1,22 +1,27 @@
+import math
 import random
+import snapshots
+import stopping
+import streams
 import time
-from random import randint
+import numpy as np
+from shapes import SHAPES, Shape
+from target import METRICS, Target, as_target, target_from_specs
 from typing import List, Tuple
-from PIL import Image, ImageDraw, ImageChops, ImageStat
+from PIL import Image, ImageDraw
 
 # Type definitions
 tyPosition = Tuple[int, int]
 
 tyColor = Tuple[int, int, int, int]
-tyShape = dict
-tyElement = Tuple[str, tyShape, tyColor]
+tyElement = Tuple[Shape, tyColor]
 tyImage = Tuple[tyColor, List[tyElement]]
 
 tyQuality = float
 tyPop = List[Tuple[tyQuality, tyImage]]
 
 # Constants
-VALID_SHAPES = ["circle", "rectangle", "line"]
+VALID_SHAPES = ["circle", "rectangle", "line"]  # default kinds, see SHAPES
 WIGGLE_MOVE_F = 0.1
 WIGGLE_SHAPE_F = 0.2
 
@@ -25,100 +30,63 @@ WIGGLE_SHAPE_F = 0.2
 # Generate Random Shape
 
 
-def random_color(has_alpha)->tyColor:
-    alpha = randint(0, 256) if has_alpha else 256
-    return (randint(0, 256), randint(0, 256), randint(0, 256), alpha)
+def random_color(has_alpha, rng=random)->tyColor:
+    alpha = rng.randint(0, 256) if has_alpha else 256
+    return (rng.randint(0, 256), rng.randint(0, 256), rng.randint(0, 256),
+            alpha)
 
 
-def random_shape(width: int, height: int, kind: str, **specs)-> tyShape:
-    if kind == "circle":
-        point = randint(0, width), randint(0, height)
-        r = specs.get("approx_r", randint(5, 100)) * (2 * random.random())
-        return {"p": point, "r": r}
-
-    elif kind == "rectangle":
-        point = randint(0, width), randint(0, height)
-        width = specs.get("approx_w", randint(5, 100)) * (2 * random.random())
-        height = specs.get("approx_h", randint(5, 100)) * (2 * random.random())
-        return {"p": point, "w": width, "h": height}
-
-    elif kind == "line":
-        point1 = randint(0, width), randint(0, height)
-        point2 = randint(0, width), randint(0, height)
-        width = specs.get("approx_line_w", randint(1, 5))
-        return {"p1": point1, "p2": point2, "w": width}
-
-    else:
+def random_shape(width: int, height: int, kind: str, rng=random,
+                 **specs)-> Shape:
+    if kind not in SHAPES:
         raise Exception(f"Unknown shape kind `{kind}`")
+    return SHAPES[kind].random(width, height, rng, **specs)
 
 
-def random_element(width: int, height: int, specs={})-> tyElement:
-    kind = random.choice(specs.get("kinds", VALID_SHAPES))
-    shape = random_shape(width, height, kind, **specs)
-    color = random_color(specs.get("has_alpha", False))
-    return (kind, shape, color)
+def random_element(width: int, height: int, specs={},
+                   rng=random)-> tyElement:
+    kind = rng.choice(specs.get("kinds", VALID_SHAPES))
+    shape = random_shape(width, height, kind, rng=rng, **specs)
+    color = random_color(specs.get("has_alpha", False), rng)
+    return (shape, color)
 
 
-def random_image(width: int, height: int, n_els: int, specs={})-> tyImage:
-    background = random_color(has_alpha=False)
-    elements = [random_element(width, height, specs) for _ in range(n_els)]
+def random_image(width: int, height: int, n_els: int, specs={},
+                 rng=random)-> tyImage:
+    background = random_color(has_alpha=False, rng=rng)
+    elements = [random_element(width, height, specs, rng)
+                for _ in range(n_els)]
     return (background, elements)
 
 # =============================================================================
 # Specialisations
 
 
-def wiggle_point(move, x, y):
-    xx = round(random.gauss(x, move))
-    yy = round(random.gauss(y, move))
-    return (xx, yy)
-
-
-def wiggle(width, height, element: tyElement, intensity: float)-> tyElement:
+def wiggle(width, height, element: tyElement, intensity: float,
+           rng=random)-> tyElement:
     """Returns a new element with a slightly altered shape."""
-    kind, shape, color = element
+    shape, color = element
     size = max(width, height)
     move = (size * WIGGLE_MOVE_F) * intensity
-    f = WIGGLE_SHAPE_F
-
-    if kind == "circle":
-        p = wiggle_point(move, *shape["p"])
-        r = abs(random.gauss(shape["r"], shape["r"]*f*intensity))
-        new_shape = {"p": p, "r": r}
+    return (shape.wiggle(move, WIGGLE_SHAPE_F * intensity, rng), color)
 
-    elif kind == "rectangle":
-        p = wiggle_point(move, *shape["p"])
-        w = abs(random.gauss(shape["w"], shape["w"]*f*intensity))
-        h = abs(random.gauss(shape["h"], shape["h"]*f*intensity))
-        new_shape = {"p": p, "w": w, "h": h}
 
-    elif kind == "line":
-        p1 = wiggle_point(move, *shape["p1"])
-        p2 = wiggle_point(move, *shape["p2"])
-        w = abs(round(random.gauss(shape["w"], shape["w"]*f*intensity)))
-        new_shape = {"p1": p1, "p2": p2, "w": w}
+def adjust_colors(r, g, b, a, d, has_alpha=False, rng=random):
 
-    else:
-        raise Exception(f"Unknown shape kind `{kind}`")
-
-    return (kind, new_shape, color)
-
-
-def adjust_colors(r, g, b, a, d, has_alpha=False):
-
-    m_r = max(0, min(255, round(random.gauss(r, d))))
-    m_g = max(0, min(255, round(random.gauss(g, d))))
-    m_b = max(0, min(255, round(random.gauss(b, d))))
-    m_a = max(0, min(255, round(random.gauss(a, d)))) if has_alpha else a
+    m_r = max(0, min(255, round(rng.gauss(r, d))))
+    m_g = max(0, min(255, round(rng.gauss(g, d))))
+    m_b = max(0, min(255, round(rng.gauss(b, d))))
+    m_a = max(0, min(255, round(rng.gauss(a, d)))) if has_alpha else a
 
     return (m_r, m_g, m_b, m_a)
 
 
-def recolor(element: tyElement, intensity: float, has_alpha=False)-> tyElement:
-    kind, shape, color = element
+def recolor(element: tyElement, intensity: float, has_alpha=False,
+            rng=random)-> tyElement:
+    shape, color = element
     d = (256 * intensity)**0.5
 
-    return kind, shape, adjust_colors(*color, d, has_alpha)
+    return shape, adjust_colors(*color, d, has_alpha, rng)
 
 
 # =============================================================================
@@ -126,21 +94,8 @@ def recolor(element: tyElement, intensity: float, has_alpha=False)-> tyElement:
 
 def draw_element(draw: ImageDraw, element: tyElement):
     """ Draws the element onto the image. """
-    kind, shape, color = element
-
-    if kind == "circle":
-        x, y = shape["p"]
-        r = shape["r"]
-        draw.ellipse([x-r, y-r, x+r, y+r], fill=color)
-
-    elif kind == "rectangle":
-        x, y = shape["p"]
-        dx, dy = shape["w"]/2, shape["h"]/2
-        draw.rectangle([x-dx, y-dy, x+dx, y+dy], fill=color)
-
-    if kind == "line":
-        draw.line([shape["p1"], shape["p2"]], width=shape["w"], fill=color)
-    return
+    shape, color = element
+    shape.draw(draw, color)
 
 
 def draw_image(width: int, height: int, image: tyImage)-> Image:
@@ -154,120 +109,382 @@ def draw_image(width: int, height: int, image: tyImage)-> Image:
     return canvas
 
 
-def evaluate_image(image: tyImage, real_image: Image)-> float:
+def evaluate_image(image: tyImage, real_image: Target)-> float:
     """Calculates the difference between the image and the drawing."""
+    real_image = as_target(real_image)
     drawn_image = draw_image(real_image.width, real_image.height, image)
 
-    diff_img = ImageChops.difference(drawn_image, real_image)
+    diff = real_image.score(drawn_image)
 
-    stats = ImageStat.Stat(diff_img)
+    return diff / (real_image.width * real_image.height) / 4
+
+# =============================================================================
+# Incremental Scoring
+
+
+def element_box(width: int, height: int, element: tyElement):
+    """ Returns a box (left, top, right, bottom) containing every pixel the
+    element can paint, clipped to the canvas, or None if it is off canvas. """
+    box = element[0].box()
+    l, t = max(0, math.floor(box[0])-1), max(0, math.floor(box[1])-1)
+    r = min(width, math.ceil(box[2])+2)
+    b = min(height, math.ceil(box[3])+2)
+    return (l, t, r, b) if l < r and t < b else None
+
+
+def overlap(box1, box2)-> bool:
+    return (box1 is not None and box2 is not None and box1[0] < box2[2] and
+            box2[0] < box1[2] and box1[1] < box2[3] and box2[1] < box1[3])
+
+
+class Painting:
+    """ The drawing of an image together with its score, kept so that a change
+    of one element only redraws and rescores the union of its old and new
+    boxes. Background changes are scored from the mask of pixels that no
+    element covers. Changes are tried with [try_element] or [try_background]
+    and kept with [accept]. Metrics that are not local are scored on the
+    whole drawing. The element list is shared with the image the painting
+    was made from, or returned by [image], and only copied when a change is
+    accepted, so trying a change never copies it. """
+
+    def __init__(self, image: tyImage, real_image: Target):
+        self.target = as_target(real_image)
+        self.w, self.h = self.target.width, self.target.height
+        self.bg, self.els = image[0], image[1]
+        self.shared = True  # whether [els] is also the list of an image
+        self.boxes = [element_box(self.w, self.h, el) for el in self.els]
+        self.canvas = draw_image(self.w, self.h, image)
+        self.scratch = Image.new("RGB", (self.w, self.h))
+        self.mask = Image.new("L", (self.w, self.h))
+        self.error = self.target.score(self.canvas)
+        self.uncovered = None  # mask and target pixels showing the background
+
+    def fit(self, error=None)-> float:
+        """ The score of the painting (or of an [error]), as [evaluate_image]
+        returns it. """
+        error = self.error if error is None else error
+        return error / (self.w * self.h) / 4
+
+    def image(self)-> tyImage:
+        self.shared = True
+        return self.bg, self.els
+
+    def redraw(self, bg, box, j=None, element=None, el_box=None, stop=None):
+        """ Returns the part of the drawing in [box] with the background [bg],
+        element [j] replaced by [element] (with box [el_box]) and only the
+        elements before [stop]. """
+        l, t, r, b = box
+        self.scratch.paste(Image.new("RGB", (r-l, b-t), bg), box)
+        draw = ImageDraw.Draw(self.scratch, "RGBA")
+        els, boxes = self.els, self.boxes
+        for k in range(len(els) if stop is None else stop):
+            if k == j:
+                if overlap(el_box, box):
+                    draw_element(draw, element)
+            elif overlap(boxes[k], box):
+                draw_element(draw, els[k])
+        return self.scratch.crop(box)
+
+    def try_element(self, j: int, element: tyElement):
+        """ Returns the score of the painting with element [j] replaced by
+        [element], and the change to pass to [accept]. """
+        new_box = element_box(self.w, self.h, element)
+        old_box = self.boxes[j]
+        if not self.target.local:
+            box = (0, 0, self.w, self.h)
+        elif old_box is None and new_box is None:
+            return self.fit(), (self.bg, j, element, new_box, None, None,
+                                self.error)
+        else:
+            boxes = [bx for bx in (old_box, new_box) if bx is not None]
+            box = (min(bx[0] for bx in boxes), min(bx[1] for bx in boxes),
+                   max(bx[2] for bx in boxes), max(bx[3] for bx in boxes))
+
+        patch = self.redraw(self.bg, box, j, element, new_box)
+        if self.target.local:
+            old_err = self.target.score(self.canvas.crop(box), box)
+            error = self.error - old_err + self.target.score(patch, box)
+        else:
+            error = self.target.score(patch)
+        return self.fit(error), (self.bg, j, element, new_box, box, patch,
+                                 error)
+
+    def background_mask(self):
+        """ Returns the mask (an image) of the pixels that show the background,
+        and the target pixels and weights under it, or None if elements are
+        transparent so that the background shows through them. """
+        if self.uncovered is None:
+            if any(color[3] < 255 for _, color in self.els):
+                return None
+            mask = Image.new("L", (self.w, self.h), 255)
+            draw = ImageDraw.Draw(mask)
+            for shape, _ in self.els:
+                shape.draw(draw, 0)
+            chosen = np.asarray(mask) > 0
+            weights = self.target.weights
+            if weights is not None:
+                weights = weights[chosen][:, None]
+            self.uncovered = (mask, self.target.pixels[chosen][:, None],
+                              weights)
+        return self.uncovered
+
+    def try_background(self, bg: tyColor):
+        """ Returns the score of the painting with the background [bg], and the
+        change to pass to [accept]. """
+        uncovered = None
+        if self.target.local:
+            uncovered = self.background_mask()
+        if uncovered is None:
+            box = (0, 0, self.w, self.h)
+            patch = self.redraw(bg, box)
+            error = self.target.score(patch)
+            return self.fit(error), (bg, None, None, None, box, patch, error)
+
+        mask, pixels, weights = uncovered
+        metric, _ = METRICS[self.target.metric]
+        old_err = metric(pixels, np.array(self.bg[:3], dtype=np.int16),
+                         weights)
+        new_err = metric(pixels, np.array(bg[:3], dtype=np.int16), weights)
+        error = self.error - old_err + new_err
+        return self.fit(error), (bg, None, None, None, None, mask, error)
+
+    def solve_element(self, j: int):
+        """ Returns element [j] in the color that minimises the squared error
+        of its visible pixels, given what is drawn under it, or None if none
+        of its pixels are visible. The alpha of the element is kept. """
+        shape, color = self.els[j]
+        box, alpha = self.boxes[j], min(255, color[3])
+        if box is None or alpha <= 0:
+            return None
+
+        # pixels of the element that no later element covers
+        l, t, r, b = box
+        visible = shape.rasterize(self.mask, box)
+        for k in range(j+1, len(self.els)):
+            if overlap(self.boxes[k], box) and visible.any():
+                visible &= ~self.els[k][0].rasterize(self.mask, box)
+        if not visible.any():
+            return None
+
+        wanted = self.target.pixels[t:b, l:r][visible].astype(np.float64)
+        if alpha < 255:
+            # drawn = (under * (255 - alpha) + fill * alpha) / 255
+            under = np.asarray(self.redraw(self.bg, box, stop=j), np.float64)
+            wanted = (wanted * 255 - under[visible] * (255 - alpha)) / alpha
+        weights = self.target.weights
+        if weights is not None:
+            weights = weights[t:b, l:r][visible]
+            if weights.sum() <= 0:
+                return None
+        fill = np.average(wanted, axis=0, weights=weights)
+        fill = np.clip(np.round(fill), 0, 255).astype(int)
+        return shape, (*fill.tolist(), color[3])
+
+    def solve_background(self):
+        """ Returns the background color that minimises the squared error of
+        the pixels showing it, or None if there are none or elements are
+        transparent. """
+        uncovered = self.background_mask() if self.target.local else None
+        if uncovered is None or len(uncovered[1]) == 0:
+            return None
+        _, pixels, weights = uncovered
+        if weights is not None and weights.sum() <= 0:
+            return None
+        fill = np.average(pixels[:, 0], axis=0,
+                          weights=None if weights is None else weights[:, 0])
+        fill = np.clip(np.round(fill), 0, 255).astype(int)
+        return (*fill.tolist(), self.bg[3])
+
+    def accept(self, change):
+        """ Applies a change returned by [try_element] or [try_background]. """
+        bg, j, element, new_box, box, patch, error = change
+        if j is not None:
+            if self.shared:  # copy on write
+                self.els, self.shared = list(self.els), False
+            self.els[j], self.boxes[j] = element, new_box
+            self.uncovered = None
+        if patch is not None and box is not None:
+            self.canvas.paste(patch, box)
+        elif patch is not None:  # mask of a background change
+            self.canvas.paste(Image.new("RGB", (self.w, self.h), bg),
+                              mask=patch)
+        self.bg, self.error = bg, error
 
-    return sum(stats.mean)/4
 
 # =============================================================================
 # TEMPORARY TESTING STUFF
 
 
-def seed_population(n_els: int, n_images: int, real_image, rand_specs)-> tyPop:
+def seed_population(n_els: int, n_images: int, real_image, rand_specs,
+                    rng=random, pool=None)-> tyPop:
+    """ Returns [n_images] random images and their fits. The images are scored
+    in the processes of [pool] if it is given (see parallel.py). """
     w, h = real_image.width, real_image.height
 
-    images = [
-        random_image(w, h, n_els, specs=rand_specs) for _ in range(n_images)]
-    pop = [(evaluate_image(img, real_image), img) for img in images]
+    images = [random_image(w, h, n_els, specs=rand_specs, rng=rng)
+              for _ in range(n_images)]
+    if pool is None:
+        evals = [evaluate_image(img, real_image) for img in images]
+    else:
+        evals = pool.evaluate(images)
+    pop = list(zip(evals, images))
 
     return pop
 
 
-def mutate_image(width: int, height: int, image: tyImage, specs={})-> tyImage:
-    mutation = random.choice(["reshuffle", "replace"])
+def improve_image(image: tyImage, real_image: Target, intensity: float,
+                  rng=random, solve_colors=False)-> Tuple[float, tyImage]:
+    """ Improves the colors and shapes of [image] one element at a time and
+    returns its fit and the improved image. See [evolve_image] for
+    [solve_colors]. """
+    w, h = real_image.width, real_image.height
+    painting = Painting(image, real_image)
+
+    if solve_colors:
+        new_bg = painting.solve_background()
+        if new_bg is not None:
+            new_fit, change = painting.try_background(new_bg)
+            if new_fit < painting.fit():
+                painting.accept(change)
+
+        for j in range(len(painting.els)):
+            solved = painting.solve_element(j)
+            if solved is not None:
+                new_fit, change = painting.try_element(j, solved)
+                if new_fit < painting.fit():
+                    painting.accept(change)
+    else:
+        for _ in range(10):
+            new_bg = adjust_colors(*painting.bg, (256 * intensity)**0.5,
+                                   rng=rng)
+            new_fit, change = painting.try_background(new_bg)
+            if new_fit < painting.fit():
+                painting.accept(change)
+
+        for j in range(len(painting.els)):
+            for _ in range(10):
+                recolored = recolor(painting.els[j], intensity, rng=rng)
+                new_fit, change = painting.try_element(j, recolored)
+                if new_fit < painting.fit():
+                    painting.accept(change)
+
+    for j in range(len(painting.els)):
+        for _ in range(10):
+            wiggled = wiggle(w, h, painting.els[j], intensity, rng)
+            new_fit, change = painting.try_element(j, wiggled)
+            if new_fit < painting.fit():
+                painting.accept(change)
+
+    return painting.fit(), painting.image()
+
+
+def mutate_image(width: int, height: int, image: tyImage, specs={},
+                 rng=random)-> tyImage:
+    mutation = rng.choice(["reshuffle", "replace"])
     bg, els = image
     new_els = els.copy()
 
     if mutation == "reshuffle":
-        i, j = randint(0, len(els)-1), randint(0, len(els)-1)
+        i, j = rng.randint(0, len(els)-1), rng.randint(0, len(els)-1)
         new_els[i], new_els[j] = new_els[j], new_els[i]
 
     elif mutation == "replace":
-        i = randint(0, len(els)-1)
-        new_els[i] = random_element(width, height, specs=specs)
+        i = rng.randint(0, len(els)-1)
+        new_els[i] = random_element(width, height, specs=specs, rng=rng)
 
     return bg, new_els
 
 
-def evolve_image(n_els: int, pop_size: int, steps: int, exploration_step: int,  in_path: str, out_name: str, save_on=100, save_final=False):
+def evolve_image(n_els: int, pop_size: int, steps: int, exploration_step: int,  in_path: str, out_name: str, save_on=100, save_final=False, metric_specs={}, steps_dir=".", steps_queue=4, seed=None, solve_colors=False, workers=None, kinds=None, stop_specs={}):
+    """ Evolves a population of images. The [metric] and [metric_weights]
+    entries of [metric_specs] choose how images are scored (see target.py).
+    Every [save_on] steps the best image is drawn and saved to [steps_dir] in
+    the background, with at most [steps_queue] images waiting (see
+    snapshots.py). A [seed] (an int or a numpy Generator) makes the evolution
+    reproducible. Every place in the population improves its member with its
+    own random stream, the exploration has another one (see
+    streams.py). With [solve_colors], the background and element colors are
+    solved for directly (see [Painting.solve_element]) instead of guessed by
+    random recoloring. If [workers] is set, the members of the population are
+    improved and scored in that many processes (see parallel.py), which gives
+    the same result as improving them one after another. The elements are
+    shapes of the [kinds] (names in shapes.SHAPES), by default rectangles,
+    circles and lines. The [stop_seconds], [stop_score] (a fit),
+    [stop_window] and [stop_epsilon] entries of [stop_specs] can end the
+    evolution before [steps] (see stopping.py), the best image is then saved
+    at the step where it stopped. """
 
     rand_specs = {
-        "kinds": ["rectangle", "circle", "line"],
+        "kinds": kinds or ["rectangle", "circle", "line"],
         "approx_r": 30,
         "approx_h": 30,
         "approx_w": 30,
         "approx_line_w": 5,
     }
 
-    real_image = Image.open(in_path)
+    real_image = target_from_specs(Image.open(in_path), metric_specs)
     w, h = real_image.width, real_image.height
 
-    pop = seed_population(n_els, pop_size, real_image, rand_specs)
-
-    t = time.time()
-    for i in range(steps+1):
-        intensity = (1.2 - (i / steps)) / 2
-
-        improved_pop = []
-        for fit, img in pop:
-            bg, els = img
-
-            for _ in range(10):
-                new_bg = adjust_colors(*bg, (256 * intensity)**0.5)
-                new_fit = evaluate_image((new_bg, els), real_image)
-                if new_fit < fit:
-                    fit = new_fit
-                    bg = new_bg
-
-            for j in range(len(els)):
-                for _ in range(10):
-                    recolored = els.copy()
-                    recolored[j] = recolor(els[j], intensity)
-
-                    new_fit = evaluate_image((bg, recolored), real_image)
-                    if new_fit < fit:
-                        fit = new_fit
-                        els = recolored
-
-            for j in range(len(els)):
-                for _ in range(10):
-                    wiggled = els.copy()
-                    wiggled[j] = wiggle(w, h, els[j], intensity)
-
-                    new_fit = evaluate_image((bg, wiggled), real_image)
-                    if new_fit < fit:
-                        fit = new_fit
-                        els = wiggled
-
-            improved_pop.append((fit, (bg, els)))
-
-        pop = improved_pop
-
-        if i % 10 == 0:
-            now = time.time()
-            dt, t = now-t, now
-            print(
-                f"{i}/{steps} ({round(i/steps*100)}%)  [best fit: {min(pop, key=lambda x: x[0])[0]:.4f}, worst fit: {max(pop, key=lambda x: x[0])[0]:.4f}, time: {dt:.3f}]")
-
-        if i % save_on == 0:
-            best = min(pop, key=lambda x: x[0])[1]
-            canvas = draw_image(w, h, best)
-            canvas.save("z"+str(i)+out_name)
-
-        if i % exploration_step == 0:
-            pop.sort(key=lambda x: x[0])
-            good = pop[:len(pop)//2]
-            opts = [
-                mutate_image(w, h, image, specs=rand_specs)
-                for fit, image in good]
-            evals = [evaluate_image(img, real_image) for img in opts]
-            pop = good + list(zip(evals, opts))
-
+    main_seed, members_seed = streams.spawn(seed, 2)
+    rng = streams.python_random(main_seed)
+    member_rngs = [streams.python_random(member_seed)
+                   for member_seed in streams.spawn(members_seed, pop_size)]
+
+    writer = snapshots.SnapshotWriter(lambda image: draw_image(w, h, image),
+                                      steps_dir, steps_queue)
+    stopper = stopping.stopper_from_specs(stop_specs)
+    pool = None
+    if workers:
+        import parallel  # imports this module, so only loaded when needed
+        pool = parallel.ParallelPainter(real_image, workers)
+
+    try:
+        pop = seed_population(n_els, pop_size, real_image, rand_specs, rng,
+                              pool)
+
+        t = time.time()
+        for i in range(steps+1):
+            if stopper and stopper.check(i, min(pop, key=lambda x: x[0])[0]):
+                best = min(pop, key=lambda x: x[0])[1]
+                writer.submit("z"+str(i)+out_name, best)
+                print(f"stopped at {i}/{steps}: {stopper.reason}")
+                break
+            intensity = (1.2 - (i / steps)) / 2
+
+            if pool is None:
+                pop = [improve_image(img, real_image, intensity, member_rng,
+                                     solve_colors)
+                       for (fit, img), member_rng in zip(pop, member_rngs)]
+            else:
+                pop, member_rngs = pool.improve(pop, member_rngs, intensity,
+                                                solve_colors)
+
+            if i % 10 == 0:
+                now = time.time()
+                dt, t = now-t, now
+                print(
+                    f"{i}/{steps} ({round(i/steps*100)}%)  [best fit: {min(pop, key=lambda x: x[0])[0]:.4f}, worst fit: {max(pop, key=lambda x: x[0])[0]:.4f}, time: {dt:.3f}]")
+
+            if i % save_on == 0:
+                best = min(pop, key=lambda x: x[0])[1]
+                writer.submit("z"+str(i)+out_name, best)
+
+            if i % exploration_step == 0:
+                pop.sort(key=lambda x: x[0])
+                good = pop[:len(pop)//2]
+                opts = [
+                    mutate_image(w, h, image, specs=rand_specs, rng=rng)
+                    for fit, image in good]
+                if pool is None:
+                    evals = [evaluate_image(img, real_image) for img in opts]
+                else:
+                    evals = pool.evaluate(opts)
+                pop = good + list(zip(evals, opts))
+    finally:
+        if pool is not None:
+            pool.close()
+
+    writer.close()
     if save_final:
         for fit, img in pop:
             canvas = draw_image(w, h, img)
@@ -0,0 +1,82 @@
+import genetics
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from target import Target
+from PIL import Image
+
+# =============================================================================
+# Improvement of population members in a pool of processes. Members do not
+# depend on each other while they are improved, so each one is a task of its
+# own. The target image is placed in shared memory once and every worker
+# decodes it a single time, so a task only carries the image of the member and
+# its random stream. The stream is sent back with the result, which makes a
+# parallel evolution draw the same numbers as one run in a single process.
+
+# State of a worker process, set up once by [init_worker]
+WORKER = {}
+
+
+def init_worker(shm_name, shape, settings):
+    """ Attaches to the shared target image. The target is scored with the
+    metric [settings] of the main process. """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    pixels = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+
+    # the target keeps its own decoded copy, so the memory can be released
+    WORKER["img"] = Target(Image.fromarray(pixels, "RGB"), **settings)
+    del pixels
+    shm.close()
+
+
+def evaluate_task(image):
+    return genetics.evaluate_image(image, WORKER["img"])
+
+
+def improve_task(task):
+    image, rng, intensity, solve_colors = task
+    fit, image = genetics.improve_image(image, WORKER["img"], intensity, rng,
+                                        solve_colors)
+    return fit, image, rng
+
+
+class ParallelPainter:
+    """ Improves and scores images against [img] in [workers] processes. Use
+    as a context manager or [close] it when done. """
+
+    def __init__(self, img: Target, workers: int):
+        pixels = np.asarray(img.img, dtype=np.uint8)
+        self.shm = shared_memory.SharedMemory(create=True, size=pixels.nbytes)
+        shared = np.ndarray(pixels.shape, dtype=np.uint8, buffer=self.shm.buf)
+        shared[:] = pixels
+
+        self.workers = workers
+        init_args = (self.shm.name, pixels.shape, img.settings())
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=init_args)
+
+    def evaluate(self, images)-> list:
+        """ Returns the fits of [images], in the same order. """
+        return list(self.pool.map(evaluate_task, images))
+
+    def improve(self, pop, rngs, intensity: float, solve_colors=False):
+        """ Improves every member of [pop] with its random stream in [rngs]
+        (see [genetics.improve_image]). Returns the improved population and
+        the advanced streams. """
+        tasks = [(image, rng, intensity, solve_colors)
+                 for (fit, image), rng in zip(pop, rngs)]
+        results = list(self.pool.map(improve_task, tasks))
+        return ([(fit, image) for fit, image, _ in results],
+                [rng for _, _, rng in results])
+
+    def close(self):
+        self.pool.shutdown()
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
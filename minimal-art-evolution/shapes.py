@@ -0,0 +1,327 @@
+import math
+import random
+import numpy as np
+from PIL import Image, ImageDraw
+
+tyPoint = tuple  # (x, y)
+tyBox = tuple  # (left, top, right, bottom)
+
+# Number of points of the polygons that approximate ellipses and curves
+ELLIPSE_POINTS = 32
+BEZIER_POINTS = 16
+
+# =============================================================================
+# Shapes of the elements. A shape is a small record with __slots__, so it
+# holds just its numbers, and it is never changed after it is made: a wiggle
+# returns a new shape and the old one can be shared by any number of images.
+# Every kind knows its bounding box, how to wiggle and how to draw itself.
+
+
+def wiggle_point(move, x, y, rng=random)-> tyPoint:
+    xx = round(rng.gauss(x, move))
+    yy = round(rng.gauss(y, move))
+    return (xx, yy)
+
+
+def wiggle_size(size, f, rng=random):
+    """ Returns a size changed by about [f] times itself. """
+    return abs(rng.gauss(size, size*f))
+
+
+def random_point(width: int, height: int, rng=random)-> tyPoint:
+    return rng.randint(0, width), rng.randint(0, height)
+
+
+def rotate(points, x, y, angle: float):
+    """ Returns the [points] (relative to (x, y)) rotated by [angle] around
+    (x, y). """
+    cos, sin = math.cos(angle), math.sin(angle)
+    return [(x + px*cos - py*sin, y + px*sin + py*cos) for px, py in points]
+
+
+def points_box(points)-> tyBox:
+    xs, ys = [p[0] for p in points], [p[1] for p in points]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+class Shape:
+
+    kind = None
+    __slots__ = ()
+
+    @classmethod
+    def random(cls, width: int, height: int, rng=random, **specs)-> "Shape":
+        """ Returns a random shape on a [width] x [height] canvas. The
+        approx_* [specs] set its typical size. """
+        return cls()
+
+    def box(self)-> tyBox:
+        """ Returns a box (left, top, right, bottom), not clipped to the
+        canvas, containing every pixel the shape paints. """
+        return (0, 0, 0, 0)
+
+    def wiggle(self, move: float, f: float, rng=random)-> "Shape":
+        """ Returns a new shape moved by about [move] pixels and resized by
+        about [f] times its size. """
+        return self
+
+    def draw(self, draw: ImageDraw, fill):
+        """ Draws the shape in [fill] with the [draw] handle. """
+        return
+
+    def rasterize(self, mask: Image, box: tyBox):
+        """ Returns a boolean array of the pixels in [box] that the shape
+        paints. The shape is drawn at its place on [mask], an "L" image the
+        size of the canvas, because PIL does not draw a shape quite the same
+        when it is moved or cut by the edge of the image. Only [box] is
+        cleared first, the shape may paint over the rest of [mask]. """
+        mask.paste(0, box)
+        self.draw(ImageDraw.Draw(mask), 255)
+        return np.asarray(mask.crop(box)) > 0
+
+    def __eq__(self, other):
+        return (type(self) is type(other) and
+                all(getattr(self, s) == getattr(other, s)
+                    for s in self.__slots__))
+
+    def __hash__(self):
+        return hash((self.kind,) + tuple(getattr(self, s)
+                                         for s in self.__slots__))
+
+    def __repr__(self):
+        fields = ", ".join(f"{s}={getattr(self, s)!r}" for s in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+# =============================================================================
+
+
+class Circle(Shape):
+
+    kind = "circle"
+    __slots__ = ("p", "r")
+
+    def __init__(self, p: tyPoint, r: float):
+        self.p, self.r = p, r
+
+    @classmethod
+    def random(cls, width, height, rng=random, **specs):
+        point = random_point(width, height, rng)
+        r = specs.get("approx_r", rng.randint(5, 100)) * (2 * rng.random())
+        return cls(point, r)
+
+    def box(self):
+        (x, y), r = self.p, self.r
+        return (x-r, y-r, x+r, y+r)
+
+    def wiggle(self, move, f, rng=random):
+        return Circle(wiggle_point(move, *self.p, rng=rng),
+                      wiggle_size(self.r, f, rng))
+
+    def draw(self, draw, fill):
+        draw.ellipse(self.box(), fill=fill)
+
+
+class Rectangle(Shape):
+
+    kind = "rectangle"
+    __slots__ = ("p", "w", "h")
+
+    def __init__(self, p: tyPoint, w: float, h: float):
+        self.p, self.w, self.h = p, w, h
+
+    @classmethod
+    def random(cls, width, height, rng=random, **specs):
+        point = random_point(width, height, rng)
+        w = specs.get("approx_w", rng.randint(5, 100)) * 2 * rng.random()
+        h = specs.get("approx_h", rng.randint(5, 100)) * 2 * rng.random()
+        return cls(point, w, h)
+
+    def box(self):
+        (x, y), dx, dy = self.p, self.w/2, self.h/2
+        return (x-dx, y-dy, x+dx, y+dy)
+
+    def wiggle(self, move, f, rng=random):
+        p = wiggle_point(move, *self.p, rng=rng)
+        w = wiggle_size(self.w, f, rng)
+        return Rectangle(p, w, wiggle_size(self.h, f, rng))
+
+    def draw(self, draw, fill):
+        draw.rectangle(self.box(), fill=fill)
+
+
+class Line(Shape):
+
+    kind = "line"
+    __slots__ = ("p1", "p2", "w")
+
+    def __init__(self, p1: tyPoint, p2: tyPoint, w: int):
+        self.p1, self.p2, self.w = p1, p2, w
+
+    @classmethod
+    def random(cls, width, height, rng=random, **specs):
+        p1 = random_point(width, height, rng)
+        p2 = random_point(width, height, rng)
+        return cls(p1, p2, specs.get("approx_line_w", rng.randint(1, 5)))
+
+    def box(self):
+        (x1, y1), (x2, y2), m = self.p1, self.p2, self.w
+        return (min(x1, x2)-m, min(y1, y2)-m, max(x1, x2)+m, max(y1, y2)+m)
+
+    def wiggle(self, move, f, rng=random):
+        p1 = wiggle_point(move, *self.p1, rng=rng)
+        p2 = wiggle_point(move, *self.p2, rng=rng)
+        return Line(p1, p2, abs(round(rng.gauss(self.w, self.w*f))))
+
+    def draw(self, draw, fill):
+        draw.line([self.p1, self.p2], width=self.w, fill=fill)
+
+
+# =============================================================================
+
+
+class Ellipse(Shape):
+    """ An ellipse with radii [rx] and [ry] turned by [angle] (radians). """
+
+    kind = "ellipse"
+    __slots__ = ("p", "rx", "ry", "angle")
+
+    def __init__(self, p: tyPoint, rx: float, ry: float, angle: float):
+        self.p, self.rx, self.ry, self.angle = p, rx, ry, angle
+
+    @classmethod
+    def random(cls, width, height, rng=random, **specs):
+        point = random_point(width, height, rng)
+        r = specs.get("approx_r", rng.randint(5, 100))
+        rx, ry = r * 2 * rng.random(), r * 2 * rng.random()
+        return cls(point, rx, ry, rng.uniform(0, math.pi))
+
+    def points(self):
+        (x, y), rx, ry = self.p, self.rx, self.ry
+        steps = [2 * math.pi * i / ELLIPSE_POINTS
+                 for i in range(ELLIPSE_POINTS)]
+        return rotate([(rx * math.cos(s), ry * math.sin(s)) for s in steps],
+                      x, y, self.angle)
+
+    def box(self):
+        (x, y), r = self.p, max(self.rx, self.ry)
+        return (x-r, y-r, x+r, y+r)
+
+    def wiggle(self, move, f, rng=random):
+        p = wiggle_point(move, *self.p, rng=rng)
+        rx, ry = wiggle_size(self.rx, f, rng), wiggle_size(self.ry, f, rng)
+        return Ellipse(p, rx, ry, rng.gauss(self.angle, math.pi*f))
+
+    def draw(self, draw, fill):
+        draw.polygon(self.points(), fill=fill)
+
+
+class RotatedRectangle(Shape):
+    """ A [w] x [h] rectangle centered on [p] and turned by [angle]
+    (radians). """
+
+    kind = "rotated_rectangle"
+    __slots__ = ("p", "w", "h", "angle")
+
+    def __init__(self, p: tyPoint, w: float, h: float, angle: float):
+        self.p, self.w, self.h, self.angle = p, w, h, angle
+
+    @classmethod
+    def random(cls, width, height, rng=random, **specs):
+        point = random_point(width, height, rng)
+        w = specs.get("approx_w", rng.randint(5, 100)) * 2 * rng.random()
+        h = specs.get("approx_h", rng.randint(5, 100)) * 2 * rng.random()
+        return cls(point, w, h, rng.uniform(0, math.pi))
+
+    def points(self):
+        (x, y), dx, dy = self.p, self.w/2, self.h/2
+        return rotate([(-dx, -dy), (dx, -dy), (dx, dy), (-dx, dy)],
+                      x, y, self.angle)
+
+    def box(self):
+        return points_box(self.points())
+
+    def wiggle(self, move, f, rng=random):
+        p = wiggle_point(move, *self.p, rng=rng)
+        w, h = wiggle_size(self.w, f, rng), wiggle_size(self.h, f, rng)
+        return RotatedRectangle(p, w, h, rng.gauss(self.angle, math.pi*f))
+
+    def draw(self, draw, fill):
+        draw.polygon(self.points(), fill=fill)
+
+
+class Triangle(Shape):
+
+    kind = "triangle"
+    __slots__ = ("p1", "p2", "p3")
+
+    def __init__(self, p1: tyPoint, p2: tyPoint, p3: tyPoint):
+        self.p1, self.p2, self.p3 = p1, p2, p3
+
+    @classmethod
+    def random(cls, width, height, rng=random, **specs):
+        """ The corners are around a random center, at most [approx_r] * 2
+        away from it in each direction. """
+        x, y = random_point(width, height, rng)
+        r = specs.get("approx_r", rng.randint(5, 100)) * 2
+
+        def corner():
+            return (round(x + rng.uniform(-r, r)),
+                    round(y + rng.uniform(-r, r)))
+        return cls(corner(), corner(), corner())
+
+    def box(self):
+        return points_box((self.p1, self.p2, self.p3))
+
+    def wiggle(self, move, f, rng=random):
+        return Triangle(*[wiggle_point(move, *p, rng=rng)
+                          for p in (self.p1, self.p2, self.p3)])
+
+    def draw(self, draw, fill):
+        draw.polygon([self.p1, self.p2, self.p3], fill=fill)
+
+
+class Bezier(Shape):
+    """ A stroke of width [w] along the quadratic Bézier curve from [p1] to
+    [p3], pulled towards the control point [p2]. """
+
+    kind = "bezier"
+    __slots__ = ("p1", "p2", "p3", "w")
+
+    def __init__(self, p1: tyPoint, p2: tyPoint, p3: tyPoint, w: int):
+        self.p1, self.p2, self.p3, self.w = p1, p2, p3, w
+
+    @classmethod
+    def random(cls, width, height, rng=random, **specs):
+        p1 = random_point(width, height, rng)
+        p2 = random_point(width, height, rng)
+        p3 = random_point(width, height, rng)
+        return cls(p1, p2, p3, specs.get("approx_line_w", rng.randint(1, 5)))
+
+    def points(self):
+        (x1, y1), (x2, y2), (x3, y3) = self.p1, self.p2, self.p3
+        points = []
+        for i in range(BEZIER_POINTS + 1):
+            s = i / BEZIER_POINTS
+            a, b, c = (1-s)**2, 2*s*(1-s), s**2
+            points.append((a*x1 + b*x2 + c*x3, a*y1 + b*y2 + c*y3))
+        return points
+
+    def box(self):
+        # the curve stays inside the triangle of its three points
+        l, t, r, b = points_box((self.p1, self.p2, self.p3))
+        m = self.w
+        return (l-m, t-m, r+m, b+m)
+
+    def wiggle(self, move, f, rng=random):
+        p1, p2, p3 = [wiggle_point(move, *p, rng=rng)
+                      for p in (self.p1, self.p2, self.p3)]
+        return Bezier(p1, p2, p3, abs(round(rng.gauss(self.w, self.w*f))))
+
+    def draw(self, draw, fill):
+        draw.line(self.points(), width=self.w, fill=fill, joint="curve")
+
+
+# Shape classes by their kind
+SHAPES = {shape.kind: shape for shape in (Circle, Rectangle, Line, Ellipse,
+                                          RotatedRectangle, Triangle, Bezier)}
@@ -0,0 +1,304 @@
+import genetics
+import numpy as np
+import raster
+from target import as_target
+from typing import List, Tuple
+from PIL import Image, ImageDraw
+
+tyGene = dict
+tyDna = List[tyGene]
+tyArrayDna = np.ndarray  # structured array of shape (dna_len,)
+tyArrayDnas = np.ndarray  # structured array of shape (n, dna_len)
+tyArrayPop = Tuple[np.ndarray, tyArrayDnas]  # (scores, dnas)
+
+# =============================================================================
+# Array backed DNA, where the genes of a whole population are stored in one
+# structured array of shape (pop_size, dna_len). Mutations and combinations
+# are done on all dnas at once. Dnas are drawn straight from the arrays, the
+# dict based DNA serves as a view used for reading and writing json.
+
+
+def exact_ints(values, name: str)-> np.ndarray:
+    """ Returns [values] as an int32 array, raising an exception if that would
+    change any of them. """
+    ints = np.asarray(values).astype(np.int32)
+    if not np.array_equal(ints, values):
+        raise Exception(f"{name} {values} cannot be stored as array dnas, "
+                        "which only hold integers")
+    return ints
+
+
+class ArrayDNA:
+
+    def __init__(self, gene_tools: genetics.GeneKind, evo_specs, rng=None):
+        required = ["gene_mutation_ratio", "property_mutation_ratio",
+                    "combine_ratio", "gene_switch_ratio"]
+        if not all([f in evo_specs.keys() for f in required]):
+            raise KeyError(f"DNA requires parameters {required}.")
+
+        self.genes = gene_tools
+        self.specs = evo_specs
+        self.dict_tools = genetics.DNA(gene_tools, evo_specs)
+        self.scheduler = None  # adapts the specs, see schedule.py
+        self.telemetry = None  # collects timings, see telemetry.py
+        self.rng = np.random.default_rng() if rng is None else rng
+
+        color = ("color", np.int32, (4,))
+        if isinstance(gene_tools, genetics.PolygonGene):
+            self.kind = "polygon"
+            max_n = gene_tools.specs["max_n"]
+            self.dtype = np.dtype(
+                [("n", np.int32), ("points", np.int32, (max_n, 2)), color])
+            # properties that are inherited together when combining
+            self.properties = [("n", "points"), ("color",)]
+        elif isinstance(gene_tools, genetics.LetterGene):
+            self.kind = "letter"
+            # letters are stored by their index, the same in every process
+            self.letters = list(gene_tools.LETTERS)
+            self.dtype = np.dtype([("x", np.int32), ("y", np.int32),
+                                   ("r", np.int32), color,
+                                   ("letter", np.int32)])
+            self.properties = [("x", "y"), ("r",), ("color",), ("letter",)]
+        else:
+            self.kind = "circle"
+            self.dtype = np.dtype([("x", np.int32), ("y", np.int32),
+                                   ("r", np.int32), color])
+            self.properties = [("x", "y"), ("r",), ("color",)]
+
+        # Dnas are scored by drawing them with PIL or with raster.py
+        self.rasterizer = None
+        if evo_specs.get("rasterizer", "pil") == "numpy":
+            self.rasterizer = raster.Rasterizer(self)
+
+    # -------------------------------------------------------------------------
+    # Conversion from and to the dict view
+
+    def to_dicts(self, dna: tyArrayDna)-> tyDna:
+        """ Returns the dict version of a single array dna. """
+        if self.kind == "polygon":
+            return [{"points": [(int(x), int(y))
+                                for x, y in g["points"][:g["n"]]],
+                     "color": tuple(int(c) for c in g["color"])} for g in dna]
+
+        dicts = []
+        for g in dna:
+            gene = {"point": (int(g["x"]), int(g["y"])), "r": int(g["r"]),
+                    "color": tuple(int(c) for c in g["color"])}
+            if self.kind == "letter":
+                gene["letter"] = self.letters[g["letter"]]
+            dicts.append(gene)
+        return dicts
+
+    def from_dicts(self, dnas: List[tyDna])-> tyArrayDnas:
+        """ Returns an array holding the given dict dnas. Letters have to be
+        among the letters of the gene specs and all numbers have to be
+        integers. """
+        arr = np.zeros((len(dnas), len(dnas[0])), dtype=self.dtype)
+        for i, dna in enumerate(dnas):
+            for j, gene in enumerate(dna):
+                arr[i, j]["color"] = exact_ints(gene["color"], "Color")
+                if self.kind == "polygon":
+                    points = exact_ints(gene["points"], "Points")
+                    arr[i, j]["n"] = len(points)
+                    arr[i, j]["points"][:len(points)] = points
+                    # pad with the last point, padding is never drawn
+                    arr[i, j]["points"][len(points):] = points[-1]
+                    continue
+                arr[i, j]["x"], arr[i, j]["y"] = exact_ints(gene["point"],
+                                                            "Point")
+                arr[i, j]["r"] = exact_ints(gene["r"], "Size")
+                if self.kind == "letter":
+                    if gene["letter"] not in self.letters:
+                        raise Exception(f"Letter `{gene['letter']}` is not "
+                                        "among the letters of the gene specs")
+                    arr[i, j]["letter"] = self.letters.index(gene["letter"])
+        return arr
+
+    # -------------------------------------------------------------------------
+    # Population operations
+
+    def random_colors(self, shape):
+        return self.rng.integers(0, 257, size=shape+(4,))
+
+    def random_dnas(self, n: int, dna_len: int)-> tyArrayDnas:
+        """ Returns [n] random dnas. """
+        rng, w, h = self.rng, self.genes.w, self.genes.h
+        specs = self.genes.specs
+        shape = (n, dna_len)
+        dnas = np.zeros(shape, dtype=self.dtype)
+        dnas["color"] = self.random_colors(shape)
+
+        if self.kind == "circle":
+            dnas["x"] = rng.integers(0, w+1, size=shape)
+            dnas["y"] = rng.integers(0, h+1, size=shape)
+            dnas["r"] = specs["init_r"]
+
+        elif self.kind == "letter":
+            dnas["x"] = rng.integers(-20, w+1, size=shape)
+            dnas["y"] = rng.integers(-20, h+1, size=shape)
+            fontmin = self.genes.FONTMIN
+            dnas["r"] = max(fontmin, min(specs["max_r"], specs["init_r"]))
+            dnas["letter"] = rng.integers(0, len(self.genes.LETTERS), shape)
+
+        else:
+            max_n, r = specs["max_n"], specs["init_r"]
+            dnas["n"] = rng.integers(3, max_n+1, size=shape)
+            # Limit points to a circle for better initial seeding
+            c_x = rng.integers(0, w+1, size=shape+(1,))
+            c_y = rng.integers(0, h+1, size=shape+(1,))
+            points = np.empty(shape+(max_n, 2), dtype=np.int32)
+            todo = np.ones(shape+(max_n,), dtype=bool)
+            while todo.any():
+                xs = rng.integers(np.maximum(0, c_x-r), np.minimum(w, c_x+r)+1,
+                                  size=shape+(max_n,))[todo]
+                ys = rng.integers(np.maximum(0, c_y-r), np.minimum(h, c_y+r)+1,
+                                  size=shape+(max_n,))[todo]
+                cx = np.broadcast_to(c_x, shape+(max_n,))[todo]
+                cy = np.broadcast_to(c_y, shape+(max_n,))[todo]
+                ok = (cx-xs)**2 + (cy-ys)**2 <= r**2
+                idx = tuple(i[ok] for i in np.nonzero(todo))
+                points[idx] = np.stack([xs[ok], ys[ok]], axis=-1)
+                todo[idx] = False
+            dnas["points"] = points
+
+        return dnas
+
+    def combine_dna(self, dnas1: tyArrayDnas,
+                    dnas2: tyArrayDnas)-> tyArrayDnas:
+        """ Combines the dnas pairwise, the result is based on [dnas1]. """
+        comb_ratio = self.specs["combine_ratio"]
+        combined = dnas1.copy()
+        # genes that are combined take each property from dnas2 at random
+        combine = self.rng.random(dnas1.shape) < comb_ratio
+        for fields in self.properties:
+            take = combine & ~(self.rng.random(dnas1.shape) < comb_ratio)
+            for f in fields:
+                combined[f][take] = dnas2[f][take]
+        return combined
+
+    def mutate_dna(self, dnas: tyArrayDnas)-> tyArrayDnas:
+        """ Returns mutated versions of dnas, does not change originals. """
+        rng, specs = self.rng, self.genes.specs
+        mutation_ratio = self.specs["gene_mutation_ratio"]
+        prop_ratio = self.specs["property_mutation_ratio"]
+        switch_ratio = self.specs["gene_switch_ratio"]
+
+        mut = dnas.copy()
+        shape = dnas.shape
+        mutated = rng.random(shape) < mutation_ratio
+
+        def chosen():
+            return mutated & (rng.random(shape) < prop_ratio)
+
+        def wiggle(values, change, low, high):
+            """ Uniformly picks new values within [change] of the old ones. """
+            low = np.maximum(low, values - change)
+            high = np.maximum(low, np.minimum(high, values + change))
+            return rng.integers(low, high+1)
+
+        if self.kind == "polygon":
+            self.mutate_polygons(
+                mut, chosen() & (rng.random(shape) < specs["mut_n"]))
+            # Position, all points of a polygon move together
+            move = chosen()
+            pts = mut["points"][move]
+            mut["points"][move] = np.stack([
+                wiggle(pts[..., 0], specs["mut_p"], 0, self.genes.w),
+                wiggle(pts[..., 1], specs["mut_p"], 0, self.genes.h)], axis=-1)
+
+        else:
+            margin = -20 if self.kind == "letter" else 0
+            move = chosen()
+            mut["x"][move] = wiggle(mut["x"][move], specs["mut_p"], margin,
+                                    self.genes.w)
+            mut["y"][move] = wiggle(mut["y"][move], specs["mut_p"], margin,
+                                    self.genes.h)
+
+            size = chosen()
+            if self.kind == "letter":
+                low, high = self.genes.FONTMIN, specs["init_r"]
+            else:
+                low, high = 0, specs["max_r"]
+            mut["r"][size] = wiggle(mut["r"][size], specs["mut_r"], low, high)
+
+        recolor = chosen()
+        mut["color"][recolor] = wiggle(mut["color"][recolor], specs["mut_c"],
+                                       0, 255)
+
+        if self.kind == "letter":
+            relabel = chosen() & (rng.random(shape) < specs["mut_l"])
+            mut["letter"][relabel] = rng.integers(
+                0, len(self.genes.LETTERS), size=relabel.sum())
+
+        # Switch two genes in some of the dnas
+        rows = np.nonzero(rng.random(shape[0]) < switch_ratio)[0]
+        i = rng.integers(0, shape[1], size=len(rows))
+        j = rng.integers(0, shape[1], size=len(rows))
+        mut[rows, i], mut[rows, j] = mut[rows, j], mut[rows, i]
+
+        return mut
+
+    def mutate_polygons(self, dnas: tyArrayDnas, chosen):
+        """ Adds or removes a point of the chosen polygons in place. """
+        rng, max_n = self.rng, self.genes.specs["max_n"]
+        n = dnas["n"][chosen]
+        points = dnas["points"][chosen]
+        add = rng.random(len(n)) < 0.5
+        # the point at [k] is either new or removed
+        k = rng.integers(0, n)
+        slots = np.arange(max_n)[None, :]
+        k_col = k[:, None]
+
+        grow = add & (n < max_n)
+        src = np.where(slots > k_col, slots-1, slots)
+        grown = np.take_along_axis(points, src[..., None], axis=1)
+        rows = np.arange(len(n))
+        grown[rows, k, 0] = rng.integers(0, self.genes.w+1, len(n))
+        grown[rows, k, 1] = rng.integers(0, self.genes.h+1, len(n))
+
+        shrink = ~add & (n > 3)
+        src = np.minimum(np.where(slots >= k_col, slots+1, slots), max_n-1)
+        shrunk = np.take_along_axis(points, src[..., None], axis=1)
+
+        points[grow] = grown[grow]
+        points[shrink] = shrunk[shrink]
+        n = n + grow - shrink
+        dnas["points"][chosen] = points
+        dnas["n"][chosen] = n
+
+    # -------------------------------------------------------------------------
+    # Drawing and scoring
+
+    def dna_to_image(self, dna: tyArrayDna):
+        """ Draws the dna like [genetics.DNA.dna_to_image], reading the genes
+        from the columns of the array. """
+        if len(dna) < 1:
+            raise Exception("DNA has to be at least 1 long!")
+
+        genes = self.genes
+        colors = [tuple(color) for color in dna["color"].tolist()]
+        dna_img = Image.new("RGB", (genes.w, genes.h), colors[0])
+        draw = ImageDraw.Draw(dna_img, "RGBA")
+        if self.kind == "polygon":
+            for n, points, color in zip(dna["n"].tolist(), dna["points"],
+                                        colors):
+                draw.polygon(points[:n].ravel().tolist(), fill=color)
+            return dna_img
+
+        xs, ys, rs = dna["x"].tolist(), dna["y"].tolist(), dna["r"].tolist()
+        if self.kind == "circle":
+            for x, y, r, color in zip(xs, ys, rs, colors):
+                draw.ellipse([x-r, y-r, x+r, y+r], fill=color)
+        else:
+            for x, y, r, color, k in zip(xs, ys, rs, colors,
+                                         dna["letter"].tolist()):
+                mask, (left, top) = genes.glyph(self.letters[k], r)
+                draw.bitmap((x+left, y+top), mask, fill=color)
+        return dna_img
+
+    def evaluate_dna(self, dna: tyArrayDna, img)-> int:
+        """Calculates the difference between the image and the DNA drawing."""
+        if self.rasterizer is not None:
+            return self.rasterizer.evaluate_dna(dna, img)[0]
+        dna_img = self.dna_to_image(dna)
+        return self.dict_tools.timed_score(as_target(img).score, dna_img)
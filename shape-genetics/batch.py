@@ -0,0 +1,319 @@
+import argparse
+import checkpoint
+import evolution
+import array_genetics
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import stopping
+import streams
+import sys
+import telemetry
+import time
+import traceback
+from collections import deque
+from target import target_from_specs
+from PIL import Image
+
+# =============================================================================
+# Batch runs of many evolutions. A manifest (a json file) lists the jobs, each
+# job evolves one image in [stages] and runs in its own process, so that a
+# crash or a resource limit only ends that job. The target, the gene tools and
+# the population live on between the stages of a job, which only write out
+# their results. Up to [workers] jobs run at the same time.
+#
+# Manifest:
+#   {"out_dir": "runs", "workers": 8,
+#    "defaults": {... entries shared by all jobs ...},
+#    "jobs": [{"name": "nara", "image": "nara.jpg", "kind": "polygon",
+#              "gene_specs": {...}, "evo_specs": {...}, "steps": 30000,
+#              "stages": 10, "seed": 1, "workers": None,
+#              "telemetry_every": 1000, "generate_steps": False,
+#              "limits": {"memory_mb": 2048, "cpu_seconds": 3600,
+#                         "wall_seconds": 3600},
+#              "sweep": {"evo_specs.pop_size": [20, 50]}}]}
+#
+# A sweep turns a job into one job per combination of the listed values. Every
+# job writes to out_dir/name: the drawing and the json of the best dna after
+# every stage (the json can be continued with evolution.continue_evolution),
+# a checkpoint of the whole population (see evolution.resume_evolution), the
+# printed reports and a result.json. Jobs that already finished are skipped
+# when the manifest is run again. The stop_* evolution specs (see stopping.py)
+# end a job early with its results written, the limits end its process.
+
+JOB_REQUIRED = ["image", "kind", "gene_specs", "evo_specs", "steps"]
+
+
+# -----------------------------------------------------------------------------
+# Manifest
+
+
+def expand_sweep(job):
+    """ Returns the jobs of all combinations of the values in the [sweep] of
+    the job. Keys are entries of the job, or of its gene or evolution specs
+    written as "gene_specs.mut_p". """
+    sweep = job.get("sweep", {})
+    if not sweep:
+        return [job]
+
+    jobs = []
+    keys = list(sweep)
+    for values in itertools.product(*[sweep[key] for key in keys]):
+        new_job = dict(job, gene_specs=dict(job["gene_specs"]),
+                       evo_specs=dict(job["evo_specs"]))
+        del new_job["sweep"]
+        labels = []
+        for key, value in zip(keys, values):
+            if "." in key:
+                group, spec = key.split(".", 1)
+                new_job[group][spec] = value
+            else:
+                new_job[key] = value
+            labels.append(f"{key.split('.')[-1]}={value}")
+        new_job["name"] = job["name"] + "-" + "-".join(labels)
+        jobs.append(new_job)
+    return jobs
+
+
+def load_manifest(path):
+    """ Returns the settings and the expanded list of jobs of a manifest. """
+    with open(path, "r") as jfile:
+        manifest = json.loads(jfile.read())
+
+    defaults = manifest.get("defaults", {})
+    jobs = []
+    for k, job in enumerate(manifest["jobs"]):
+        full_job = dict(defaults, **job)
+        for group in ("gene_specs", "evo_specs", "limits"):
+            full_job[group] = dict(defaults.get(group, {}),
+                                   **job.get(group, {}))
+        if not all([f in full_job.keys() for f in JOB_REQUIRED]):
+            raise KeyError(f"Batch jobs require parameters {JOB_REQUIRED}.")
+        evo_specs = full_job["evo_specs"]
+        resolutions = evo_specs.get("resolutions")
+        if evo_specs.get("islands", 1) > 1:
+            raise Exception("Islands can not be run as batch jobs")
+        if resolutions and resolutions[-1][0] != 1:
+            raise Exception("The last resolution of batch jobs has to be 1")
+        stem = os.path.splitext(os.path.basename(full_job["image"]))[0]
+        full_job.setdefault("name", f"{k}_{stem}_{full_job['kind']}")
+        jobs.extend(expand_sweep(full_job))
+
+    names = [job["name"] for job in jobs]
+    if len(set(names)) != len(names):
+        raise Exception("Batch job names have to be unique")
+
+    settings = {"out_dir": manifest.get("out_dir", "runs"),
+                "workers": manifest.get("workers", os.cpu_count())}
+    return settings, jobs
+
+
+# -----------------------------------------------------------------------------
+# Running a single job
+
+
+def set_limits(limits):
+    """ Limits the memory and processor time of the current process. """
+    if limits.get("memory_mb"):
+        size = int(limits["memory_mb"] * 2**20)
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+    if limits.get("cpu_seconds"):
+        seconds = int(limits["cpu_seconds"])
+        resource.setrlimit(resource.RLIMIT_CPU, (seconds, seconds))
+
+
+def write_json(path, data):
+    with open(path + ".tmp", "w") as jfile:
+        jfile.write(json.dumps(data))
+    os.replace(path + ".tmp", path)
+
+
+def run_job(job, job_dir):
+    """ Evolves the image of a job in its stages and writes the results of
+    every stage to [job_dir]. Returns the best score. """
+    seed = streams.seed_sequence(job.get("seed"))
+    kind, steps = job["kind"], job["steps"]
+    gene_specs, evo_specs = job["gene_specs"], dict(job["evo_specs"])
+    if job.get("generate_steps", False):
+        evo_specs.setdefault("steps_dir", os.path.join(job_dir, "steps"))
+
+    # loaded once and reused by all stages
+    img = target_from_specs(Image.open(job["image"]), evo_specs)
+    w, h = img.width, img.height
+    dna_tools, evo_tools = evolution.make_tools(kind, w, h, gene_specs,
+                                                evo_specs, seed)
+
+    meta = {"width": w, "height": h, "kind": kind, "gene_specs": gene_specs,
+            "evo_specs": evo_specs}
+    checkpoint_path = os.path.join(job_dir, "checkpoint.npz")
+
+    def autosave(pop, step):
+        checkpoint.save_checkpoint(checkpoint_path, pop, evo_tools, step, meta)
+
+    tel = None
+    if job.get("telemetry_every"):
+        tel = telemetry.Telemetry(
+            every=job["telemetry_every"],
+            out=os.path.join(job_dir, "telemetry.jsonl"))
+
+    stages = job.get("stages", 1)
+    stopper = stopping.stopper_from_specs(evo_specs)
+    kwargs = {"workers": job.get("workers"),
+              "generate_steps": job.get("generate_steps", False),
+              "report": job.get("report", 100000), "telemetry": tel,
+              "stopper": stopper}
+    pop, step = None, 0
+    for stage in range(stages):
+        stage_steps = (steps * (stage + 1)) // stages - step
+        if pop is None and evo_specs.get("resolutions"):
+            # the coarse to fine phases all run in the first stage
+            pop, evo_tools = evolution.evolve_resolutions(
+                img, kind, gene_specs, evo_specs, stage_steps, seed=seed,
+                **kwargs)
+            dna_tools = getattr(evo_tools, "dict_tools", evo_tools)
+        else:
+            if pop is None and evo_tools is dna_tools:
+                pop = evolution.initial_population(
+                    dna_tools, evo_specs["dna_len"],
+                    evolution.population_size(evo_specs), img)
+            elif pop is None:
+                pop = evolution.initial_array_population(
+                    evo_tools, evo_specs["dna_len"],
+                    evolution.population_size(evo_specs), img)
+            pop = evolution.evolve_any_pop(
+                pop, evo_tools, img, stage_steps, kind, steps_start=step,
+                autosave=autosave,
+                autosave_every=job.get("autosave_every", 10000), **kwargs)
+        step = stopping.final_step(stopper, step + stage_steps)
+
+        # results of the stage
+        dna = evolution.best_dna(pop, evo_tools)
+        dna_tools.dna_to_image(dna).save(
+            os.path.join(job_dir, f"stage_{stage}.png"))
+        write_json(os.path.join(job_dir, f"stage_{stage}.json"),
+                   {"width": w, "height": h, "kind": kind, "steps": step,
+                    "gene_specs": gene_specs, "evo_specs": evo_specs,
+                    "dna": dna})
+        autosave(pop, step)
+        if stopper and stopper.reason:
+            evolution.report_stop(stopper, kwargs["report"])
+            break
+
+    if tel:
+        tel.close()
+    dna_tools.dna_to_image(dna).save(os.path.join(job_dir, "best.png"))
+    if isinstance(evo_tools, array_genetics.ArrayDNA):
+        return float(pop[0].min())
+    return float(min(score for score, _ in pop))
+
+
+def job_process(job, job_dir):
+    """ Runs a job in the current process, with its output going to the log
+    of the job, and writes its result.json. """
+    set_limits(job.get("limits", {}))
+    start = time.time()
+    with open(os.path.join(job_dir, "log.txt"), "a") as log:
+        with contextlib.redirect_stdout(log):
+            try:
+                score = run_job(job, job_dir)
+                result = {"status": "done", "score": score}
+            except Exception:
+                log.write(traceback.format_exc())
+                result = {"status": "failed",
+                          "error": traceback.format_exc(limit=1)}
+    result["seconds"] = round(time.time() - start, 3)
+    write_json(os.path.join(job_dir, "result.json"), result)
+    sys.exit(0 if result["status"] == "done" else 1)
+
+
+# -----------------------------------------------------------------------------
+# Scheduling
+
+
+def read_result(job_dir):
+    path = os.path.join(job_dir, "result.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as jfile:
+        return json.loads(jfile.read())
+
+
+def run_batch(manifest_path, workers=None, force=False, poll=0.2):
+    """ Runs all jobs of the manifest, at most [workers] at once (the manifest
+    setting by default), and returns their results by name. Finished jobs
+    are skipped unless [force] is set. """
+    settings, jobs = load_manifest(manifest_path)
+    out_dir = settings["out_dir"]
+    workers = workers or settings["workers"]
+
+    results = {}
+    pending = deque()
+    for job in jobs:
+        job_dir = os.path.join(out_dir, job["name"])
+        os.makedirs(job_dir, exist_ok=True)
+        previous = read_result(job_dir)
+        if not force and previous and previous["status"] == "done":
+            results[job["name"]] = previous
+            continue
+        if os.path.exists(os.path.join(job_dir, "result.json")):
+            os.remove(os.path.join(job_dir, "result.json"))
+        write_json(os.path.join(job_dir, "job.json"), job)
+        pending.append((job, job_dir))
+
+    running = []
+    while pending or running:
+        while pending and len(running) < workers:
+            job, job_dir = pending.popleft()
+            process = multiprocessing.Process(target=job_process,
+                                              args=(job, job_dir))
+            process.start()
+            running.append((job, job_dir, process, time.time()))
+            print(f"STARTED! Job : {job['name']}")
+
+        still_running = []
+        for job, job_dir, process, started in running:
+            wall = job.get("limits", {}).get("wall_seconds")
+            if process.is_alive() and wall and time.time() - started > wall:
+                process.terminate()
+                process.join()
+                result = {"status": "timeout",
+                          "seconds": round(time.time() - started, 3)}
+                write_json(os.path.join(job_dir, "result.json"), result)
+            elif process.is_alive():
+                still_running.append((job, job_dir, process, started))
+                continue
+            process.join()
+            # a job killed by a limit does not get to write its result
+            result = read_result(job_dir) or {
+                "status": "killed", "exitcode": process.exitcode,
+                "seconds": round(time.time() - started, 3)}
+            results[job["name"]] = result
+            print(f"FINISHED! Job : {job['name']} | {result['status']}")
+        running = still_running
+        if running:
+            time.sleep(poll)
+
+    write_json(os.path.join(out_dir, "summary.json"), results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the evolutions listed "
+                                     "in a manifest.")
+    parser.add_argument("manifest", help="json file with the jobs")
+    parser.add_argument("--workers", type=int, help="jobs run at once")
+    parser.add_argument("--force", action="store_true",
+                        help="also rerun jobs that already finished")
+    args = parser.parse_args()
+
+    results = run_batch(args.manifest, args.workers, args.force)
+    failed = [name for name, r in results.items() if r["status"] != "done"]
+    print(f"{len(results) - len(failed)} of {len(results)} jobs done")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
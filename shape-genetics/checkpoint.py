@@ -0,0 +1,56 @@
+import array_genetics
+import json
+import os
+import numpy as np
+
+# =============================================================================
+# Binary checkpoints of a whole evolution. A checkpoint is a compressed .npz
+# file holding the population (in the array format of array_genetics), the
+# scores, the step counter and the state of the random generators, so that an
+# evolution can be resumed exactly where it stopped without rescoring.
+
+
+def save_checkpoint(path, pop, dna_tools, step: int, meta: dict):
+    """ Saves a dict or array population to [path]. The file is replaced
+    atomically, so an interrupted save never corrupts the old checkpoint.
+    [meta] holds the settings needed to rebuild the dna tools. Dict dnas are
+    stored as array dnas, so a dna with numbers that are not integers cannot
+    be saved. Dict evolutions draw no numpy numbers, so their checkpoints
+    hold no numpy generator state. """
+    if isinstance(dna_tools, array_genetics.ArrayDNA):
+        array_tools = dna_tools
+        scores, dnas = pop
+    else:
+        array_tools = array_genetics.ArrayDNA(dna_tools.genes, dna_tools.specs)
+        scores = np.array([score for score, _ in pop])
+        dnas = array_tools.from_dicts([dna for _, dna in pop])
+
+    version, mt_state, gauss = array_tools.genes.rng.getstate()
+    meta = dict(meta, step=step, py_random_version=version,
+                py_random_gauss=gauss)
+    if array_tools is dna_tools:
+        meta["np_random"] = array_tools.rng.bit_generator.state
+    if dna_tools.scheduler:
+        meta["scheduler"] = dna_tools.scheduler.state()
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as cfile:
+        np.savez_compressed(cfile, scores=scores, dnas=dnas,
+                            py_random=np.array(mt_state, dtype=np.uint32),
+                            meta=np.array(json.dumps(meta)))
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """ Returns the settings, scores and array dnas stored in a checkpoint. The
+    states of the python and numpy generators of the dna tools are stored
+    under [py_random] and [np_random] in the settings, the latter only for
+    array populations. """
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+        scores, dnas = data["scores"], data["dnas"]
+        mt_state = tuple(int(x) for x in data["py_random"])
+
+    meta["py_random"] = (meta["py_random_version"], mt_state,
+                         meta["py_random_gauss"])
+    return meta, scores, dnas
@@ -0,0 +1,81 @@
+import array_genetics
+import genetics
+import numpy as np
+import raster
+from target import Target
+from PIL import Image
+
+# =============================================================================
+# Quick checks of properties the evolution relies on, kept out of the run
+# script (test_file.py). Run with `python checks.py`, every check prints its
+# name once it holds.
+
+gene_specs = {"mut_p": 30, "mut_n": 0.1, "mut_c": 30, "init_r": 50, "max_n": 5}
+circle_specs = {"mut_p": 30, "mut_r": 3, "mut_c": 40, "max_r": 40, "init_r": 15}
+evo_specs = {"pop_size": 50, "dna_len": 50, "kind": "polygon",
+             "gene_switch_ratio": 0.2, "gene_mutation_ratio": 0.05,
+             "property_mutation_ratio": 0.1, "combine_ratio": 0.1}
+
+
+def check_crossover_keeps_genes():
+    """ A crossover of identical genes changes nothing, so the offspring
+    shares every gene with its parent and has nothing to redraw. """
+    tools = genetics.make_gene_tools(evo_specs["kind"], 100, 100, gene_specs)
+    dna_tools = genetics.DNA(tools, dict(evo_specs, combine_ratio=1))
+    parent = dna_tools.random_dna(10)
+    child = dna_tools.combine_dna(parent, [gene.copy() for gene in parent])
+    assert all(g is p for g, p in zip(child, parent))
+    assert dna_tools.dirty_box(child, parent) is None
+
+
+def check_rasterizer_is_exact():
+    """ The numpy rasterizer draws mutated circle and polygon dnas pixel for
+    pixel like PIL, also polygons reaching over the edges of the canvas. """
+    for kind, specs in (("circle", circle_specs), ("polygon", gene_specs)):
+        tools = genetics.make_gene_tools(kind, 96, 64, specs)
+        dna_tools = array_genetics.ArrayDNA(
+            tools, dict(evo_specs, rasterizer="numpy"),
+            rng=np.random.default_rng(0))
+        dnas = dna_tools.random_dnas(20, 50)
+        for _ in range(10):
+            dnas = dna_tools.mutate_dna(dna_tools.combine_dna(dnas,
+                                                              dnas[::-1]))
+        if kind == "polygon":
+            dnas["points"] += dna_tools.rng.integers(-40, 41,
+                                                     dnas["points"].shape)
+        assert raster.check_exactness(dna_tools, dnas) == 0
+
+
+def check_prefix_replay():
+    """ An offspring scored from the snapshots of its parent is redrawn only
+    from the last snapshot at or before its first changed gene, and scores
+    like a full drawing. """
+    tools = genetics.make_gene_tools(evo_specs["kind"], 100, 100, gene_specs)
+    dna_tools = genetics.DNA(tools, dict(evo_specs, prefix_cache=True,
+                                         prefix_every=10))
+    img = Target(Image.new("RGB", (100, 100), (200, 120, 40)), "ssim")
+    drawn = []
+    draw_gene = tools.draw_gene
+    tools.draw_gene = lambda draw, gene: drawn.append(gene) or draw_gene(
+        draw, gene)
+
+    parent = dna_tools.random_dna(evo_specs["dna_len"])
+    dna_tools.remember_prefixes(parent)
+    for _ in range(50):
+        child = dna_tools.mutate_dna(parent)
+        changed = genetics.changed_genes(child, parent)
+        first = changed[0] if changed else len(parent)
+        drawn.clear()
+        score, _ = dna_tools.evaluate_dna_prefix(child, parent, img)
+        start = 0 if first < 10 else min(first, len(parent) - 1) // 10 * 10
+        assert len(drawn) == len(child) - start
+        assert score == dna_tools.evaluate_dna(child, img)
+
+
+CHECKS = [check_crossover_keeps_genes, check_rasterizer_is_exact,
+          check_prefix_replay]
+
+if __name__ == "__main__":
+    for check in CHECKS:
+        check()
+        print(f"{check.__name__}: ok")
@@ -1,6 +1,18 @@
 import genetics
+import array_genetics
+import checkpoint
+import islands
+import parallel
 import random
+import schedule
+import snapshots
+import stopping
+import streams
 import json
+import time
+import numpy as np
+from functools import partial
+from target import Target, target_from_specs
 from typing import List, Tuple
 from PIL import Image
 
@@ -13,6 +25,15 @@ THIN_SEP = "-"*80
 THICK_SEP = "="*80
 
 
+def population_size(evo_specs)-> int:
+    """ Returns the number of dnas to start an evolution with. The [hill] and
+    [anneal] engines evolve a single dna (see [anneal_pop]), so they start
+    with one whatever the [pop_size] spec. """
+    if evo_specs.get("engine", "ga") in ("hill", "anneal"):
+        return 1
+    return evo_specs["pop_size"]
+
+
 def initial_population(dna_tools, dna_len: int, pop_size: int, img)-> tyPop:
     """ Generates a random initial population. """
     # generate dnas
@@ -37,51 +58,161 @@ def population_from_dna(dna_tools, dna: tyDna, pop_size: int,
     return pop
 
 
+def start_scheduler(dna_tools):
+    """ Gives the dna tools a rate scheduler if the [adaptive] evolution spec
+    is set and they do not have one yet. """
+    if dna_tools.specs.get("adaptive", False) and dna_tools.scheduler is None:
+        dna_tools.scheduler = schedule.RateScheduler(dna_tools)
+
+
+def start_telemetry(dna_tools, telemetry):
+    """ Lets [telemetry] (a Telemetry or None) collect the timings of the dna
+    tools. """
+    dna_tools.telemetry = telemetry
+    if hasattr(dna_tools, "dict_tools"):
+        dna_tools.dict_tools.telemetry = telemetry
+
+
+def start_writer(dna_tools)-> snapshots.SnapshotWriter:
+    """ Returns a writer that draws dnas to the [steps_dir] evolution spec,
+    with at most [steps_queue] drawings waiting (see snapshots.py). """
+    specs = dna_tools.specs
+    return snapshots.SnapshotWriter(dna_tools.dna_to_image,
+                                    specs.get("steps_dir", "."),
+                                    specs.get("steps_queue", 4))
+
+
 def evolve_pop_step(pop: tyPop, dna_tools, img)-> Tuple[tyPop, int]:
     """ Generates an offspring by combining two genes from the population and
     mutating it. The resulting element has to compete to earn a place in the
     population. Also returns the score of new element. """
+    start = time.perf_counter()
     # combine
-    _, dna1 = random.choice(pop)
-    _, dna2 = random.choice(pop)
+    _, dna1 = dna_tools.rng.choice(pop)
+    _, dna2 = dna_tools.rng.choice(pop)
     mut_dna = dna_tools.combine_dna(dna1, dna2)
 
     # mutate
     mut_dna = dna_tools.mutate_dna(mut_dna)
+    mutated = time.perf_counter()
 
     # compete
-    score = dna_tools.evaluate_dna(mut_dna, img)
-    competitor = random.randint(0, len(pop)-1)
+    incremental = dna_tools.specs.get("incremental", False)
+    prefix_cache = dna_tools.specs.get("prefix_cache", False)
+    if prefix_cache:
+        score, resume = dna_tools.evaluate_dna_prefix(mut_dna, dna1, img)
+    elif incremental:
+        score, dna_img = dna_tools.evaluate_dna_incremental(mut_dna, dna1, img)
+    else:
+        score = dna_tools.evaluate_dna(mut_dna, img)
+    evaluated = time.perf_counter()
+    competitor = dna_tools.rng.randint(0, len(pop)-1)
     if score < pop[competitor][0]:
+        if prefix_cache:
+            dna_tools.forget_prefixes(pop[competitor][1])
+            dna_tools.remember_prefixes(mut_dna, resume)
+        elif incremental:
+            dna_tools.forget_render(pop[competitor][1])
+            dna_tools.remember_render(mut_dna, score, dna_img)
         pop[competitor] = (score, mut_dna)
+        accepted = True
+    else:
+        accepted = False
+
+    if dna_tools.scheduler:
+        dna_tools.scheduler.record(accepted)
+    if dna_tools.telemetry:
+        dna_tools.telemetry.record(accepted, mutated - start,
+                                   evaluated - mutated)
 
     return pop, score
 
 
-def evolve_pop(pop: tyPop, dna_tools, img, steps,
-               steps_start=0, generate_steps=True, report=100000)-> tyPop:
+def evolve_pop_batch_step(pop: tyPop, dna_tools, img, batch: int,
+                          evaluate)-> Tuple[tyPop, int]:
+    """ Generates [batch] offspring like [evolve_pop_step], scores all of them
+    at once with [evaluate] (a function from a list of dnas to their scores)
+    and then lets them compete in order. Also returns the best new score. """
+    start = time.perf_counter()
+    mut_dnas = []
+    for _ in range(batch):
+        _, dna1 = dna_tools.rng.choice(pop)
+        _, dna2 = dna_tools.rng.choice(pop)
+        mut_dna = dna_tools.combine_dna(dna1, dna2)
+        mut_dnas.append(dna_tools.mutate_dna(mut_dna))
+    mutated = time.perf_counter()
+
+    scores = evaluate(mut_dnas)
+    evaluated = time.perf_counter()
+
+    for score, mut_dna in zip(scores, mut_dnas):
+        competitor = dna_tools.rng.randint(0, len(pop)-1)
+        accepted = score < pop[competitor][0]
+        if accepted:
+            pop[competitor] = (score, mut_dna)
+        if dna_tools.scheduler:
+            dna_tools.scheduler.record(accepted)
+        if dna_tools.telemetry:
+            dna_tools.telemetry.record(accepted, (mutated - start) / batch,
+                                       (evaluated - mutated) / batch)
+
+    return pop, min(scores)
+
+
+def evolve_pop(pop: tyPop, dna_tools, img, steps, steps_start=0,
+               generate_steps=True, report=100000, evaluate=None,
+               autosave=None, autosave_every=10000, telemetry=None,
+               stopper=None)-> tyPop:
     """ Evolves the population to fit the image [img] for [steps] iterations.
     If [generate_steps] is enabled, an image is saved whenever a 5% improvement
-    is achieved. The current score is reported every [report] iterations, which
-    is turned off by setting it to a negative number. """
+    is achieved, drawn and saved in the background (see [start_writer]). The
+    current score is reported every [report] iterations, which is turned off
+    by setting it to a negative number. If an [evaluate] function is given,
+    offspring are generated and scored in batches of the [batch_size]
+    evolution spec (see [evolve_pop_batch_step]). If [autosave] is
+    given, it is called with the population and the step counter every
+    [autosave_every] steps. If the [adaptive] evolution spec is set, mutation
+    rates adapt to the share of accepted offspring (see schedule.py). If
+    [telemetry] is given, it emits a record of the evolution every few steps
+    (see telemetry.py). If a [stopper] is given, the evolution ends early as
+    soon as it says so, given the best score per pixel (see stopping.py). """
+    start_scheduler(dna_tools)
+    start_telemetry(dna_tools, telemetry)
 
     # For reporting purposes
     score, dna = min(pop, key=lambda p: p[0])
 
     # Draw initial one
-    if generate_steps:
-        dna_img = dna_tools.dna_to_image(dna)
-        dna_img.save(f"ztep_{steps_start}.png")
+    writer = start_writer(dna_tools) if generate_steps else None
+    if writer:
+        writer.submit(f"ztep_{steps_start}.png", dna)
+
+    batch = dna_tools.specs.get("batch_size", len(pop)) if evaluate else 1
 
     old_score = score  # used to report successful improvements of 5%
-    for i in range(steps_start, steps_start+steps):
-        pop, score = evolve_pop_step(pop, dna_tools, img)
+    pixels = img.width * img.height
+    for i in range(steps_start, steps_start+steps, batch):
+        if stopper and stopper.check(i, min(p[0] for p in pop) / pixels):
+            break
+        k = min(batch, steps_start + steps - i)
+        if evaluate:
+            pop, score = evolve_pop_batch_step(pop, dna_tools, img, k, evaluate)
+        else:
+            pop, score = evolve_pop_step(pop, dna_tools, img)
+
+        if autosave and (i + k) // autosave_every > i // autosave_every:
+            autosave(pop, i + k)
+
+        if telemetry and telemetry.due(i + k, k):
+            # the best dna is only drawn if a sink asks for it
+            _, best = min(pop, key=lambda p: p[0])
+            telemetry.emit(i + k, [p[0] for p in pop],
+                           partial(dna_tools.dna_to_image, best))
 
         # Check if there was enough improvement to generate image
         if generate_steps and (score < old_score*0.95):
             old_score, dna = min(pop, key=lambda p: p[0])
-            dna_img = dna_tools.dna_to_image(dna)
-            dna_img.save("ztep_{}.png".format(i))
+            writer.submit("ztep_{}.png".format(i), dna)
 
             if report > 0:
                 pop_diff = max(pop, key=lambda p: p[0])[0] - score
@@ -89,20 +220,466 @@ def evolve_pop(pop: tyPop, dna_tools, img, steps,
                 print(f"SUCCESS! Step : {i} | Score : {score} " +
                       f"| Population diff: {pop_diff}")
 
-        elif report > 0 and i % report == 0:
+        elif report > 0 and -i % report < batch:
             score, _ = min(pop, key=lambda p: p[0])
             pop_diff = max(pop, key=lambda p: p[0])[0] - score
             print(THIN_SEP)
             print(f"REPORT! Step : {i} | Score : {score}" +
                   f"| Population diff: {pop_diff}")
+            if dna_tools.scheduler:
+                print(f"Mutation scale : {dna_tools.scheduler.scale:.3f}")
 
+    if writer:
+        writer.close()
     return pop
 
 
-def evolve_image(in_path, out_path, steps, gene_specs, evo_specs,
-                 generate_steps=True, report=100000, json_out=None):
+def temperature(dna_tools, step, steps_start, steps)-> float:
+    """ Returns the annealing temperature at [step], relative to the score of
+    the current dna. It falls geometrically from the [anneal_start] to the
+    [anneal_end] evolution spec over the steps. The hill climbing engine
+    always has temperature 0. """
+    specs = dna_tools.specs
+    if specs.get("engine", "ga") != "anneal":
+        return 0
+    high = specs.get("anneal_start", 1e-3)
+    low = specs.get("anneal_end", 1e-6)
+    return high * (low / high) ** ((step - steps_start) / max(1, steps))
+
+
+def anneal_step(current, dna_tools, img, temp: float):
+    """ Mutates the current (score, dna) and returns the one that the lineage
+    continues with. A worse offspring is accepted with the probability
+    exp(-increase / (temp * score)), so only better ones at temperature 0.
+    Also returns the score of the offspring. """
+    start = time.perf_counter()
+    score, dna = current
+    mut_dna = dna_tools.mutate_dna(dna)
+    mutated = time.perf_counter()
+
+    incremental = dna_tools.specs.get("incremental", False)
+    prefix_cache = dna_tools.specs.get("prefix_cache", False)
+    if prefix_cache:
+        mut_score, resume = dna_tools.evaluate_dna_prefix(mut_dna, dna, img)
+    elif incremental:
+        mut_score, dna_img = dna_tools.evaluate_dna_incremental(mut_dna, dna,
+                                                                img)
+    else:
+        mut_score = dna_tools.evaluate_dna(mut_dna, img)
+    evaluated = time.perf_counter()
+
+    if mut_score < score:
+        accepted = True
+    elif temp > 0 and score > 0:
+        increase = (mut_score - score) / (temp * score)
+        accepted = dna_tools.rng.random() < np.exp(-increase)
+    else:
+        accepted = False
+
+    if accepted:
+        if prefix_cache:
+            dna_tools.forget_prefixes(dna)
+            dna_tools.remember_prefixes(mut_dna, resume)
+        elif incremental:
+            dna_tools.forget_render(dna)
+            dna_tools.remember_render(mut_dna, mut_score, dna_img)
+        current = (mut_score, mut_dna)
+
+    if dna_tools.scheduler:
+        dna_tools.scheduler.record(accepted)
+    if dna_tools.telemetry:
+        dna_tools.telemetry.record(accepted, mutated - start,
+                                   evaluated - mutated)
+
+    return current, mut_score
+
+
+def anneal_pop(pop: tyPop, dna_tools, img, steps, steps_start=0,
+               generate_steps=True, report=100000, autosave=None,
+               autosave_every=10000, telemetry=None, stopper=None)-> tyPop:
+    """ Alternative to [evolve_pop] for the [hill] and [anneal] engines. Only
+    the best member of the population evolves, as a single lineage of
+    mutations (see [anneal_step]), so a population of one is enough (see
+    [population_size]). The best dna found takes the place of that member in
+    the returned population. The other arguments are the same as for
+    [evolve_pop]. """
+    start_scheduler(dna_tools)
+    start_telemetry(dna_tools, telemetry)
+    pop = list(pop)
+    place = min(range(len(pop)), key=lambda k: pop[k][0])
+    current = best = pop[place]
+
+    writer = start_writer(dna_tools) if generate_steps else None
+    if writer:
+        writer.submit(f"ztep_{steps_start}.png", best[1])
+
+    old_score = best[0]  # used to report successful improvements of 5%
+    pixels = img.width * img.height
+    for i in range(steps_start, steps_start+steps):
+        if stopper and stopper.check(i, best[0] / pixels):
+            break
+        temp = temperature(dna_tools, i, steps_start, steps)
+        current, score = anneal_step(current, dna_tools, img, temp)
+        if current[0] < best[0]:
+            best = current
+            pop[place] = best
+
+        if autosave and (i + 1) % autosave_every == 0:
+            autosave(pop, i + 1)
+
+        if telemetry and telemetry.due(i + 1, 1):
+            telemetry.emit(i + 1, [current[0]] + [p[0] for p in pop],
+                           partial(dna_tools.dna_to_image, best[1]))
+
+        # Check if there was enough improvement to generate image
+        if generate_steps and (best[0] < old_score*0.95):
+            old_score = best[0]
+            writer.submit("ztep_{}.png".format(i), best[1])
+
+            if report > 0:
+                print(THIN_SEP)
+                print(f"SUCCESS! Step : {i} | Score : {best[0]} " +
+                      f"| Temperature: {temp:.2e}")
+
+        elif report > 0 and i % report == 0:
+            print(THIN_SEP)
+            print(f"REPORT! Step : {i} | Score : {best[0]}" +
+                  f"| Current: {current[0]} | Temperature: {temp:.2e}")
+            if dna_tools.scheduler:
+                print(f"Mutation scale : {dna_tools.scheduler.scale:.3f}")
+
+    if writer:
+        writer.close()
+    return pop
+
+
+def initial_array_population(dna_tools, dna_len: int, pop_size: int, img):
+    """ Generates a random initial population of array dnas. """
+    dnas = dna_tools.random_dnas(pop_size, dna_len)
+    scores = np.array([dna_tools.evaluate_dna(dna, img) for dna in dnas])
+    return scores, dnas
+
+
+def array_population_from_dna(dna_tools, dna: tyDna, pop_size: int,
+                              num_of_mutations: int, img):
+    """ Uses a dna to generate a population of array dnas by mutating. """
+    dnas = dna_tools.from_dicts([dna]*pop_size)
+    mut_dnas = dnas[1:]  # the original is always part of population
+    for _ in range(num_of_mutations):
+        mut_dnas = dna_tools.mutate_dna(mut_dnas)
+    dnas[1:] = mut_dnas
+    scores = np.array([dna_tools.evaluate_dna(dna, img) for dna in dnas])
+    return scores, dnas
+
+
+def evolve_array_pop_step(pop, dna_tools, img, batch: int, evaluate=None):
+    """ Array version of [evolve_pop_step]. Generates [batch] offspring at
+    once, which then compete in order for a place in the population. Returns
+    the scores of the offspring. The offspring are scored by [evaluate] if
+    given (a function from a list of dnas to their scores). """
+    scores, dnas = pop
+    rng = dna_tools.rng
+
+    # combine and mutate
+    start = time.perf_counter()
+    parents = rng.integers(0, len(dnas), size=(batch, 2))
+    mut_dnas = dna_tools.combine_dna(dnas[parents[:, 0]], dnas[parents[:, 1]])
+    mut_dnas = dna_tools.mutate_dna(mut_dnas)
+    mutated = time.perf_counter()
+
+    # compete
+    if evaluate:
+        mut_scores = np.array(evaluate(list(mut_dnas)))
+    else:
+        mut_scores = np.array(
+            [dna_tools.evaluate_dna(dna, img) for dna in mut_dnas])
+    evaluated = time.perf_counter()
+    competitors = rng.integers(0, len(dnas), size=batch)
+    for k, competitor in enumerate(competitors):
+        accepted = mut_scores[k] < scores[competitor]
+        if accepted:
+            scores[competitor] = mut_scores[k]
+            dnas[competitor] = mut_dnas[k]
+        if dna_tools.scheduler:
+            dna_tools.scheduler.record(accepted)
+        if dna_tools.telemetry:
+            dna_tools.telemetry.record(accepted, (mutated - start) / batch,
+                                       (evaluated - mutated) / batch)
+
+    return pop, mut_scores
+
+
+def evolve_array_pop(pop, dna_tools, img, steps, steps_start=0,
+                     generate_steps=True, report=100000, evaluate=None,
+                     autosave=None, autosave_every=10000, telemetry=None,
+                     stopper=None):
+    """ Array version of [evolve_pop], every offspring counts as a step. The
+    batch size is set by the [batch_size] evolution spec. """
+    start_scheduler(dna_tools)
+    start_telemetry(dna_tools, telemetry)
+    scores, dnas = pop
+    batch = dna_tools.specs.get("batch_size", len(dnas))
+
+    # For reporting purposes
+    best = np.argmin(scores)
+
+    # Draw initial one, array dnas change in place so copies are drawn
+    writer = start_writer(dna_tools) if generate_steps else None
+    if writer:
+        writer.submit(f"ztep_{steps_start}.png", dnas[best].copy())
+
+    old_score = scores[best]  # used to report successful improvements of 5%
+    pixels = img.width * img.height
+    i, end = steps_start, steps_start+steps
+    while i < end:
+        if stopper and stopper.check(i, scores.min() / pixels):
+            break
+        k = min(batch, end - i)
+        pop, mut_scores = evolve_array_pop_step(pop, dna_tools, img, k,
+                                                evaluate)
+        score = mut_scores.min()
+        i += k
+
+        if autosave and i // autosave_every > (i - k) // autosave_every:
+            autosave(pop, i)
+
+        if telemetry and telemetry.due(i, k):
+            # a copy, as the dnas change in place before it may be drawn
+            best_dna = dnas[np.argmin(scores)].copy()
+            telemetry.emit(i, scores,
+                           partial(dna_tools.dna_to_image, best_dna))
+
+        # Check if there was enough improvement to generate image
+        if generate_steps and (score < old_score*0.95):
+            best = np.argmin(scores)
+            old_score = scores[best]
+            writer.submit("ztep_{}.png".format(i), dnas[best].copy())
+
+            if report > 0:
+                pop_diff = scores.max() - score
+                print(THIN_SEP)
+                print(f"SUCCESS! Step : {i} | Score : {score} " +
+                      f"| Population diff: {pop_diff}")
+
+        elif report > 0 and -(i - k) % report < k:
+            score = scores.min()
+            pop_diff = scores.max() - score
+            print(THIN_SEP)
+            print(f"REPORT! Step : {i} | Score : {score}" +
+                  f"| Population diff: {pop_diff}")
+            if dna_tools.scheduler:
+                print(f"Mutation scale : {dna_tools.scheduler.scale:.3f}")
+
+    if writer:
+        writer.close()
+    return pop
+
+
+def evolve_any_pop(pop, dna_tools, img, steps, kind, workers=None,
+                   **evolve_kwargs):
+    """ Evolves a population of dict or array dnas, depending on the dna tools.
+    If [workers] is set, offspring are scored in that many processes. The
+    [engine] evolution spec chooses between the genetic algorithm ("ga", the
+    default), hill climbing ("hill") and simulated annealing ("anneal") of
+    dict dnas (see [anneal_pop]), the last two always run in this process. """
+    engine = dna_tools.specs.get("engine", "ga")
+    if engine in ("hill", "anneal"):
+        if isinstance(dna_tools, array_genetics.ArrayDNA):
+            raise Exception(f"Engine `{engine}` requires dict dnas")
+        return anneal_pop(pop, dna_tools, img, steps, **evolve_kwargs)
+    elif engine != "ga":
+        raise Exception(f"Unknown engine `{engine}`")
+
+    if isinstance(dna_tools, array_genetics.ArrayDNA):
+        evolve = evolve_array_pop
+    else:
+        evolve = evolve_pop
+
+    if not workers:
+        return evolve(pop, dna_tools, img, steps, **evolve_kwargs)
+
+    with parallel.ParallelEvaluator(img, workers, kind, dna_tools.genes.specs,
+                                    dna_tools.specs) as evaluate:
+        return evolve(pop, dna_tools, img, steps, evaluate=evaluate,
+                      **evolve_kwargs)
+
+
+def rescore_pop(pop, dna_tools, img):
+    """ Returns the dict or array population scored against [img], used when
+    the metric changes. """
+    if isinstance(dna_tools, array_genetics.ArrayDNA):
+        _, dnas = pop
+        return np.array([dna_tools.evaluate_dna(d, img) for d in dnas]), dnas
+    dna_tools.renders.clear()
+    return [(dna_tools.evaluate_dna(dna, img), dna) for _, dna in pop]
+
+
+def best_dna(pop, dna_tools)-> tyDna:
+    """ Returns the best dna of a dict or array population as dicts. """
+    if isinstance(dna_tools, array_genetics.ArrayDNA):
+        scores, dnas = pop
+        return dna_tools.to_dicts(dnas[np.argmin(scores)])
+    _, dna = min(pop, key=lambda p: p[0])
+    return dna
+
+
+def report_stop(stopper, report):
+    """ Prints why the evolution stopped early, if it did. """
+    if report > 0 and stopper and stopper.reason:
+        print(THIN_SEP)
+        print(f"STOPPED! Step : {stopper.step} | Reason : {stopper.reason}")
+
 
-    img = Image.open(in_path)
+def seed_streams(seed):
+    """ Returns the seeds of the random streams of an evolution, one for dict
+    dnas, one for array dnas and one for the islands (see streams.py). """
+    return streams.spawn(seed, 3)
+
+
+def make_tools(kind, w, h, gene_specs, evo_specs, seed=None):
+    """ Returns the dict dna tools and the tools that evolve the population,
+    which are array dna tools if the [representation] evolution spec is
+    "array". Their random streams come from [seed]. """
+    dict_seed, array_seed, _ = seed_streams(seed)
+    gene_tools = genetics.make_gene_tools(
+        kind, w, h, gene_specs, rng=streams.python_random(dict_seed))
+    dna_tools = genetics.DNA(gene_tools, evo_specs)
+    if evo_specs.get("representation", "dict") == "array":
+        evo_tools = array_genetics.ArrayDNA(
+            gene_tools, evo_specs, rng=streams.numpy_random(array_seed))
+    else:
+        evo_tools = dna_tools
+    return dna_tools, evo_tools
+
+
+# Gene specs that are measured in pixels and shrink with the image
+PIXEL_SPECS = ["mut_p", "mut_r", "max_r", "init_r"]
+
+
+def scale_gene_specs(gene_specs, factor):
+    """ Returns gene specs for an image that is [factor] times smaller. """
+    scaled = dict(gene_specs)
+    for spec in PIXEL_SPECS:
+        if spec in scaled:
+            scaled[spec] = max(1, round(scaled[spec] / factor))
+    return scaled
+
+
+def evolve_resolutions(img: Target, kind, gene_specs, evo_specs, steps,
+                       workers=None, seed=None, generate_steps=True,
+                       report=100000, telemetry=None, stopper=None):
+    """ Evolves a population from coarse to fine. The [resolutions] evolution
+    spec is a list of [factor, share] pairs, where each phase evolves on an
+    image that is [factor] times smaller for the [share] of the steps. The
+    population is upscaled between phases. Returns the final population and
+    its dna tools. The random streams come from [seed] as in [make_tools].
+    A [stopper] can end each phase early, a plateau only ends its phase. """
+    phases = evo_specs["resolutions"]
+    total_share = sum(share for _, share in phases)
+    use_arrays = evo_specs.get("representation", "dict") == "array"
+    dict_seed, array_seed, _ = seed_streams(seed)
+    py_rng = streams.python_random(dict_seed)
+    rng = streams.numpy_random(array_seed)
+
+    pop, dnas, dna_tools, step = None, None, None, 0
+    for k, (factor, share) in enumerate(phases):
+        w, h = max(1, img.width // factor), max(1, img.height // factor)
+        small_img = img.resized(w, h)
+
+        if dnas is not None:
+            dnas = dna_tools.upscale_dnas_and_self(w, dnas)
+
+        gene_tools = genetics.make_gene_tools(
+            kind, w, h, scale_gene_specs(gene_specs, factor), rng=py_rng)
+        if kind == "letter":
+            for spec in ("init_r", "max_r"):
+                gene_tools.specs[spec] = max(gene_tools.FONTMIN,
+                                             gene_tools.specs[spec])
+        if dnas is not None and kind != "polygon":
+            # rounding and the fixed margin of letters may push genes over the
+            # limits of the scaled specs
+            limit = gene_tools.specs["init_r" if kind == "letter" else "max_r"]
+            low = -20 if kind == "letter" else 0
+
+            def fit(gene):
+                x, y = gene["point"]
+                point = (min(max(low, x), w), min(max(low, y), h))
+                return dict(gene, point=point, r=min(gene["r"], limit))
+            dnas = [[fit(g) for g in dna] for dna in dnas]
+
+        dna_tools = genetics.DNA(gene_tools, evo_specs)
+        if use_arrays:
+            evo_tools = array_genetics.ArrayDNA(gene_tools, evo_specs, rng=rng)
+        else:
+            evo_tools = dna_tools
+
+        # initialize or rescore population
+        if dnas is None and use_arrays:
+            pop = initial_array_population(evo_tools, evo_specs["dna_len"],
+                                           population_size(evo_specs),
+                                           small_img)
+        elif dnas is None:
+            pop = initial_population(dna_tools, evo_specs["dna_len"],
+                                     population_size(evo_specs), small_img)
+        elif use_arrays:
+            arr = evo_tools.from_dicts(dnas)
+            scores = np.array([evo_tools.evaluate_dna(d, small_img)
+                               for d in arr])
+            pop = (scores, arr)
+        else:
+            pop = [(dna_tools.evaluate_dna(d, small_img), d) for d in dnas]
+
+        # the last phase gets the steps lost to rounding
+        if k == len(phases) - 1:
+            phase_steps = steps - step
+        else:
+            phase_steps = int(steps * share / total_share)
+
+        if report > 0:
+            print(THIN_SEP)
+            print(f"RESOLUTION! Step : {step} | Size : {w} x {h}")
+        if stopper:
+            stopper.restart()
+        pop = evolve_any_pop(pop, evo_tools, small_img, phase_steps, kind,
+                             workers=workers, steps_start=step,
+                             generate_steps=generate_steps, report=report,
+                             telemetry=telemetry, stopper=stopper)
+        step += phase_steps
+
+        if use_arrays:
+            dnas = [evo_tools.to_dicts(d) for d in pop[1]]
+        else:
+            dnas = [d for _, d in pop]
+
+    return pop, evo_tools
+
+
+def evolve_image(in_path, out_path, steps, gene_specs, evo_specs,
+                 generate_steps=True, report=100000, json_out=None,
+                 workers=None, seed=None, checkpoint_out=None,
+                 autosave_every=10000, telemetry=None):
+    """ Evolves a population to fit the image at [in_path] and saves the best
+    drawing to [out_path]. Offspring are scored in parallel if [workers] is
+    set. A [seed] (an int or a numpy Generator) makes the evolution
+    reproducible, the populations, islands and array dnas get independent
+    random streams spawned from it (see streams.py). If the [islands]
+    evolution spec is above 1, that many populations evolve in separate
+    processes instead (see islands.py). If the [resolutions] evolution spec
+    is set, the evolution goes from coarse to fine (see [evolve_resolutions]).
+    The [metric], [metric_scale] and [metric_weights] evolution specs choose
+    how drawings are scored (see target.py). With a [metric_scale] proxy, the
+    last [exact_share] of the steps are scored at full resolution. The whole
+    population is saved to the binary [checkpoint_out] at the end and
+    every [autosave_every] steps, see [resume_evolution]. A [telemetry]
+    (see telemetry.py) receives records of the evolution, except for
+    islands. The [stop_seconds], [stop_score] (the score divided by the
+    number of pixels), [stop_window] and [stop_epsilon] evolution specs can
+    end the evolution before [steps] (see stopping.py), except for islands,
+    which migrate in lockstep. The results are then saved at the step where
+    it stopped. """
+    seed = streams.seed_sequence(seed)
+
+    img = target_from_specs(Image.open(in_path), evo_specs)
     w, h = img.width, img.height
 
     required = ["kind", "dna_len", "pop_size"]
@@ -111,37 +688,86 @@ def evolve_image(in_path, out_path, steps, gene_specs, evo_specs,
 
     # initialize gene and dna tools
     kind = evo_specs["kind"]
-    if kind == "polygon":
-        gene_tools = genetics.PolygonGene(w, h, gene_specs)
-    elif kind == "letter":
-        gene_tools = genetics.LetterGene(w, h, gene_specs)
-    else:
-        gene_tools = genetics.CircleGene(w, h, gene_specs)
+    dna_tools, evo_tools = make_tools(kind, w, h, gene_specs, evo_specs,
+                                      seed)
+    use_arrays = evo_tools is not dna_tools
+
+    meta = {"width": w, "height": h, "kind": kind, "gene_specs": gene_specs,
+            "evo_specs": evo_specs}
+    autosave = None
+    if checkpoint_out:
+        def autosave(pop, step):
+            checkpoint.save_checkpoint(checkpoint_out, pop, evo_tools, step,
+                                       meta)
+    stopper = stopping.stopper_from_specs(evo_specs)
 
-    dna_tools = genetics.DNA(gene_tools, evo_specs)
-
-    # initialize population
-    dna_len, pop_size = evo_specs["dna_len"], evo_specs["pop_size"]
-    pop = initial_population(dna_tools, dna_len, pop_size, img)
-
-    # evolve
     if report > 0:
         print(THICK_SEP)
         print(f"Starting evolution for {steps} steps!")
         print(THICK_SEP)
-    pop = evolve_pop(pop, dna_tools, img, steps,
-                     generate_steps=generate_steps, report=report)
+
+    island_pops = None
+    if evo_specs.get("islands", 1) > 1:
+        island_pops = islands.evolve_islands(in_path, kind, gene_specs,
+                                             evo_specs, steps,
+                                             seed=seed_streams(seed)[2],
+                                             report=report)
+        pop = [member for p in island_pops.values() for member in p]
+        dna = best_dna(pop, dna_tools)
+    elif evo_specs.get("resolutions"):
+        pop, evo_tools = evolve_resolutions(
+            img, kind, gene_specs, evo_specs, steps, workers=workers,
+            seed=seed, generate_steps=generate_steps, report=report,
+            telemetry=telemetry, stopper=stopper)
+        dna = best_dna(pop, evo_tools)
+    else:
+        # initialize population
+        dna_len, pop_size = evo_specs["dna_len"], population_size(evo_specs)
+        if use_arrays:
+            pop = initial_array_population(evo_tools, dna_len, pop_size, img)
+        else:
+            pop = initial_population(dna_tools, dna_len, pop_size, img)
+
+        # evolve, the last [exact_share] of the steps without the proxy metric
+        exact_img = img.exact()
+        exact_steps = 0
+        if exact_img is not img:
+            exact_steps = round(steps * evo_specs.get("exact_share", 0))
+        pop = evolve_any_pop(pop, evo_tools, img, steps - exact_steps, kind,
+                             workers=workers, generate_steps=generate_steps,
+                             report=report, autosave=autosave,
+                             autosave_every=autosave_every,
+                             telemetry=telemetry, stopper=stopper)
+        if exact_steps:
+            pop = rescore_pop(pop, evo_tools, exact_img)
+            if stopper:
+                stopper.restart()
+            pop = evolve_any_pop(pop, evo_tools, exact_img, exact_steps, kind,
+                                 workers=workers,
+                                 steps_start=steps - exact_steps,
+                                 generate_steps=generate_steps, report=report,
+                                 autosave=autosave,
+                                 autosave_every=autosave_every,
+                                 telemetry=telemetry, stopper=stopper)
+        dna = best_dna(pop, evo_tools)
+
+    report_stop(stopper, report)
+    steps = stopping.final_step(stopper, steps)
 
     # save best one
-    _, dna = min(pop, key=lambda p: p[0])
     dna_img = dna_tools.dna_to_image(dna)
     dna_img.save(out_path)
 
+    if checkpoint_out and island_pops is None:
+        checkpoint.save_checkpoint(checkpoint_out, pop, evo_tools, steps, meta)
+
     # save best dna to json to allow continuation or upscaling
     if json_out:
         full_specs = {"width": w, "height": h, "kind": kind, "steps": steps,
                       "gene_specs": gene_specs, "evo_specs": evo_specs,
                       "dna": dna}
+        if island_pops:
+            full_specs["islands"] = islands.islands_to_json(island_pops)
         with open(json_out, 'w') as jfile:
             jfile.write(json.dumps(full_specs))
 
@@ -149,9 +775,14 @@ def evolve_image(in_path, out_path, steps, gene_specs, evo_specs,
 
 
 def continue_evolution(in_path, out_path, json_in, steps, reseed_mutations=5,
-                       generate_steps=True, report=100000, json_out=None):
-    img = Image.open(in_path)
-    w, h = img.width, img.height
+                       generate_steps=True, report=100000, json_out=None,
+                       workers=None, seed=None, checkpoint_out=None,
+                       autosave_every=10000, telemetry=None):
+    """ Continues the evolution stored in [json_in] by reseeding a population
+    from its dna. See [evolve_image] for the other arguments. Islands resume
+    from their saved populations. The evolution always continues at full
+    resolution. """
+    seed = streams.seed_sequence(seed)
 
     with open(json_in, "r") as jfile:
         text = jfile.read()
@@ -162,34 +793,148 @@ def continue_evolution(in_path, out_path, json_in, steps, reseed_mutations=5,
     kind, gene_specs = data["kind"], data["gene_specs"]
 
     # initialize gene and dna tools
-    if kind == "polygon":
-        gene_tools = genetics.PolygonGene(w, h, gene_specs)
-    elif kind == "letter":
-        gene_tools = genetics.LetterGene(w, h, gene_specs)
+    evo_specs = data["evo_specs"]
+    img = target_from_specs(Image.open(in_path), evo_specs)
+    dna_tools, evo_tools = make_tools(kind, w, h, gene_specs, evo_specs,
+                                      seed)
+    use_arrays = evo_tools is not dna_tools
+
+    meta = {"width": w, "height": h, "kind": kind, "gene_specs": gene_specs,
+            "evo_specs": evo_specs}
+    autosave = None
+    if checkpoint_out:
+        def autosave(pop, step):
+            checkpoint.save_checkpoint(checkpoint_out, pop, evo_tools, step,
+                                       meta)
+
+    stopper = stopping.stopper_from_specs(evo_specs)
+
+    if report > 0:
+        print(THICK_SEP)
+        print(f"Continuing evolution for {steps} steps!")
+        print(THICK_SEP)
+
+    island_pops = None
+    if evo_specs.get("islands", 1) > 1:
+        # islands without a saved population are reseeded from the best dna
+        saved = islands.islands_from_json(data.get("islands", []))
+        island_pops = islands.evolve_islands(
+            in_path, kind, gene_specs, evo_specs, steps, steps_start=old_steps,
+            populations=saved, seed_dna=data["dna"],
+            reseed_mutations=reseed_mutations, seed=seed_streams(seed)[2],
+            report=report)
+        pop = [member for p in island_pops.values() for member in p]
+        dna = best_dna(pop, dna_tools)
     else:
-        gene_tools = genetics.CircleGene(w, h, gene_specs)
+        # initialize population
+        dna = dna_tools.recover_from_json(data["dna"])
+        pop_size = population_size(evo_specs)
+        if use_arrays:
+            pop = array_population_from_dna(evo_tools, dna, pop_size,
+                                            reseed_mutations, img)
+        else:
+            pop = population_from_dna(dna_tools, dna, pop_size,
+                                      reseed_mutations, img)
+
+        # evolve
+        pop = evolve_any_pop(pop, evo_tools, img, steps, kind, workers=workers,
+                             steps_start=old_steps,
+                             generate_steps=generate_steps, report=report,
+                             autosave=autosave, autosave_every=autosave_every,
+                             telemetry=telemetry, stopper=stopper)
+        dna = best_dna(pop, evo_tools)
+
+    report_stop(stopper, report)
+    steps = stopping.final_step(stopper, old_steps+steps) - old_steps
 
-    evo_specs = data["evo_specs"]
-    dna_tools = genetics.DNA(gene_tools, evo_specs)
+    # save best one
+    dna_img = dna_tools.dna_to_image(dna)
+    dna_img.save(out_path)
 
-    # initialize population
-    dna = dna_tools.recover_from_json(data["dna"])
-    pop_size = evo_specs["pop_size"]
-    pop = population_from_dna(dna_tools, dna, pop_size, reseed_mutations, img)
+    if checkpoint_out and island_pops is None:
+        checkpoint.save_checkpoint(checkpoint_out, pop, evo_tools,
+                                   old_steps+steps, meta)
+
+    if json_out:
+        full_specs = {"width": w, "height": h, "kind": kind,
+                      "steps": old_steps+steps, "gene_specs": gene_specs,
+                      "evo_specs": evo_specs, "dna": dna}
+        if island_pops:
+            full_specs["islands"] = islands.islands_to_json(island_pops)
+        with open(json_out, 'w') as jfile:
+            jfile.write(json.dumps(full_specs))
+
+    return
+
+
+def resume_evolution(in_path, out_path, checkpoint_in, steps,
+                     generate_steps=True, report=100000, json_out=None,
+                     workers=None, checkpoint_out=None, autosave_every=10000,
+                     telemetry=None):
+    """ Continues the evolution stored in the binary [checkpoint_in] exactly
+    where it stopped, with the same population, scores and random state. See
+    [evolve_image] for the other arguments. """
+    meta, scores, dnas = checkpoint.load_checkpoint(checkpoint_in)
+    old_steps = meta["step"]
+    w, h = meta["width"], meta["height"]
+    kind, gene_specs = meta["kind"], meta["gene_specs"]
+    evo_specs = meta["evo_specs"]
+    img = target_from_specs(Image.open(in_path), evo_specs)
+
+    # initialize gene and dna tools
+    py_rng = random.Random()
+    py_rng.setstate(meta["py_random"])
+    gene_tools = genetics.make_gene_tools(kind, w, h, gene_specs, rng=py_rng)
+    dna_tools = genetics.DNA(gene_tools, evo_specs)
+    rng = np.random.default_rng()
+    if "np_random" in meta:
+        rng.bit_generator.state = meta["np_random"]
+    array_tools = array_genetics.ArrayDNA(gene_tools, evo_specs, rng=rng)
+
+    # restore population
+    if evo_specs.get("representation", "dict") == "array":
+        evo_tools = array_tools
+        pop = (scores, dnas)
+    else:
+        evo_tools = dna_tools
+        pop = [(score, array_tools.to_dicts(dna))
+               for score, dna in zip(scores.tolist(), dnas)]
+    if "scheduler" in meta:
+        evo_tools.scheduler = schedule.RateScheduler(evo_tools)
+        evo_tools.scheduler.set_state(meta["scheduler"])
+
+    meta = {k: meta[k] for k in ("width", "height", "kind", "gene_specs",
+                                 "evo_specs")}
+    autosave = None
+    if checkpoint_out:
+        def autosave(pop, step):
+            checkpoint.save_checkpoint(checkpoint_out, pop, evo_tools, step,
+                                       meta)
 
     # evolve
+    stopper = stopping.stopper_from_specs(evo_specs)
     if report > 0:
         print(THICK_SEP)
-        print(f"Continuing evolution for {steps} steps!")
+        print(f"Resuming evolution at step {old_steps} for {steps} steps!")
         print(THICK_SEP)
-    pop = evolve_pop(pop, dna_tools, img, steps, steps_start=old_steps,
-                     generate_steps=generate_steps, report=report)
+    pop = evolve_any_pop(pop, evo_tools, img, steps, kind, workers=workers,
+                         steps_start=old_steps, generate_steps=generate_steps,
+                         report=report, autosave=autosave,
+                         autosave_every=autosave_every, telemetry=telemetry,
+                         stopper=stopper)
+    dna = best_dna(pop, evo_tools)
+
+    report_stop(stopper, report)
+    steps = stopping.final_step(stopper, old_steps+steps) - old_steps
 
     # save best one
-    _, dna = min(pop, key=lambda p: p[0])
     dna_img = dna_tools.dna_to_image(dna)
     dna_img.save(out_path)
 
+    if checkpoint_out:
+        checkpoint.save_checkpoint(checkpoint_out, pop, evo_tools,
+                                   old_steps+steps, meta)
+
     if json_out:
         full_specs = {"width": w, "height": h, "kind": kind,
                       "steps": old_steps+steps, "gene_specs": gene_specs,
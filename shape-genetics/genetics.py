@@ -1,10 +1,16 @@
 import random
+import spatial
+import threading
+import time
+from collections import OrderedDict
+from target import as_target
 from typing import List, Tuple
-from PIL import Image, ImageDraw, ImageChops, ImageFont, ImageStat
+from PIL import Image, ImageDraw, ImageFont
 
 tyGene = dict
 tyDna = List[tyGene]
 tyPop = List[Tuple[int, tyDna]]
+tyBox = Tuple[int, int, int, int]
 
 # =============================================================================
 # Just a quick template, since python lacks types
@@ -12,6 +18,9 @@ tyPop = List[Tuple[int, tyDna]]
 
 class GeneKind:
 
+    # random stream of the genes, the global one unless set (see streams.py)
+    rng = random
+
     def __init__(self, w, h, gene_specs):
         """ Sets the parameters of the gene creating class. """
         self.w, self.h, self.specs = w, h, gene_specs
@@ -33,6 +42,11 @@ class GeneKind:
         """ Draws the gene onto the image. """
         return
 
+    def bbox_gene(self, gene: tyGene)-> tyBox:
+        """ Returns a box (left, top, right, bottom) containing every pixel the
+        gene can paint. """
+        return (0, 0, self.w, self.h)
+
     def recover_from_json(self, gene):
         """ Fixes the types after being read from json. """
 
@@ -57,9 +71,9 @@ class CircleGene(GeneKind):
 
     def random_gene(self)-> tyGene:
         """ Returns a random gene. """
-        point = random.randint(0, self.w), random.randint(0, self.h)
+        point = self.rng.randint(0, self.w), self.rng.randint(0, self.h)
         r = self.specs["init_r"]
-        color = tuple([random.randint(0, 256) for _ in range(4)])
+        color = tuple([self.rng.randint(0, 256) for _ in range(4)])
         return {"point": point, "r": r, "color": color}
 
     def mutate_gene(self, ratio, gene: tyGene)-> tyGene:
@@ -71,26 +85,27 @@ class CircleGene(GeneKind):
         mut_p, mut_r, mut_c = specs["mut_p"], specs["mut_r"], specs["mut_c"]
 
         # Position
-        if random.random() < ratio:
+        if self.rng.random() < ratio:
             x, y = gene["point"]
             x_low, x_high = max(0, x - mut_p), min(self.w, x + mut_p)
             y_low, y_high = max(0, y - mut_p), min(self.h, y + mut_p)
-            p = random.randint(x_low, x_high), random.randint(y_low, y_high)
+            p = (self.rng.randint(x_low, x_high),
+                 self.rng.randint(y_low, y_high))
             mut_gene["point"] = p
 
         # Size
-        if random.random() < ratio:
+        if self.rng.random() < ratio:
             low = max(0, gene["r"] - mut_r)
             high = min(self.specs["max_r"], gene["r"] + mut_r)
-            mut_gene["r"] = random.randint(low, high)
+            mut_gene["r"] = self.rng.randint(low, high)
 
         # Color
-        if random.random() < ratio:
+        if self.rng.random() < ratio:
             r, g, b, a = gene["color"]
-            m_r = random.randint(max(0, r - mut_c), min(255, r + mut_c))
-            m_g = random.randint(max(0, g - mut_c), min(255, g + mut_c))
-            m_b = random.randint(max(0, b - mut_c), min(255, b + mut_c))
-            m_a = random.randint(max(0, a - mut_c), min(255, a + mut_c))
+            m_r = self.rng.randint(max(0, r - mut_c), min(255, r + mut_c))
+            m_g = self.rng.randint(max(0, g - mut_c), min(255, g + mut_c))
+            m_b = self.rng.randint(max(0, b - mut_c), min(255, b + mut_c))
+            m_a = self.rng.randint(max(0, a - mut_c), min(255, a + mut_c))
             mut_gene["color"] = (m_r, m_g, m_b, m_a)
 
         return mut_gene
@@ -98,7 +113,7 @@ class CircleGene(GeneKind):
     def combine_genes(self, gene1: tyGene, gene2: tyGene, ratio)-> tyGene:
         """ Returns a new gene, that is a combination of gene1 and gene2. """
         def combiner(x1, x2):
-            return (x1 if random.random() < ratio else x2)
+            return (x1 if self.rng.random() < ratio else x2)
         return {k: combiner(gene1[k], gene2[k]) for k in gene1.keys()}
 
     def draw_gene(self, draw, gene: tyGene):
@@ -109,6 +124,13 @@ class CircleGene(GeneKind):
         draw.ellipse([x-r, y-r, x+r, y+r], fill=color)
         return
 
+    def bbox_gene(self, gene: tyGene)-> tyBox:
+        """ Returns a box (left, top, right, bottom) containing every pixel the
+        gene can paint. """
+        x, y = gene["point"]
+        r = gene["r"]
+        return (x-r-1, y-r-1, x+r+2, y+r+2)
+
     def recover_from_json(self, gene):
         """ Fixes the types after being read from json. """
         fixed_gene = {}
@@ -143,11 +165,12 @@ class PolygonGene(GeneKind):
 
     def random_gene(self):
         """ Returns a random gene. """
-        n = random.randint(3, self.specs["max_n"])
+        n = self.rng.randint(3, self.specs["max_n"])
         r = self.specs["init_r"]
 
         # Limit points to a circle for better initial seeding
-        (c_x, c_y) = (random.randint(0, self.w), random.randint(0, self.h))
+        (c_x, c_y) = (self.rng.randint(0, self.w),
+                      self.rng.randint(0, self.h))
 
         def acceptable(p):
             return ((c_x-p[0])**2 + (c_y-p[1])**2)**0.5 <= r
@@ -155,11 +178,11 @@ class PolygonGene(GeneKind):
         def make_point():
             p = None
             while p is None or not acceptable(p):
-                p = (random.randint(0, self.w), random.randint(0, self.h))
+                p = (self.rng.randint(0, self.w), self.rng.randint(0, self.h))
             return p
 
         points = [make_point() for _ in range(n)]
-        color = tuple([random.randint(0, 256) for _ in range(4)])
+        color = tuple([self.rng.randint(0, 256) for _ in range(4)])
         return {"points": points, "color": color}
 
     def mutate_gene(self, ratio, gene: tyGene)-> tyGene:
@@ -172,33 +195,35 @@ class PolygonGene(GeneKind):
         max_n = specs["max_n"]
 
         # Add or remove point
-        if random.random() < ratio and random.random() < mut_n:
+        if self.rng.random() < ratio and self.rng.random() < mut_n:
             points = mut_gene["points"].copy()
-            add_point = random.random() < 0.5
+            add_point = self.rng.random() < 0.5
             if add_point and len(points) < max_n:
-                x, y = random.randint(0, self.w), random.randint(0, self.h)
-                points.insert(random.randint(0, len(points)-1), (x, y))
+                x = self.rng.randint(0, self.w)
+                y = self.rng.randint(0, self.h)
+                points.insert(self.rng.randint(0, len(points)-1), (x, y))
             if not add_point and len(points) > 3:
-                points.pop(random.randint(0, len(points)-1))
+                points.pop(self.rng.randint(0, len(points)-1))
+            mut_gene["points"] = points
 
         # Position
-        if random.random() < ratio:
+        if self.rng.random() < ratio:
             points = []
-            for (x, y) in gene["points"]:
+            for (x, y) in mut_gene["points"]:
                 x_low, x_high = max(0, x - mut_p), min(self.w, x + mut_p)
                 y_low, y_high = max(0, y - mut_p), min(self.h, y + mut_p)
-                p = random.randint(
-                    x_low, x_high), random.randint(y_low, y_high)
+                p = self.rng.randint(
+                    x_low, x_high), self.rng.randint(y_low, y_high)
                 points.append(p)
             mut_gene["points"] = points
 
         # Color
-        if random.random() < ratio:
+        if self.rng.random() < ratio:
             r, g, b, a = gene["color"]
-            m_r = random.randint(max(0, r - mut_c), min(255, r + mut_c))
-            m_g = random.randint(max(0, g - mut_c), min(255, g + mut_c))
-            m_b = random.randint(max(0, b - mut_c), min(255, b + mut_c))
-            m_a = random.randint(max(0, a - mut_c), min(255, a + mut_c))
+            m_r = self.rng.randint(max(0, r - mut_c), min(255, r + mut_c))
+            m_g = self.rng.randint(max(0, g - mut_c), min(255, g + mut_c))
+            m_b = self.rng.randint(max(0, b - mut_c), min(255, b + mut_c))
+            m_a = self.rng.randint(max(0, a - mut_c), min(255, a + mut_c))
             mut_gene["color"] = (m_r, m_g, m_b, m_a)
 
         return mut_gene
@@ -206,7 +231,7 @@ class PolygonGene(GeneKind):
     def combine_genes(self, gene1: tyGene, gene2: tyGene, ratio)-> tyGene:
         """ Returns a new gene, that is a combination of gene1 and gene2. """
         def combiner(x1, x2):
-            return (x1 if random.random() < ratio else x2)
+            return (x1 if self.rng.random() < ratio else x2)
         return {k: combiner(gene1[k], gene2[k]) for k in gene1.keys()}
 
     def draw_gene(self, draw, gene: tyGene):
@@ -214,6 +239,13 @@ class PolygonGene(GeneKind):
         draw.polygon(gene["points"], fill=gene["color"])
         return
 
+    def bbox_gene(self, gene: tyGene)-> tyBox:
+        """ Returns a box (left, top, right, bottom) containing every pixel the
+        gene can paint. """
+        xs = [p[0] for p in gene["points"]]
+        ys = [p[1] for p in gene["points"]]
+        return (int(min(xs))-1, int(min(ys))-1, int(max(xs))+2, int(max(ys))+2)
+
     def recover_from_json(self, gene):
         """ Fixes the types after being read from json. """
         fixed_gene = {}
@@ -225,7 +257,7 @@ class PolygonGene(GeneKind):
         """ Returns a new gene with upscaled parameters. """
         f = new_w / self.w
         up_gene = gene.copy()
-        up_gene["points"] = [(p[0]*f, p[1]*f) for p in gene["points"]]
+        up_gene["points"] = [(int(p[0]*f), int(p[1]*f)) for p in gene["points"]]
         return up_gene
 
 # =============================================================================
@@ -251,19 +283,52 @@ class LetterGene(GeneKind):
         self.FONTMIN = 5
         self.FONTMAX = 500
         self.specs["max_r"] = min(self.FONTMAX, self.specs["max_r"])
-        self.fonts = [
-            ImageFont.truetype(font="arial.ttf", size=i) for i in range(
-                self.FONTMIN, self.FONTMAX+1)]
+
+        # fonts are loaded when a size is first used, and rasterized letters
+        # are kept as masks for the [glyph_cache] most recently drawn ones
+        self.font_file = gene_specs.get("font", "arial.ttf")
+        self.fonts = {}
+        self.glyphs = OrderedDict()
+        self.glyph_cache = gene_specs.get("glyph_cache", 4096)
+        # snapshots are drawn on another thread, see snapshots.py
+        self.glyph_lock = threading.Lock()
 
         return
 
+    def font(self, size: int):
+        """ Returns the font of the given size, loading it if needed. """
+        if size not in self.fonts:
+            self.fonts[size] = ImageFont.truetype(font=self.font_file,
+                                                  size=size)
+        return self.fonts[size]
+
+    def glyph(self, letter: str, size: int):
+        """ Returns the mask of a letter and the offset of its top left corner
+        from the anchor point. """
+        key = (letter, size)
+        with self.glyph_lock:
+            if key in self.glyphs:
+                self.glyphs.move_to_end(key)
+                return self.glyphs[key]
+
+            font = self.font(size)
+            left, top, right, bot = font.getbbox(letter, anchor="rs")
+            mask = Image.new("L", (max(1, right-left), max(1, bot-top)), 0)
+            ImageDraw.Draw(mask).text((-left, -top), letter, fill=255,
+                                      anchor="rs", font=font)
+
+            self.glyphs[key] = (mask, (left, top))
+            if len(self.glyphs) > self.glyph_cache:
+                self.glyphs.popitem(last=False)
+            return mask, (left, top)
+
     def random_gene(self):
         """ Returns a random gene. """
-        point = random.randint(-20, self.w), random.randint(-20, self.h)
+        point = self.rng.randint(-20, self.w), self.rng.randint(-20, self.h)
         # Fix init_r to bounds
         r = max(self.FONTMIN, min(self.specs["max_r"], self.specs["init_r"]))
-        color = tuple([random.randint(0, 256) for _ in range(4)])
-        letter = random.choice(self.LETTERS)
+        color = tuple([self.rng.randint(0, 256) for _ in range(4)])
+        letter = self.rng.choice(self.LETTERS)
         return {"point": point, "r": r, "color": color, "letter": letter}
 
     def mutate_gene(self, ratio, gene: tyGene)-> tyGene:
@@ -276,49 +341,56 @@ class LetterGene(GeneKind):
         mut_c, mut_l = specs["mut_c"], specs["mut_l"]
 
         # Position
-        if random.random() < ratio:
+        if self.rng.random() < ratio:
             x, y = gene["point"]
             x_low, x_high = max(-20, x - mut_p), min(self.w, x + mut_p)
             y_low, y_high = max(-20, y - mut_p), min(self.h, y + mut_p)
-            p = random.randint(x_low, x_high), random.randint(y_low, y_high)
+            p = (self.rng.randint(x_low, x_high),
+                 self.rng.randint(y_low, y_high))
             mut_gene["point"] = p
 
         # Size
-        if random.random() < ratio:
+        if self.rng.random() < ratio:
             low = max(self.FONTMIN, gene["r"] - mut_r)
             high = min(self.specs["init_r"], gene["r"] + mut_r)
-            mut_gene["r"] = random.randint(low, high)
+            mut_gene["r"] = self.rng.randint(low, high)
 
         # Color
-        if random.random() < ratio:
+        if self.rng.random() < ratio:
             r, g, b, a = gene["color"]
-            m_r = random.randint(max(0, r - mut_c), min(255, r + mut_c))
-            m_g = random.randint(max(0, g - mut_c), min(255, g + mut_c))
-            m_b = random.randint(max(0, b - mut_c), min(255, b + mut_c))
-            m_a = random.randint(max(0, a - mut_c), min(255, a + mut_c))
+            m_r = self.rng.randint(max(0, r - mut_c), min(255, r + mut_c))
+            m_g = self.rng.randint(max(0, g - mut_c), min(255, g + mut_c))
+            m_b = self.rng.randint(max(0, b - mut_c), min(255, b + mut_c))
+            m_a = self.rng.randint(max(0, a - mut_c), min(255, a + mut_c))
             mut_gene["color"] = (m_r, m_g, m_b, m_a)
 
         # Letter
-        if random.random() < ratio and random.random() < mut_l:
-            mut_gene["letter"] = random.choice(self.LETTERS)
+        if self.rng.random() < ratio and self.rng.random() < mut_l:
+            mut_gene["letter"] = self.rng.choice(self.LETTERS)
 
         return mut_gene
 
     def combine_genes(self, gene1: tyGene, gene2: tyGene, ratio)-> tyGene:
         """ Returns a new gene, that is a combination of gene1 and gene2. """
         def combiner(x1, x2):
-            return (x1 if random.random() < ratio else x2)
+            return (x1 if self.rng.random() < ratio else x2)
         return {k: combiner(gene1[k], gene2[k]) for k in gene1.keys()}
 
     def draw_gene(self, draw, gene: tyGene):
         """ Draws the gene onto the image. """
         x, y = gene["point"]
-        font = self.fonts[gene["r"] - self.FONTMIN]
-        color = gene["color"]
-        letter = gene["letter"]
-        draw.text((x, y), letter, fill=color, anchor="rs", font=font)
+        mask, (left, top) = self.glyph(gene["letter"], gene["r"])
+        draw.bitmap((x+left, y+top), mask, fill=gene["color"])
         return
 
+    def bbox_gene(self, gene: tyGene)-> tyBox:
+        """ Returns a box (left, top, right, bottom) containing every pixel the
+        gene can paint. """
+        x, y = gene["point"]
+        mask, (left, top) = self.glyph(gene["letter"], gene["r"])
+        right, bot = left + mask.width, top + mask.height
+        return (x+left-1, y+top-1, x+right+2, y+bot+2)
+
     def recover_from_json(self, gene):
         """ Fixes the types after being read from json. """
         fixed_gene = {}
@@ -339,6 +411,28 @@ class LetterGene(GeneKind):
 # =============================================================================
 # DNA functions
 
+# Number of dnas an offspring remembers being made from (see [track_changes])
+LINEAGE_DEPTH = 3
+
+
+def keep_same(gene: tyGene, *originals: tyGene)-> tyGene:
+    """ Returns the first of the [originals] equal to [gene], or [gene] if
+    there is none. Genes that come out of a mutation or a crossover unchanged
+    stay shared with the parent, so change detection rarely compares values.
+    """
+    for original in originals:
+        if gene is original or gene == original:
+            return original
+    return gene
+
+
+def changed_genes(dna: tyDna, parent: tyDna)-> List[int]:
+    """ Returns the indices of the genes that differ between the dna and its
+    parent. Shared genes are skipped by identity, the rest compared by value.
+    """
+    return [k for k, (gene, parent_gene) in enumerate(zip(dna, parent))
+            if gene is not parent_gene and gene != parent_gene]
+
 
 class DNA:
 
@@ -350,6 +444,32 @@ class DNA:
 
         self.genes = gene_tools
         self.specs = evo_specs
+        self.scheduler = None  # adapts the specs, see schedule.py
+        self.telemetry = None  # collects timings, see telemetry.py
+
+        # Rendered images of population members, used for incremental scoring
+        self.renders = {}
+        self.scratch = None
+
+        # Spatial indices of population members and of the last offspring,
+        # used to find the genes in a dirty box (see spatial.py)
+        self.grids = {}
+        self.offspring_grid = None
+
+        # Snapshots of partially drawn population members, used for scoring
+        # from the first changed gene on. The images are shared between
+        # members, so they are counted by identity.
+        self.prefixes = OrderedDict()
+        self.snapshot_refs = {}
+
+        # The last dna made by [combine_dna] or [mutate_dna] and the dnas it
+        # was made from, with the indices of the genes that may differ
+        self.lineage = None
+
+    @property
+    def rng(self):
+        """ The random stream of the dnas, shared with the gene tools. """
+        return self.genes.rng
 
     def random_dna(self, dna_len: int)-> tyDna:
         return [self.genes.random_gene() for _ in range(dna_len)]
@@ -357,33 +477,65 @@ class DNA:
     def combine_dna(self, dna1: tyDna, dna2: tyDna)-> tyDna:
         comb_ratio = self.specs["combine_ratio"]
 
-        def combiner(g1, g2):
-            if random.random() < comb_ratio:
-                return self.genes.combine_genes(g1, g2, comb_ratio)
-            else:
-                return g1
-        return [combiner(g1, g2) for g1, g2 in zip(dna1, dna2)]
+        comb_dna, changed = [], []
+        for k, (g1, g2) in enumerate(zip(dna1, dna2)):
+            gene = g1
+            if self.rng.random() < comb_ratio:
+                gene = keep_same(self.genes.combine_genes(g1, g2, comb_ratio),
+                                 g1, g2)
+                if gene is not g1:
+                    changed.append(k)
+            comb_dna.append(gene)
+
+        self.track_changes(comb_dna, dna1, changed)
+        return comb_dna
 
     def mutate_dna(self, dna: tyDna) -> tyDna:
         mutation_ratio = self.specs["gene_mutation_ratio"]
         prop_ratio = self.specs["property_mutation_ratio"]
         switch_ratio = self.specs["gene_switch_ratio"]
 
-        def mutator(gene):
-            if random.random() < mutation_ratio:
-                return self.genes.mutate_gene(prop_ratio, gene)
-            else:
-                return gene
-
-        mut_dna = [mutator(gene) for gene in dna]
-
-        if random.random() < switch_ratio:
-            i = random.randint(0, len(mut_dna)-1)
-            j = random.randint(0, len(mut_dna)-1)
+        mut_dna, changed = [], []
+        for k, gene in enumerate(dna):
+            if self.rng.random() < mutation_ratio:
+                mut_gene = keep_same(self.genes.mutate_gene(prop_ratio, gene),
+                                     gene)
+                if mut_gene is not gene:
+                    changed.append(k)
+                gene = mut_gene
+            mut_dna.append(gene)
+
+        if self.rng.random() < switch_ratio:
+            i = self.rng.randint(0, len(mut_dna)-1)
+            j = self.rng.randint(0, len(mut_dna)-1)
             mut_dna[i], mut_dna[j] = mut_dna[j], mut_dna[i]
+            changed += [i, j]
 
+        self.track_changes(mut_dna, dna, changed)
         return mut_dna
 
+    def track_changes(self, dna: tyDna, source: tyDna, changed):
+        """ Records that [dna] was made from [source] by changing at most the
+        genes with indices [changed]. If [source] is the last dna made, the
+        dnas it was made from are kept as well, so an offspring can be
+        compared with the population member it came from. """
+        sources = [(source, set(changed))]
+        if self.lineage is not None and self.lineage[0] is source:
+            sources += [(older, older_changed | sources[0][1])
+                        for older, older_changed in self.lineage[1]]
+        self.lineage = (dna, sources[:LINEAGE_DEPTH])
+
+    def changes(self, dna: tyDna, parent: tyDna)-> List[int]:
+        """ Returns the indices of the genes that differ between the dna and
+        its parent. If the dna was just made from the parent, only the genes
+        that were mutated or combined are looked at. """
+        if self.lineage is not None and self.lineage[0] is dna:
+            for source, changed in self.lineage[1]:
+                if source is parent:
+                    return [k for k in sorted(changed) if k < len(parent) and
+                            dna[k] is not parent[k] and dna[k] != parent[k]]
+        return changed_genes(dna, parent)
+
     def dna_to_image(self, dna: tyDna):
         # The first gene is the background
         if len(dna) < 1:
@@ -399,9 +551,210 @@ class DNA:
     def evaluate_dna(self, dna: tyDna, img)-> int:
         """Calculates the difference between the image and the DNA drawing."""
         dna_img = self.dna_to_image(dna)
-        diff_img = ImageChops.difference(img, dna_img)
-        stats = ImageStat.Stat(diff_img)
-        return sum(stats.sum)
+        return self.timed_score(as_target(img).score, dna_img)
+
+    def timed_score(self, score, *args):
+        """ Calls the scoring function [score], adding the time it takes to the
+        telemetry (if there is one). """
+        if self.telemetry is None:
+            return score(*args)
+        start = time.perf_counter()
+        result = score(*args)
+        self.telemetry.diff_time += time.perf_counter() - start
+        return result
+
+    def remember_render(self, dna: tyDna, score, dna_img):
+        """ Stores the drawing of a dna, so that its offspring can be scored
+        incrementally. The spatial index of the last scored offspring is kept
+        with it. """
+        self.renders[id(dna)] = (dna, score, dna_img)
+        if self.offspring_grid is not None and self.offspring_grid.dna is dna:
+            self.grids[id(dna)] = self.offspring_grid
+        self.offspring_grid = None
+
+    def forget_render(self, dna: tyDna):
+        """ Drops the stored drawing of a dna (if there is one). """
+        self.renders.pop(id(dna), None)
+        self.grids.pop(id(dna), None)
+
+    def dirty_box(self, dna: tyDna, parent: tyDna):
+        """ Returns the box covering all genes that differ between the dna and
+        its parent, or None if they are the same. """
+        boxes = []
+        for k in self.changes(dna, parent):
+            boxes += [self.genes.bbox_gene(dna[k]),
+                      self.genes.bbox_gene(parent[k])]
+        return self.cover_box(boxes)
+
+    def cover_box(self, boxes):
+        """ Returns the box covering all [boxes], clipped to the canvas, or None
+        if it is empty. """
+        if not boxes:
+            return None
+        l = max(0, min(box[0] for box in boxes))
+        t = max(0, min(box[1] for box in boxes))
+        r = min(self.genes.w, max(box[2] for box in boxes))
+        b = min(self.genes.h, max(box[3] for box in boxes))
+        return (l, t, r, b) if l < r and t < b else None
+
+    def parent_grid(self, parent: tyDna)-> spatial.GeneGrid:
+        """ Returns the spatial index of a population member, building it the
+        first time it is needed. """
+        grid = self.grids.get(id(parent))
+        if grid is None or grid.dna is not parent:
+            grid = spatial.build_grid(parent, self.genes.bbox_gene,
+                                      self.genes.w, self.genes.h,
+                                      self.specs["spatial_index"])
+            self.grids[id(parent)] = grid
+        return grid
+
+    def evaluate_dna_incremental(self, dna: tyDna, parent: tyDna, img):
+        """ Calculates the difference between the image and the DNA drawing by
+        only redrawing the area where the dna differs from its parent. Returns
+        the score and the drawing. Falls back to a full evaluation when the
+        parent drawing is not known, most of the picture changed or the metric
+        of the target is not local. If the [spatial_index] evolution spec is
+        set, genes are looked up in a grid with cells of that many pixels. """
+        w, h = self.genes.w, self.genes.h
+        target = as_target(img)
+        cached = self.renders.get(id(parent))
+        if cached is None or cached[0] is not parent:
+            parent_img = self.dna_to_image(parent)
+            parent_score = self.timed_score(target.score, parent_img)
+            self.remember_render(parent, parent_score, parent_img)
+        else:
+            _, parent_score, parent_img = cached
+
+        # background is encoded in the first gene, so it repaints everything
+        cell = self.specs.get("spatial_index")
+        grid = None
+        if len(dna) != len(parent) or changed_genes(dna[:1], parent[:1]):
+            box = (0, 0, w, h)
+        elif cell:
+            parent_grid = self.parent_grid(parent)
+            changed = self.changes(dna, parent)
+            if not changed:
+                return parent_score, parent_img
+            grid = spatial.derive_grid(parent_grid, dna, changed,
+                                       self.genes.bbox_gene)
+            self.offspring_grid = grid
+            box = self.cover_box([grid.box(k) for k in changed] +
+                                 [parent_grid.box(k) for k in changed])
+            if box is None:
+                return parent_score, parent_img
+        else:
+            box = self.dirty_box(dna, parent)
+            if box is None:
+                return parent_score, parent_img
+
+        l, t, r, b = box
+        if (r-l) * (b-t) * 2 > w * h or not target.local:
+            dna_img = self.dna_to_image(dna)
+            return self.timed_score(target.score, dna_img), dna_img
+
+        # Redraw the box on a scratch canvas. Genes are drawn at their true
+        # coordinates so the pixels match a full drawing exactly. With a
+        # spatial index only the genes near the box are looked at.
+        if self.scratch is None or self.scratch.size != (w, h):
+            self.scratch = Image.new("RGB", (w, h))
+        background = dna[0].get("color", (0, 0, 0, 0))
+        self.scratch.paste(Image.new("RGB", (r-l, b-t), background), box)
+        draw = ImageDraw.Draw(self.scratch, "RGBA")
+        if grid is not None:
+            for k in grid.query(box):
+                self.genes.draw_gene(draw, dna[k])
+        else:
+            for gene in dna:
+                gl, gt, gr, gb = self.genes.bbox_gene(gene)
+                if gl < r and l < gr and gt < b and t < gb:
+                    self.genes.draw_gene(draw, gene)
+        patch = self.scratch.crop(box)
+        dna_img = parent_img.copy()
+        dna_img.paste(patch, box)
+
+        old_err = self.timed_score(target.score, parent_img.crop(box), box)
+        new_err = self.timed_score(target.score, patch, box)
+        return parent_score - old_err + new_err, dna_img
+
+    def draw_with_snapshots(self, dna: tyDna, start=0, canvas=None):
+        """ Draws the genes of the dna from index [start] on onto [canvas] (an
+        empty background by default). Returns the drawing and the snapshots
+        of the canvas taken before every [prefix_every]-th gene. """
+        every = self.specs.get("prefix_every", 10)
+        if canvas is None:
+            background = dna[0].get("color", (0, 0, 0, 0))
+            canvas = Image.new("RGB", (self.genes.w, self.genes.h), background)
+        draw = ImageDraw.Draw(canvas, "RGBA")
+        snapshots = {}
+        for k in range(start, len(dna)):
+            if k > start and k % every == 0:
+                snapshots[k] = canvas.copy()
+            self.genes.draw_gene(draw, dna[k])
+        return canvas, snapshots
+
+    def remember_prefixes(self, dna: tyDna, snapshots=None):
+        """ Stores the snapshots of a dna that joins the population, as
+        returned by [evaluate_dna_prefix], or draws the dna to take them. If
+        the snapshots take more than the [prefix_budget] evolution spec (in
+        megabytes), the ones of the least recently used members are
+        dropped. """
+        if snapshots is None:
+            _, snapshots = self.draw_with_snapshots(dna)
+
+        self.forget_prefixes(dna)
+        self.prefixes[id(dna)] = (dna, snapshots)
+        for snapshot in snapshots.values():
+            ref = self.snapshot_refs.setdefault(id(snapshot), [snapshot, 0])
+            ref[1] += 1
+
+        budget = self.specs.get("prefix_budget", 256) * 2**20
+        size = self.genes.w * self.genes.h * 3
+        while self.prefixes and len(self.snapshot_refs) * size > budget:
+            oldest, _ = next(iter(self.prefixes.values()))
+            self.forget_prefixes(oldest)
+
+    def forget_prefixes(self, dna: tyDna):
+        """ Drops the stored snapshots of a dna (if there are any). """
+        entry = self.prefixes.pop(id(dna), None)
+        if entry is None:
+            return
+        for snapshot in entry[1].values():
+            ref = self.snapshot_refs[id(snapshot)]
+            ref[1] -= 1
+            if ref[1] == 0:
+                del self.snapshot_refs[id(snapshot)]
+
+    def evaluate_dna_prefix(self, dna: tyDna, parent: tyDna, img):
+        """ Calculates the difference between the image and the DNA drawing.
+        Genes are drawn in order, so the drawing is resumed from the last
+        snapshot of the parent at or before the first changed gene. Returns
+        the score and the snapshots of the dna, shared with the parent up to
+        that gene and taken while drawing the rest, for [remember_prefixes]
+        if the dna joins the population. """
+        entry = self.prefixes.get(id(parent))
+        if entry is None or entry[0] is not parent:
+            self.remember_prefixes(parent)
+            entry = self.prefixes.get(id(parent))
+        if entry is None:
+            parent_snapshots = {}  # over the budget on their own
+        else:
+            parent_snapshots = entry[1]
+            self.prefixes.move_to_end(id(parent))
+
+        changed = self.changes(dna, parent)
+        first = changed[0] if changed else min(len(dna), len(parent))
+
+        # background is encoded in the first gene, so it repaints everything
+        start = 0
+        if first > 0:
+            start = max([k for k in parent_snapshots if k <= first], default=0)
+        canvas = parent_snapshots[start].copy() if start else None
+        dna_img, snapshots = self.draw_with_snapshots(dna, start, canvas)
+
+        snapshots.update((k, snapshot) for k, snapshot
+                         in parent_snapshots.items() if k <= start)
+        score = self.timed_score(as_target(img).score, dna_img)
+        return score, snapshots
 
     def recover_from_json(self, dna: tyDna)-> int:
         """Fixes the types after being read from json."""
@@ -415,3 +768,25 @@ class DNA:
         self.genes.h = int(self.genes.h * new_w / self.genes.w)
         self.genes.w = new_w
         return upscaled_dna
+
+    def upscale_dnas_and_self(self, new_w, dnas):
+        """ Same as [upscale_dna_and_self] but for a list of dnas. """
+        upscaled_dnas = [
+            [self.genes.upscale_gene(new_w, g) for g in dna] for dna in dnas]
+        self.genes.h = int(self.genes.h * new_w / self.genes.w)
+        self.genes.w = new_w
+        return upscaled_dnas
+
+
+def make_gene_tools(kind: str, w, h, gene_specs, rng=None)-> GeneKind:
+    """ Returns the gene tools for the given kind, circles by default. They
+    draw from the python Random [rng] if given. """
+    if kind == "polygon":
+        gene_tools = PolygonGene(w, h, gene_specs)
+    elif kind == "letter":
+        gene_tools = LetterGene(w, h, gene_specs)
+    else:
+        gene_tools = CircleGene(w, h, gene_specs)
+    if rng is not None:
+        gene_tools.rng = rng
+    return gene_tools
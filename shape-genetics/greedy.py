@@ -0,0 +1,237 @@
+import evolution
+import json
+import numpy as np
+import stopping
+import streams
+from target import PIXEL_ERRORS, as_target, target_from_specs
+from PIL import Image, ImageDraw
+
+# Mutations of the best candidate scored together while refining it
+REFINE_BATCH = 10
+# Population continuing a grown dna when the evolution specs have no pop_size
+CONTINUE_POP_SIZE = 50
+
+# =============================================================================
+# Greedy growth. Instead of evolving a dna of a fixed length, the dna grows one
+# gene at a time. For every new gene many random candidates are tried, the best
+# one is refined by mutating it and then frozen. Frozen genes never change, so
+# the drawing of the dna so far is kept, and a candidate is drawn and scored
+# only in its box. Trying a candidate costs as much as the area of its shape.
+#
+# Candidates are scored together. The error of every pixel of the drawing is
+# kept, each candidate is drawn in its box and the pixels of all boxes are
+# scored in one pass over arrays, against the kept errors.
+
+
+class Grower:
+
+    def __init__(self, dna_tools, img):
+        """ Grows a dna of the dict [dna_tools] to fit [img], which has to be
+        scored with a local metric. """
+        target = as_target(img)
+        if not target.local:
+            raise Exception(f"Metric `{target.metric}` is not local")
+        self.tools, self.target = dna_tools, target
+        self.dna, self.canvas, self.scratch = None, None, None
+        self.pixels, self.score = None, None
+        self.errors, self.sums = None, None
+        # whether candidates can be scored pixel by pixel in a batch
+        self.batched = target.metric in PIXEL_ERRORS
+
+    def start(self, dna=None):
+        """ Starts from a copy of [dna], or from a background in the mean color
+        of the target. """
+        if dna is None:
+            background = self.tools.genes.random_gene()
+            mean = self.target.pixels.mean(axis=(0, 1))
+            background["color"] = tuple(int(round(c)) for c in mean) + (255,)
+            dna = [background]
+        self.dna = list(dna)
+        self.canvas = self.tools.dna_to_image(self.dna)
+        self.scratch = self.canvas.copy()
+        self.pixels = np.array(self.canvas, dtype=np.int16)
+        self.score = self.target.score(self.canvas)
+        if self.batched:
+            h, w = self.pixels.shape[:2]
+            self.errors = np.zeros((h, w))
+            self.sums = np.zeros((h + 1, w + 1))
+            self.update_errors((0, 0, w, h))
+
+    def box(self, gene):
+        """ Returns the box of the gene clipped to the canvas, or None if the
+        gene is not on the canvas. """
+        genes = self.tools.genes
+        l, t, r, b = genes.bbox_gene(gene)
+        l, t, r, b = max(0, l), max(0, t), min(genes.w, r), min(genes.h, b)
+        return (l, t, r, b) if l < r and t < b else None
+
+    def gain(self, gene, box):
+        """ Returns how much the score drops when the gene is drawn over the
+        current drawing. Only the [box] of the gene is redrawn and scored. """
+        l, t, r, b = box
+        self.scratch.paste(self.canvas.crop(box), box)
+        self.tools.genes.draw_gene(ImageDraw.Draw(self.scratch, "RGBA"), gene)
+        old_err = self.target.score_pixels(self.pixels[t:b, l:r], box)
+        new_err = self.target.score(self.scratch.crop(box), box)
+        return old_err - new_err
+
+    def gains(self, genes)-> np.ndarray:
+        """ Returns how much the score drops when each of the [genes] is drawn
+        over the current drawing, 0 for genes off the canvas. """
+        boxes = [self.box(gene) for gene in genes]
+        if not self.batched:
+            return np.array([0 if box is None else self.gain(gene, box)
+                             for gene, box in zip(genes, boxes)])
+
+        # every gene is drawn in its box, the pixels of all boxes are scored
+        # at once and the old errors of the boxes come from the sums
+        ids, kept, drawn = [], [], []
+        for k, (gene, box) in enumerate(zip(genes, boxes)):
+            if box is None:
+                continue
+            self.scratch.paste(self.canvas.crop(box), box)
+            self.tools.genes.draw_gene(ImageDraw.Draw(self.scratch, "RGBA"),
+                                       gene)
+            drawn.append(np.asarray(self.scratch.crop(box)))
+            ids.append(k)
+            kept.append(box)
+        gains = np.zeros(len(genes))
+        if not ids:
+            return gains
+
+        l, t, r, b = np.array(kept).T
+        sums = self.sums
+        old = sums[b, r] - sums[t, r] - sums[b, l] + sums[t, l]
+        errors = self.target.box_errors(kept, drawn)
+        starts = np.cumsum([0] + [pixels.size // 3 for pixels in drawn[:-1]])
+        gains[ids] = old - np.add.reduceat(errors, starts)
+        return gains
+
+    def best_of(self, genes, best, best_gain):
+        """ Returns the best of the [genes] and its gain if it beats
+        [best_gain], else [best] and [best_gain]. """
+        gains = self.gains(genes)
+        k = int(np.argmax(gains))
+        if gains[k] > best_gain:
+            return genes[k], gains[k]
+        return best, best_gain
+
+    def freeze(self, gene, gain):
+        """ Adds the gene to the dna for good and draws it. """
+        box = self.box(gene)
+        self.tools.genes.draw_gene(ImageDraw.Draw(self.canvas, "RGBA"), gene)
+        l, t, r, b = box
+        self.pixels[t:b, l:r] = np.asarray(self.canvas.crop(box),
+                                           dtype=np.int16)
+        if self.batched:
+            self.update_errors(box)
+        self.dna.append(gene)
+        self.score -= gain
+
+    def update_errors(self, box):
+        """ Scores the pixels of the drawing in [box] and sums the errors of
+        all pixels above and left of each pixel again. """
+        l, t, r, b = box
+        errors = self.target.box_errors([box], [self.pixels[t:b, l:r]])
+        self.errors[t:b, l:r] = errors.reshape(b - t, r - l)
+        self.sums[1:, 1:] = self.errors.cumsum(axis=0).cumsum(axis=1)
+
+    def grow(self, candidates: int, refine: int)-> bool:
+        """ Tries [candidates] random genes, refines the best one with [refine]
+        mutations in batches of [REFINE_BATCH] and freezes it. Returns whether
+        a gene that improves the drawing was found. """
+        genes = self.tools.genes
+        pool = [genes.random_gene() for _ in range(candidates)]
+        best, best_gain = self.best_of(pool, None, 0)
+        if best is None:
+            return False
+
+        # the mutations of a batch all start from the best gene so far
+        ratio = self.tools.specs["property_mutation_ratio"]
+        for start in range(0, refine, REFINE_BATCH):
+            mutants = [genes.mutate_gene(ratio, best)
+                       for _ in range(min(REFINE_BATCH, refine - start))]
+            best, best_gain = self.best_of(mutants, best, best_gain)
+
+        gain = self.gain(best, self.box(best))
+        if gain <= 0:
+            return False
+        self.freeze(best, gain)
+        return True
+
+
+def grow_image(in_path, out_path, gene_specs, evo_specs, generate_steps=True,
+               report=100, json_out=None, seed=None):
+    """ Grows a dna gene by gene to fit the image at [in_path] and saves its
+    drawing to [out_path]. The dna grows to [dna_len] genes, each one the best
+    of [grow_candidates] random genes refined by [grow_refine] mutations
+    (evolution specs). Growth stops early if no candidate improves the
+    drawing in [grow_patience] rounds in a row, or when the stop_* evolution
+    specs say so, counting genes as steps (see stopping.py). Whenever the
+    score improves by 5% the drawing is saved, and the score is reported
+    every [report] genes. The json in [json_out] can be continued by
+    [continue_evolution], with a population of [pop_size] dnas or of
+    CONTINUE_POP_SIZE. See [evolve_image] for the [seed]. """
+    seed = streams.seed_sequence(seed)
+    img = target_from_specs(Image.open(in_path), evo_specs)
+    w, h = img.width, img.height
+
+    required = ["kind", "dna_len"]
+    if not all([f in evo_specs.keys() for f in required]):
+        raise KeyError(f"Evolution specs require parameters {required}.")
+
+    kind, dna_len = evo_specs["kind"], evo_specs["dna_len"]
+    candidates = evo_specs.get("grow_candidates", 1000)
+    refine = evo_specs.get("grow_refine", 100)
+    patience = evo_specs.get("grow_patience", 10)
+    dna_tools, _ = evolution.make_tools(
+        kind, w, h, gene_specs, dict(evo_specs, representation="dict"), seed)
+
+    grower = Grower(dna_tools, img)
+    grower.start()
+    writer = evolution.start_writer(dna_tools) if generate_steps else None
+    if writer:
+        writer.submit("ztep_0.png", list(grower.dna))
+
+    old_score = grower.score  # used to report successful improvements of 5%
+    failed = 0
+    stopper = stopping.stopper_from_specs(evo_specs)
+    while len(grower.dna) < dna_len:
+        if stopper and stopper.check(len(grower.dna), grower.score / (w*h)):
+            evolution.report_stop(stopper, report)
+            break
+        if not grower.grow(candidates, refine):
+            failed += 1
+            if failed < patience:
+                continue
+            if report > 0:
+                print(evolution.THIN_SEP)
+                print(f"STOPPED! No gene improves the drawing after "
+                      f"{len(grower.dna)} genes")
+            break
+        failed = 0
+        n, score = len(grower.dna), grower.score
+
+        if generate_steps and score < old_score*0.95:
+            old_score = score
+            writer.submit("ztep_{}.png".format(n), list(grower.dna))
+
+        if report > 0 and n % report == 0:
+            print(evolution.THIN_SEP)
+            print(f"REPORT! Genes : {n} | Score : {score}")
+
+    if writer:
+        writer.close()
+
+    dna_tools.dna_to_image(grower.dna).save(out_path)
+
+    if json_out:
+        full_specs = {"width": w, "height": h, "kind": kind, "steps": 0,
+                      "gene_specs": gene_specs,
+                      "evo_specs": dict({"pop_size": CONTINUE_POP_SIZE},
+                                        **evo_specs),
+                      "dna": grower.dna}
+        with open(json_out, 'w') as jfile:
+            jfile.write(json.dumps(full_specs))
+
+    return grower.dna
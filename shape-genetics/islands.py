@@ -0,0 +1,238 @@
+import genetics
+import evolution
+import json
+import multiprocessing
+import os
+import queue
+import streams
+import time
+from target import target_from_specs
+from PIL import Image
+
+# =============================================================================
+# Island model. Several populations evolve independently in separate processes
+# and every [migration_step] steps each island sends copies of its best dnas to
+# the next island in a ring, where they replace the worst members. Migration is
+# synchronous, so the result of a run does not depend on process scheduling.
+#
+# An island waits at most [migration_timeout] seconds (evolution spec) for its
+# migrants, and a run ends as soon as one of its island processes fails, so a
+# dead island never leaves the others waiting forever.
+
+MIGRATION_TIMEOUT = 3600
+
+
+class QueueTransport:
+    """ Exchanges migrants through multiprocessing queues, for islands that run
+    on the same machine. """
+
+    def __init__(self, n_islands: int, timeout=MIGRATION_TIMEOUT):
+        self.inboxes = [multiprocessing.Queue() for _ in range(n_islands)]
+        self.timeout = timeout
+
+    def send(self, island: int, step: int, migrants):
+        target = (island + 1) % len(self.inboxes)
+        self.inboxes[target].put((step, migrants))
+
+    def receive(self, island: int, step: int):
+        try:
+            sent_step, migrants = self.inboxes[island].get(
+                timeout=self.timeout)
+        except queue.Empty:
+            raise Exception(f"Island {island} got no migrants from step "
+                            f"{step} in {self.timeout} seconds.")
+        if sent_step != step:
+            raise Exception(f"Island {island} expected migrants from step "
+                            f"{step} but got them from step {sent_step}.")
+        return migrants
+
+    def clear(self, islands):
+        """ Nothing to clear, the queues end with the run. """
+
+
+class DirectoryTransport:
+    """ Exchanges migrants through json files in a directory. If the directory
+    is on a shared file system, the islands can run on different machines. """
+
+    def __init__(self, path: str, n_islands: int, poll=0.1,
+                 timeout=MIGRATION_TIMEOUT):
+        self.path, self.n_islands, self.poll = path, n_islands, poll
+        self.timeout = timeout
+        os.makedirs(path, exist_ok=True)
+
+    def file_name(self, island: int, step: int):
+        return os.path.join(self.path, f"migrants_{island}_{step}.json")
+
+    def send(self, island: int, step: int, migrants):
+        name = self.file_name(island, step)
+        with open(name + ".tmp", "w") as jfile:
+            jfile.write(json.dumps(migrants))
+        os.replace(name + ".tmp", name)  # readers never see partial files
+
+    def receive(self, island: int, step: int):
+        name = self.file_name((island - 1) % self.n_islands, step)
+        deadline = time.monotonic() + self.timeout
+        while not os.path.exists(name):
+            if time.monotonic() > deadline:
+                raise Exception(f"Island {island} got no migrants from step "
+                                f"{step} in {self.timeout} seconds.")
+            time.sleep(self.poll)
+        with open(name, "r") as jfile:
+            migrants = json.loads(jfile.read())
+        os.remove(name)
+        return migrants
+
+    def clear(self, islands):
+        """ Removes the migrants sent by [islands] that were never received,
+        so that a later run in the same directory can not receive them. """
+        for name in os.listdir(self.path):
+            parts = name.split("_")
+            if (parts[0] == "migrants" and len(parts) == 3
+                    and parts[1].isdigit() and int(parts[1]) in islands):
+                os.remove(os.path.join(self.path, name))
+
+
+def transport_from_specs(evo_specs):
+    """ Returns a [DirectoryTransport] in the [island_dir] evolution spec if it
+    is set, else a [QueueTransport]. """
+    n_islands = evo_specs["islands"]
+    timeout = evo_specs.get("migration_timeout", MIGRATION_TIMEOUT)
+    if evo_specs.get("island_dir"):
+        return DirectoryTransport(evo_specs["island_dir"], n_islands,
+                                  timeout=timeout)
+    return QueueTransport(n_islands, timeout)
+
+
+def migrate(pop, dna_tools, island: int, step: int, transport, migrants: int):
+    """ Sends the best members of the population away and replaces the worst
+    members with the ones received. Scores travel along with the dnas. """
+    pop.sort(key=lambda p: p[0])
+    transport.send(island, step, [[s, dna] for s, dna in pop[:migrants]])
+
+    received = transport.receive(island, step)
+    for k, (score, dna) in enumerate(received):
+        dna_tools.forget_render(pop[-1-k][1])
+        dna_tools.forget_prefixes(pop[-1-k][1])
+        pop[-1-k] = (score, dna_tools.recover_from_json(dna))
+    return pop
+
+
+def run_island(island: int, n_islands: int, in_path, kind, gene_specs,
+               evo_specs, steps, transport, steps_start=0, population=None,
+               seed_dna=None, reseed_mutations=5, seed=None, report=100000):
+    """ Evolves a single island for [steps] steps and returns its population.
+    The island starts from a saved [population] (a list of [score, dna]), from
+    a population reseeded from [seed_dna], or from a random population. The
+    island draws from the random stream of [seed]. """
+    img = target_from_specs(Image.open(in_path), evo_specs)
+    gene_tools = genetics.make_gene_tools(kind, img.width, img.height,
+                                          gene_specs,
+                                          rng=streams.python_random(seed))
+    dna_tools = genetics.DNA(gene_tools, evo_specs)
+
+    pop_size = evo_specs["pop_size"]
+    if population is not None:
+        pop = [(score, dna_tools.recover_from_json(dna))
+               for score, dna in population]
+    elif seed_dna is not None:
+        dna = dna_tools.recover_from_json(seed_dna)
+        pop = evolution.population_from_dna(dna_tools, dna, pop_size,
+                                            reseed_mutations, img)
+    else:
+        pop = evolution.initial_population(dna_tools, evo_specs["dna_len"],
+                                           pop_size, img)
+
+    migration_step = evo_specs.get("migration_step", 1000)
+    migrants = evo_specs.get("migrants", 1)
+
+    step, end = steps_start, steps_start + steps
+    while step < end:
+        k = min(migration_step, end - step)
+        pop = evolution.evolve_pop(pop, dna_tools, img, k, steps_start=step,
+                                   generate_steps=False, report=-1)
+        step += k
+
+        if report > 0:
+            score = min(pop, key=lambda p: p[0])[0]
+            print(f"ISLAND {island}! Step : {step} | Score : {score}")
+
+        if step < end and n_islands > 1:
+            pop = migrate(pop, dna_tools, island, step, transport, migrants)
+
+    return pop
+
+
+def island_process(results, island, *args, **kwargs):
+    pop = run_island(island, *args, **kwargs)
+    results.put((island, pop))
+
+
+def evolve_islands(in_path, kind, gene_specs, evo_specs, steps, transport=None,
+                   island_ids=None, steps_start=0, populations=None,
+                   seed_dna=None, reseed_mutations=5, seed=None,
+                   report=100000, poll=1):
+    """ Runs the islands in [island_ids] (all by default) in separate processes
+    and returns a dict of their final populations. The number of islands is
+    given by the [islands] evolution spec. To split a run across machines, run
+    a part of the islands on each one with a shared [DirectoryTransport],
+    which is also the default [transport] if the [island_dir] evolution spec
+    is set (see [transport_from_specs]). [populations] can hold saved
+    populations of islands, to resume them. Every island gets its own random
+    stream spawned from [seed], so the islands split across machines have to
+    be given the same seed. The processes are checked every [poll] seconds,
+    if one of them fails the others are stopped, their migrants cleared and
+    an exception raised. """
+    n_islands = evo_specs["islands"]
+    island_seeds = streams.spawn(seed, n_islands)
+    if island_ids is None:
+        island_ids = list(range(n_islands))
+    if transport is None:
+        transport = transport_from_specs(evo_specs)
+    populations = populations or {}
+
+    results = multiprocessing.Queue()
+    processes = {}
+    for island in island_ids:
+        kwargs = {"steps_start": steps_start,
+                  "population": populations.get(island),
+                  "seed_dna": seed_dna, "reseed_mutations": reseed_mutations,
+                  "seed": island_seeds[island], "report": report}
+        args = (results, island, n_islands, in_path, kind, gene_specs,
+                evo_specs, steps, transport)
+        process = multiprocessing.Process(
+            target=island_process, args=args, kwargs=kwargs)
+        process.start()
+        processes[island] = process
+
+    pops = {}
+    while len(pops) < len(processes):
+        try:
+            island, pop = results.get(timeout=poll)
+            pops[island] = pop
+            continue
+        except queue.Empty:
+            pass
+        failed = [island for island, process in processes.items()
+                  if island not in pops and process.exitcode]
+        if failed:
+            for process in processes.values():
+                process.terminate()
+                process.join()
+            transport.clear(island_ids)
+            raise Exception(f"Island {failed[0]} stopped with exit code "
+                            f"{processes[failed[0]].exitcode}.")
+    for process in processes.values():
+        process.join()
+
+    return pops
+
+
+def islands_to_json(pops):
+    """ Returns the per island state, as stored in the json files. """
+    return [{"island": island, "population": [[s, dna] for s, dna in pop]}
+            for island, pop in sorted(pops.items())]
+
+
+def islands_from_json(data):
+    """ Returns the saved populations of islands, keyed by island. """
+    return {entry["island"]: entry["population"] for entry in data}
@@ -0,0 +1,73 @@
+import genetics
+import array_genetics
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from target import Target, as_target
+from PIL import Image
+
+# =============================================================================
+# Scoring of offspring in a pool of processes. The target image is placed in
+# shared memory once, and every worker keeps its own gene tools, so a task only
+# carries the dna that is to be scored.
+
+# State of a worker process, set up once by [init_worker]
+WORKER = {}
+
+
+def init_worker(shm_name, shape, kind, w, h, gene_specs, evo_specs, settings):
+    """ Attaches to the shared target image and builds the dna tools. The
+    target is scored with the metric [settings] of the main process. """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    pixels = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+
+    gene_tools = genetics.make_gene_tools(kind, w, h, gene_specs)
+    if evo_specs.get("representation", "dict") == "array":
+        dna_tools = array_genetics.ArrayDNA(gene_tools, evo_specs)
+    else:
+        dna_tools = genetics.DNA(gene_tools, evo_specs)
+
+    # the target keeps its own decoded copy, so the memory can be released
+    WORKER["img"] = Target(Image.fromarray(pixels, "RGB"), **settings)
+    WORKER["dna_tools"] = dna_tools
+    del pixels
+    shm.close()
+
+
+def score_dna(dna):
+    return WORKER["dna_tools"].evaluate_dna(dna, WORKER["img"])
+
+
+class ParallelEvaluator:
+    """ Scores batches of dnas against [img] in [workers] processes. Use as a
+    context manager, the evaluator itself is a function from a list of dnas to
+    a list of scores (in the same order). """
+
+    def __init__(self, img, workers: int, kind: str, gene_specs, evo_specs):
+        img = as_target(img)
+        pixels = np.asarray(img.img, dtype=np.uint8)
+        self.shm = shared_memory.SharedMemory(create=True, size=pixels.nbytes)
+        shared = np.ndarray(pixels.shape, dtype=np.uint8, buffer=self.shm.buf)
+        shared[:] = pixels
+
+        self.workers = workers
+        init_args = (self.shm.name, pixels.shape, kind, img.width, img.height,
+                     gene_specs, evo_specs, img.settings())
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker, initargs=init_args)
+
+    def __call__(self, dnas):
+        chunk = max(1, len(dnas) // (4 * self.workers))
+        return list(self.pool.map(score_dna, dnas, chunksize=chunk))
+
+    def close(self):
+        self.pool.shutdown()
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,314 @@
+import math
+import struct
+import numpy as np
+from PIL import Image, ImageDraw
+from target import as_target
+
+# =============================================================================
+# Software rasterizer for array dnas of circles and polygons. The shapes are
+# composited straight into a uint16 pixel buffer, so a dna is drawn and scored
+# without going through PIL images. The result is exactly the picture that
+# ImageDraw draws in "RGBA" mode:
+#  - every gene is blended over its box with (out * (255-a) + ink * a) / 255,
+#    rounded like PIL does it, where a is 0 outside of the shape, which leaves
+#    those pixels as they were,
+#  - circles are stamps of the pixels that PIL covers, made once per radius,
+#  - polygons follow the scanline algorithm of PIL (libImaging/Draw.c),
+#    including its float32 arithmetic, rounding and corner rules. Rows without
+#    corners or horizontal edges are filled all at once, the few rows with
+#    them are filled one by one.
+# Drawing is still one gene after the other, as every gene blends over the
+# ones before it. PIL is faster at it (see the benchmark), the rasterizer is
+# opt in with the [rasterizer] evolution spec.
+
+F32 = np.float32
+HALF = np.float32(0.5)
+FLOAT32 = struct.Struct("f")
+
+
+def f32(value: float)-> float:
+    """ Rounds a float to float32. The sum, difference, product or quotient of
+    two float32 numbers computed as floats and rounded with this is exactly
+    the float32 result, and python floats are much faster than numpy ones. """
+    return FLOAT32.unpack(FLOAT32.pack(value))[0]
+
+
+def round_up(f)-> int:
+    """ ROUND_UP of PIL for a float32. """
+    if f >= 0:
+        return math.floor(f32(f + 0.5))
+    return -math.floor(abs(f) + 0.5)
+
+
+def round_down(f)-> int:
+    """ ROUND_DOWN of PIL for a float32. """
+    if f >= 0:
+        return math.ceil(f32(f - 0.5))
+    return -math.ceil(abs(f) - 0.5)
+
+
+def round_half(f)-> float:
+    """ roundf of C, halfway cases are rounded away from zero. """
+    return math.copysign(math.floor(abs(f) + 0.5), f)
+
+
+# -----------------------------------------------------------------------------
+# Polygons
+
+def polygon_edges(points):
+    """ Returns the edges of a polygon as (xmin, xmax, ymin, ymax, x0, y0, dx)
+    lists. Consecutive horizontal edges going the same way are merged. """
+    edges = []
+
+    def add_edge(x0, y0, x1, y1):
+        dx = 0.0 if y0 == y1 else f32((x1 - x0) / (y1 - y0))
+        edges.append([min(x0, x1), max(x0, x1), min(y0, y1), max(y0, y1),
+                      x0, y0, dx])
+
+    for i in range(len(points) - 1):
+        (x0, y0), (x1, y1) = points[i], points[i+1]
+        if y0 == y1 and i != 0 and y0 == points[i-1][1]:
+            if x1 > x0 > points[i-1][0]:
+                edges[-1][1] = x1
+                continue
+            elif x1 < x0 < points[i-1][0]:
+                edges[-1][0] = x1
+                continue
+        add_edge(x0, y0, x1, y1)
+    if tuple(points[-1]) != tuple(points[0]):
+        add_edge(*points[-1], *points[0])
+    return edges
+
+
+def edge_x(edge, y):
+    """ Returns the float32 x where the edge crosses row [y]. """
+    return f32(f32((y - edge[5]) * edge[6]) + edge[4])
+
+
+def row_spans(edges, table, y: int, ymax: int):
+    """ Returns the (x_start, x_end) spans that PIL fills in row [y], where
+    [table] are the edges that are not horizontal and [ymax] is the last row
+    of the polygon. """
+    xx = []
+    for i, current in enumerate(table):
+        if not current[2] <= y <= current[3]:
+            continue
+        xx.append(edge_x(current, y))
+
+        if y == current[3] and y < ymax:
+            xx.append(xx[-1])
+        elif (y == current[2] or y == current[3]) and current[6] != 0:
+            # corners where edges join far apart
+            for other in table[:i]:
+                if (y != other[2] and y != other[3]) or other[6] == 0:
+                    continue
+                if round_half(xx[-1]) != round_half(edge_x(other, y)):
+                    continue
+                offset = -1 if y == current[3] else 1
+                adjacent = edge_x(current, y + offset)
+                if other[2] <= y + offset <= other[3]:
+                    adjacent_other = edge_x(other, y + offset)
+                    if (xx[-1] > f32(adjacent + 1) and
+                            xx[-1] > f32(adjacent_other + 1)):
+                        xx[-1] = round_half(max(adjacent, adjacent_other)) + 1
+                    elif (xx[-1] < f32(adjacent - 1) and
+                          xx[-1] < f32(adjacent_other - 1)):
+                        xx[-1] = round_half(min(adjacent, adjacent_other)) - 1
+                    break
+    xx.sort()
+
+    spans = []
+    x_pos = -1 if not xx else 0
+
+    def horizontal_lines(x_pos):
+        for edge in edges:
+            if edge[2] != y or edge[3] != y:
+                continue
+            xmin, xmax = edge[0], edge[1]
+            if x_pos != -1 and x_pos < xmin:
+                continue
+            if x_pos > xmin:
+                xmin = x_pos
+                if xmax < xmin:
+                    continue
+            spans.append((xmin, xmax))
+            x_pos = xmax + 1
+        return x_pos
+
+    for i in range(1, len(xx), 2):
+        x_end = round_down(xx[i])
+        if x_end < x_pos:
+            continue
+        x_pos = horizontal_lines(x_pos)
+        if x_end < x_pos:
+            continue
+        x_start = max(round_up(xx[i-1]), x_pos)
+        if x_end < x_start:
+            continue
+        spans.append((x_start, x_end))
+        x_pos = x_end + 1
+    horizontal_lines(x_pos)
+    return spans
+
+
+def polygon_spans(tables, h: int):
+    """ Returns the (starts, ends) columns of the spans that PIL fills in
+    every row of the polygons whose edges that are not horizontal are
+    [tables], as float arrays of shape (polygons, h, spans). Rows that no
+    edge starts or ends in hold an even number of crossings and are filled
+    between each pair of them, the other rows are left to [row_spans]. Rows
+    without a span start after they end. All polygons are done at once, as
+    which pixels a polygon covers does not depend on the ones drawn before
+    it. """
+    most = max(len(table) for table in tables)
+    pad = [0, 0, 1, 0, 0, 0, 0.0]  # ymin above ymax, never active
+    edges = [table + [pad] * (most - len(table)) for table in tables]
+    e_ymin = np.array([[e[2] for e in t] for t in edges])[:, None]
+    e_ymax = np.array([[e[3] for e in t] for t in edges])[:, None]
+    e_x0 = np.array([[e[4] for e in t] for t in edges], dtype=F32)[:, None]
+    e_y0 = np.array([[e[5] for e in t] for t in edges])[:, None]
+    e_dx = np.array([[e[6] for e in t] for t in edges], dtype=F32)[:, None]
+
+    ry = np.arange(h)[None, :, None]
+    active = (ry >= e_ymin) & (ry <= e_ymax)
+    xx = np.where(active, (ry - e_y0).astype(F32) * e_dx + e_x0, np.inf)
+    xx = np.sort(xx, axis=2)
+    xx = xx[..., :most // 2 * 2].reshape(len(tables), h, -1, 2)
+    valid = np.isfinite(xx[..., 1])
+    xx = np.where(valid[..., None], xx, F32(0))
+
+    starts, ends = xx[..., 0], xx[..., 1]
+    starts = np.where(starts >= 0, np.floor(starts + HALF),
+                      -np.floor(np.abs(starts.astype(np.float64)) + 0.5))
+    ends = np.where(ends >= 0, np.ceil(ends - HALF),
+                    -np.ceil(np.abs(ends.astype(np.float64)) - 0.5))
+    return np.where(valid, starts, np.inf), ends
+
+
+def polygon_masks(polygons, w: int, h: int):
+    """ Returns (left, top, mask) for each of the [polygons] (lists of
+    points), where the boolean [mask] marks the pixels of a [w] x [h] image
+    that PIL covers when filling the polygon, or None if the polygon covers
+    no pixels. """
+    edges = [polygon_edges(points) for points in polygons]
+    tables = [[e for e in es if e[2] != e[3]] for es in edges]
+    if any(tables):
+        starts, ends = polygon_spans(tables, h)
+
+    masks = []
+    for k, (points, es, table) in enumerate(zip(polygons, edges, tables)):
+        ymin = min([h - 1] + [e[2] for e in es])
+        ymax = max([0] + [e[3] for e in es])
+        ymax = min(ymax, h)
+        top, bot = max(ymin, 0), min(ymax, h - 1) + 1
+        xs = [x for x, _ in points]
+        left, right = max(0, min(xs) - 2), min(w, max(xs) + 3)
+        if top >= bot or left >= right:
+            masks.append(None)
+            continue
+
+        cols = np.arange(left, right)
+        if table:
+            mask = ((cols >= starts[k, top:bot, :, None]) &
+                    (cols <= ends[k, top:bot, :, None])).any(axis=1)
+        else:
+            mask = np.zeros((bot - top, right - left), dtype=bool)
+
+        special = set(e[2] for e in es) | set(e[3] for e in es)
+        for y in special:
+            if top <= y < bot:
+                mask[y - top] = False
+                for x_start, x_end in row_spans(es, table, y, ymax):
+                    mask[y - top, max(x_start, left) - left:
+                         max(x_end + 1, left) - left] = True
+        masks.append((left, top, mask))
+    return masks
+
+
+# -----------------------------------------------------------------------------
+# Circles
+
+def circle_stamp(r: int):
+    """ Returns the boolean mask of the pixels PIL covers when filling the
+    ellipse [x-r, y-r, x+r, y+r]. """
+    stamp = Image.new("L", (2*r + 1, 2*r + 1), 0)
+    ImageDraw.Draw(stamp).ellipse([0, 0, 2*r, 2*r], fill=255)
+    return np.asarray(stamp) > 0
+
+
+# =============================================================================
+# Rasterizer
+
+
+class Rasterizer:
+
+    def __init__(self, dna_tools):
+        """ Draws and scores the dnas of the ArrayDNA [dna_tools], which have
+        to be circle or polygon dnas. """
+        if dna_tools.kind not in ["circle", "polygon"]:
+            raise Exception(f"Shape kind `{dna_tools.kind}` can not be "
+                            "rasterized")
+        self.tools = dna_tools
+        self.kind = dna_tools.kind
+        self.stamps = {}
+
+    def stamp(self, r: int):
+        if r not in self.stamps:
+            self.stamps[r] = circle_stamp(r)
+        return self.stamps[r]
+
+    def blend(self, region, mask, color):
+        """ Blends [color] into the pixels of [region] chosen by the boolean
+        [mask], which has the shape of the region. """
+        *ink, a = [min(c, 255) for c in color]
+        values = region * (255 - a)
+        values += np.array([c * a + 128 for c in ink], dtype=np.uint16)
+        values += values >> 8
+        values >>= 8
+        np.copyto(region, values, where=mask[..., None])
+
+    def render(self, dna)-> np.ndarray:
+        """ Returns the drawing of a single dna as a uint16 array of shape
+        (h, w, 3). """
+        w, h = self.tools.genes.w, self.tools.genes.h
+        colors = dna["color"].tolist()
+        # The first gene is the background
+        pixels = np.empty((h, w, 3), dtype=np.uint16)
+        pixels[:] = [min(c, 255) for c in colors[0][:3]]
+
+        if self.kind == "circle":
+            for x, y, r, color in zip(dna["x"].tolist(), dna["y"].tolist(),
+                                      dna["r"].tolist(), colors):
+                left, top = max(0, x - r), max(0, y - r)
+                right, bot = min(w, x + r + 1), min(h, y + r + 1)
+                if left >= right or top >= bot:
+                    continue
+                mask = self.stamp(r)[top - y + r:bot - y + r,
+                                     left - x + r:right - x + r]
+                self.blend(pixels[top:bot, left:right], mask, color)
+        else:
+            polygons = [points[:n].tolist() for n, points in
+                        zip(dna["n"].tolist(), dna["points"])]
+            for covered, color in zip(polygon_masks(polygons, w, h), colors):
+                if covered is None:
+                    continue
+                left, top, mask = covered
+                self.blend(pixels[top:top + mask.shape[0],
+                                  left:left + mask.shape[1]], mask, color)
+        return pixels
+
+    def evaluate_dna(self, dna, img):
+        """ Returns the score of a single dna and its drawing. """
+        pixels = self.render(dna)
+        return as_target(img).score_pixels(pixels), pixels
+
+
+def check_exactness(dna_tools, dnas)-> int:
+    """ Returns the number of dnas of the ArrayDNA [dna_tools] that the
+    rasterizer draws differently from PIL. """
+    rasterizer = Rasterizer(dna_tools)
+    wrong = 0
+    for dna in dnas:
+        drawn = np.asarray(dna_tools.dna_to_image(dna))
+        wrong += not np.array_equal(drawn, rasterizer.render(dna))
+    return wrong
@@ -0,0 +1,75 @@
+# =============================================================================
+# Adaptive mutation rates. Early in a run most offspring beat their competitor,
+# while late in a long run almost all of them are rejected. The scheduler
+# follows the 1/5th success rule of evolution strategies: after every window of
+# offspring it compares the share of accepted ones with a target and grows or
+# shrinks all mutation rates and step sizes by a common factor.
+
+# Evolution specs that are probabilities
+RATE_SPECS = ["gene_mutation_ratio", "property_mutation_ratio",
+              "combine_ratio", "gene_switch_ratio"]
+# Gene specs that are step sizes in pixels or colors
+STEP_SPECS = ["mut_p", "mut_r", "mut_c"]
+
+
+class RateScheduler:
+    """ Adapts the specs of [dna_tools] (dict or array tools) online. The
+    original specs are kept as the base and the tools get scaled copies, so
+    the specs saved with a run are never changed. Settings are read from the
+    evolution specs: [adapt_window] offspring per adaptation, the
+    [adapt_target] share of accepted offspring, the [adapt_factor] by which
+    the scale changes and the [adapt_min] and [adapt_max] scale. """
+
+    def __init__(self, dna_tools):
+        self.tools = dna_tools
+        self.evo_specs = dict(dna_tools.specs)
+        self.gene_specs = dict(dna_tools.genes.specs)
+
+        specs = self.evo_specs
+        self.window = specs.get("adapt_window", 200)
+        self.target = specs.get("adapt_target", 0.2)
+        self.factor = specs.get("adapt_factor", 1.2)
+        self.low = specs.get("adapt_min", 0.05)
+        self.high = specs.get("adapt_max", 2.0)
+
+        self.scale, self.tried, self.accepted = 1.0, 0, 0
+
+    def record(self, accepted: bool):
+        """ Counts an offspring and adapts the rates after each window. """
+        self.tried += 1
+        self.accepted += bool(accepted)
+        if self.tried >= self.window:
+            self.adapt()
+
+    def adapt(self):
+        success = self.accepted / self.tried
+        if success > self.target:
+            self.scale = min(self.high, self.scale * self.factor)
+        elif success < self.target:
+            self.scale = max(self.low, self.scale / self.factor)
+        self.tried, self.accepted = 0, 0
+        self.apply()
+
+    def apply(self):
+        """ Gives the tools copies of the base specs scaled by [scale]. """
+        evo_specs, gene_specs = dict(self.evo_specs), dict(self.gene_specs)
+        for spec in RATE_SPECS:
+            evo_specs[spec] = min(1, self.evo_specs[spec] * self.scale)
+        for spec in STEP_SPECS:
+            if spec in gene_specs:
+                gene_specs[spec] = max(1, round(gene_specs[spec] * self.scale))
+
+        self.tools.specs = evo_specs
+        self.tools.genes.specs = gene_specs
+        if hasattr(self.tools, "dict_tools"):
+            self.tools.dict_tools.specs = evo_specs
+
+    def state(self)-> dict:
+        """ Returns the state of the scheduler, as stored in checkpoints. """
+        return {"scale": self.scale, "tried": self.tried,
+                "accepted": self.accepted}
+
+    def set_state(self, state: dict):
+        self.scale = state["scale"]
+        self.tried, self.accepted = state["tried"], state["accepted"]
+        self.apply()
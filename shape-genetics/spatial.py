@@ -0,0 +1,117 @@
+# =============================================================================
+# Spatial index of genes. The canvas is split into square cells and every cell
+# holds the indices of the genes whose box touches it, so redrawing a small
+# region only looks at the genes near it instead of the whole dna. An
+# offspring shares most genes with its parent, so its grid is derived from the
+# parent grid by moving just the changed genes. The boxes and cells of the
+# parent are shared, the offspring only holds the ones it changed on top of
+# them. Once a grid holds more than [FLATTEN_AFTER] changes (passed down from
+# its ancestors), it folds them into a base of its own.
+
+FLATTEN_AFTER = 64
+
+
+class GeneGrid:
+
+    def __init__(self, w, h, cell: int):
+        self.w, self.h, self.cell = w, h, cell
+        self.cols, self.rows = -(-w // cell), -(-h // cell)
+        self.dna = None
+        self.base_boxes = []  # box of every gene, in dna order
+        self.base_cells = {}  # (col, row) -> set of gene indices
+        # boxes and cells that differ from the shared base ones
+        self.changed_boxes, self.changed_cells = {}, {}
+
+    def box(self, k: int):
+        """ Returns the box of the gene with index [k]. """
+        box = self.changed_boxes.get(k)
+        return self.base_boxes[k] if box is None else box
+
+    def genes_in(self, cell)-> set:
+        """ Returns the indices of the genes that touch [cell]. """
+        genes = self.changed_cells.get(cell)
+        return self.base_cells.get(cell, ()) if genes is None else genes
+
+    def cell_range(self, box):
+        """ Returns the ranges of columns and rows of the cells that [box]
+        touches, clipped to the canvas. """
+        l, t, r, b = box
+        c = self.cell
+        col_low = min(self.cols-1, max(0, l // c))
+        col_high = min(self.cols-1, max(0, (r-1) // c))
+        row_low = min(self.rows-1, max(0, t // c))
+        row_high = min(self.rows-1, max(0, (b-1) // c))
+        return range(col_low, col_high+1), range(row_low, row_high+1)
+
+    def add(self, k: int, box, copied):
+        """ Adds the gene [k] to the cells [box] touches. Cells not in the set
+        [copied] are shared with other grids and copied first. """
+        cols, rows = self.cell_range(box)
+        for cell in ((i, j) for i in cols for j in rows):
+            if cell not in copied:
+                self.changed_cells[cell] = set(self.genes_in(cell))
+                copied.add(cell)
+            self.changed_cells[cell].add(k)
+
+    def remove(self, k: int, box, copied):
+        cols, rows = self.cell_range(box)
+        for cell in ((i, j) for i in cols for j in rows):
+            if cell not in copied:
+                self.changed_cells[cell] = set(self.genes_in(cell))
+                copied.add(cell)
+            self.changed_cells[cell].discard(k)
+
+    def flatten(self):
+        """ Folds the changes into a new base of the grid. """
+        if not self.changed_boxes and not self.changed_cells:
+            return
+        self.base_boxes = list(self.base_boxes)
+        for k, box in self.changed_boxes.items():
+            self.base_boxes[k] = box
+        self.base_cells = {**self.base_cells, **self.changed_cells}
+        self.changed_boxes, self.changed_cells = {}, {}
+
+    def query(self, box)-> list:
+        """ Returns the indices of the genes whose boxes overlap [box], in
+        paint order. """
+        l, t, r, b = box
+        cols, rows = self.cell_range(box)
+        found = set()
+        for i in cols:
+            for j in rows:
+                found.update(self.genes_in((i, j)))
+        boxes = [(k, self.box(k)) for k in found]
+        return sorted(k for k, (gl, gt, gr, gb) in boxes
+                      if gl < r and l < gr and gt < b and t < gb)
+
+
+def build_grid(dna, bbox, w, h, cell: int)-> GeneGrid:
+    """ Returns the grid of all genes of [dna], using [bbox] to get the box of
+    a gene. """
+    grid = GeneGrid(w, h, cell)
+    grid.dna = dna
+    grid.base_boxes = [bbox(gene) for gene in dna]
+    copied = set()
+    for k, box in enumerate(grid.base_boxes):
+        grid.add(k, box, copied)
+    grid.flatten()
+    return grid
+
+
+def derive_grid(parent: GeneGrid, dna, changed, bbox)-> GeneGrid:
+    """ Returns the grid of [dna], an offspring of the dna of the [parent]
+    grid with the same length that differs from it in the genes with indices
+    [changed]. """
+    if len(parent.changed_boxes) + len(parent.changed_cells) > FLATTEN_AFTER:
+        parent.flatten()
+    grid = GeneGrid(parent.w, parent.h, parent.cell)
+    grid.dna = dna
+    grid.base_boxes, grid.base_cells = parent.base_boxes, parent.base_cells
+    grid.changed_boxes = dict(parent.changed_boxes)
+    grid.changed_cells = dict(parent.changed_cells)
+    copied = set()
+    for k in changed:
+        grid.remove(k, parent.box(k), copied)
+        grid.changed_boxes[k] = bbox(dna[k])
+        grid.add(k, grid.changed_boxes[k], copied)
+    return grid
@@ -0,0 +1,191 @@
+import csv
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =============================================================================
+# Telemetry of an evolution. Every [every] steps the evolution emits a record
+# (a flat dict) with the scores of the population, the share of accepted
+# offspring, the throughput and where the time went since the last record.
+# Records are passed to sinks, which are functions called as
+# sink(record, best_image), where best_image() draws the best member at the
+# time of the record. Nothing is drawn unless a sink calls it, which it may
+# also do later and from another thread. The sinks here write records to
+# JSONL or CSV files and serve the latest record and drawing over HTTP, any
+# other function can be added as a callback.
+
+FIELDS = ["step", "time", "best", "worst", "acceptance", "evals_per_sec",
+          "mutate_time", "draw_time", "diff_time"]
+
+
+class Telemetry:
+
+    def __init__(self, sinks=(), every=100, out=None, port=None):
+        """ Emits a record to all [sinks] every [every] steps. If [out] is
+        given, records are written to it, as CSV if it ends with .csv and as
+        JSONL otherwise. If [port] is given, the latest record and drawing are
+        served on localhost, see [ProgressServer]. Use as a context manager or
+        call [close] to release the files and the server. """
+        self.sinks = list(sinks)
+        self.every = every
+        if out is not None:
+            self.sinks.append(CsvSink(out) if out.endswith(".csv")
+                              else JsonlSink(out))
+        if port is not None:
+            self.sinks.append(ProgressServer(port))
+
+        self.start = time.perf_counter()
+        self.reset(self.start)
+
+    def reset(self, now):
+        self.since, self.tried, self.accepted = now, 0, 0
+        self.mutate_time, self.evaluate_time, self.diff_time = 0.0, 0.0, 0.0
+
+    def record(self, accepted: bool, mutate_time=0.0, evaluate_time=0.0):
+        """ Counts an offspring and the time spent making and scoring it. """
+        self.tried += 1
+        self.accepted += bool(accepted)
+        self.mutate_time += mutate_time
+        self.evaluate_time += evaluate_time
+
+    def due(self, step: int, k=1)-> bool:
+        """ Whether a record is due after the [k] steps before [step]. """
+        return step // self.every > (step - k) // self.every
+
+    def emit(self, step: int, scores, best_image):
+        """ Passes a record of the population [scores] to all sinks. """
+        now = time.perf_counter()
+        elapsed = max(now - self.since, 1e-9)
+        record = {
+            "step": step,
+            "time": round(now - self.start, 3),
+            "best": float(min(scores)),
+            "worst": float(max(scores)),
+            "acceptance": self.accepted / max(self.tried, 1),
+            "evals_per_sec": self.tried / elapsed,
+            "mutate_time": self.mutate_time,
+            # scoring in other processes is only seen as drawing time
+            "draw_time": max(0.0, self.evaluate_time - self.diff_time),
+            "diff_time": self.diff_time,
+        }
+        for sink in self.sinks:
+            sink(record, best_image)
+        self.reset(now)
+        return record
+
+    def close(self):
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+# =============================================================================
+# Sinks
+
+
+class JsonlSink:
+    """ Appends every record to the file at [path] as a line of json. """
+
+    def __init__(self, path):
+        self.file = open(path, "a")
+
+    def __call__(self, record, best_image):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CsvSink:
+    """ Writes the records to a CSV file at [path], with a header row. """
+
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+        self.writer.writeheader()
+
+    def __call__(self, record, best_image):
+        self.writer.writerow(record)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ProgressServer:
+    """ Serves the latest record as json on http://127.0.0.1:[port]/ and the
+    latest best drawing on /best.png from a background thread. The drawing is
+    only made when it is first requested. Port 0 picks a free port, which is
+    then stored in [port]. """
+
+    def __init__(self, port=0):
+        self.record, self.best_image, self.image = None, None, None
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port),
+                                          self.make_handler())
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def __call__(self, record, best_image):
+        with self.lock:
+            self.record, self.best_image, self.image = record, best_image, None
+
+    def latest_image(self):
+        """ Returns the drawing of the latest record, drawing it if needed. """
+        with self.lock:
+            best_image, image = self.best_image, self.image
+        if image is None and best_image is not None:
+            image = best_image()
+            with self.lock:
+                # a newer record may have come in while drawing
+                if self.best_image is best_image:
+                    self.image = image
+        return image
+
+    def make_handler(self):
+        progress = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                with progress.lock:
+                    record = progress.record
+                image = None
+                if self.path == "/best.png":
+                    image = progress.latest_image()
+                if image is not None:
+                    buffer = io.BytesIO()
+                    image.save(buffer, "PNG")
+                    body, kind = buffer.getvalue(), "image/png"
+                elif self.path in ("/", "/progress"):
+                    body = json.dumps(record).encode()
+                    kind = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", kind)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # requests would clutter the reports of the evolution
+
+        return Handler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,4 +1,5 @@
 import evolution
+import telemetry
 
 name = "shape-genetics-starting"
 
@@ -21,11 +22,57 @@ gene_specs = {"mut_p": 30, "mut_n": 0.1, "mut_c": 30, "init_r": 50, "max_n": 5}
 
 evo_specs = {"pop_size": 50, "dna_len": 50, "kind": "polygon",
              "gene_switch_ratio": 0.2, "gene_mutation_ratio": 0.05,
-             "property_mutation_ratio": 0.1, "combine_ratio": 0.1}
+             "property_mutation_ratio": 0.1, "combine_ratio": 0.1,
+             "incremental": True}
+
+# Coarse to fine, as [downscale factor, share of steps] phases
+# evo_specs["resolutions"] = [[8, 0.4], [4, 0.3], [2, 0.2], [1, 0.1]]
+
+# Adapt mutation rates to the share of accepted offspring (1/5th rule)
+# evo_specs.update({"adaptive": True, "adapt_window": 200})
+
+# Resume drawing from snapshots of the parent, for metrics that are not local.
+# Pays off once offspring change few genes (low mutation and combine ratios).
+# evo_specs.update({"prefix_cache": True, "prefix_every": 20,
+#                   "prefix_budget": 256})
+
+# Draw circles and polygons of array dnas with the numpy rasterizer, exact but
+# slower than PIL (see raster.py)
+# evo_specs.update({"representation": "array", "rasterizer": "numpy"})
+
+# Evolve 4 islands in separate processes that swap their best dnas every 1000
+# steps, through files in a directory that machines can share (see islands.py)
+# evo_specs.update({"islands": 4, "migration_step": 1000,
+#                   "island_dir": "migrants"})
+
+# Evolve a single lineage by simulated annealing (or "hill" climbing) instead
+# of the genetic algorithm, pop_size is then ignored
+# evo_specs.update({"engine": "anneal", "anneal_start": 1e-3,
+#                   "anneal_end": 1e-6})
+
+# Look up the genes of an incremental redraw in a grid of 32 pixel cells,
+# for long dnas
+# evo_specs.update({"dna_len": 1000, "spatial_index": 32})
+
+# Grow the dna one gene at a time instead of evolving it (see greedy.py)
+# import greedy
+# evo_specs.update({"grow_candidates": 1000, "grow_refine": 100})
+# greedy.grow_image(in_path, out_path, gene_specs, evo_specs,
+#                   json_out=f"{name}_0.json")
+
+# Stop early after an hour, at a score of 5 per pixel, or once the best score
+# improved by less than 0.1% in 5000 steps (see stopping.py)
+# evo_specs.update({"stop_seconds": 3600, "stop_score": 5,
+#                   "stop_window": 5000, "stop_epsilon": 0.001})
+
+# Records of the evolution in a JSONL (or .csv) file, the latest one is also
+# served with the best drawing on http://127.0.0.1:8000/ and /best.png
+# tel = telemetry.Telemetry(every=1000, out=f"{name}.jsonl", port=8000)
+tel = None
 
 # Initial evolution
 evolution.evolve_image(in_path, out_path, steps, gene_specs, evo_specs,
-                       json_out=f"{name}_0.json")
+                       json_out=f"{name}_0.json", telemetry=tel)
 
 # Reevolutions (offers breakpoints)
 for k in range(0, reevolutions):
@@ -0,0 +1,4 @@
+# =============================================================================
+# Modules shared by shape-genetics, minimal-art-evolution and triangle-mesh.
+# Each project re-exports them under their plain names (target, stopping,
+# streams and snapshots), so the projects still run from their own directory.
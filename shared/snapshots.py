@@ -0,0 +1,72 @@
+import os
+import threading
+from collections import deque
+
+# =============================================================================
+# Intermediate pictures of an evolution are drawn and saved on a background
+# thread, so that drawing large frames and encoding them as PNG does not stall
+# the evolution. The evolution only hands over what is to be drawn. If frames
+# come faster than they can be written, the oldest waiting ones are dropped,
+# as every frame is better than the ones before it.
+
+
+class SnapshotWriter:
+
+    def __init__(self, render, out_dir=".", queue_size=4):
+        """ Saves frames to [out_dir], where [render] turns a submitted item
+        into a PIL image. At most [queue_size] frames wait to be written. Use
+        as a context manager or call [close] to write the remaining frames.
+        Submitted items must not be changed afterwards. """
+        self.render = render
+        self.out_dir = out_dir
+        self.queue_size = max(1, queue_size)
+        os.makedirs(out_dir, exist_ok=True)
+
+        self.frames = deque()
+        self.dropped = 0
+        self.error = None
+        self.closed = False
+        self.ready = threading.Condition()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def submit(self, name: str, item):
+        """ Queues [item] to be drawn and saved as [name]. """
+        with self.ready:
+            if self.closed:
+                raise Exception("Snapshot writer is closed")
+            if len(self.frames) >= self.queue_size:
+                self.frames.popleft()
+                self.dropped += 1
+            self.frames.append((name, item))
+            self.ready.notify()
+
+    def work(self):
+        while True:
+            with self.ready:
+                while not self.frames and not self.closed:
+                    self.ready.wait()
+                if not self.frames:
+                    return
+                name, item = self.frames.popleft()
+            try:
+                self.render(item).save(os.path.join(self.out_dir, name))
+            except Exception as error:
+                self.error = error
+
+    def close(self):
+        """ Waits until all queued frames are written. Errors of the writer
+        thread are raised here. """
+        with self.ready:
+            self.closed = True
+            self.ready.notify()
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,74 @@
+import time
+
+# =============================================================================
+# Stopping criteria besides the number of steps. An evolution can stop when a
+# wall clock budget is spent, when its score reaches a target, or when it
+# stops improving: the best score has not dropped by more than a share
+# [epsilon] of itself in the last [window] steps. The evolution asks its
+# stopper before every step and ends early once it says so, its results are
+# then saved as if the steps had run out.
+#
+# Specs (all optional, no stopper without any of them):
+#   stop_seconds  wall clock budget in seconds, counted from the start
+#   stop_score    error per pixel to reach (see the evolution for its scale)
+#   stop_window   steps without improvement that make a plateau
+#   stop_epsilon  share of the score that counts as improvement (default 0)
+
+
+class Stopper:
+
+    def __init__(self, seconds=None, score=None, window=None, epsilon=0.0):
+        self.seconds, self.score = seconds, score
+        self.window, self.epsilon = window, epsilon
+        self.start = time.perf_counter()
+        self.reason = None  # "time budget", "target score" or "plateau"
+        self.step = None  # step it stopped at
+        self.mark, self.mark_step = None, None  # last improvement
+
+    def check(self, step: int, score)-> bool:
+        """ Records the best [score] before [step] and returns whether the
+        evolution should stop there. Once it stops, it stays stopped. """
+        if self.reason is None:
+            self.reason = self.stop_reason(step, score)
+            self.step = step if self.reason else None
+        return self.reason is not None
+
+    def stop_reason(self, step: int, score):
+        if (self.seconds is not None and
+                time.perf_counter() - self.start >= self.seconds):
+            return "time budget"
+        if self.score is not None and score <= self.score:
+            return "target score"
+        if self.window:
+            if (self.mark is None or
+                    score < self.mark - self.epsilon * abs(self.mark)):
+                self.mark, self.mark_step = score, step
+            elif step - self.mark_step >= self.window:
+                return "plateau"
+        return None
+
+    def restart(self):
+        """ Starts a new phase of the evolution, whose scores are not compared
+        with the ones before. A plateau is forgotten, a spent time budget or a
+        reached score still stops the new phase. """
+        self.mark, self.mark_step = None, None
+        if self.reason == "plateau":
+            self.reason, self.step = None, None
+
+
+def stopper_from_specs(specs):
+    """ Returns the stopper set by the stop_* [specs], or None if there are
+    none. """
+    if all(specs.get(spec) is None for spec in
+           ("stop_seconds", "stop_score", "stop_window")):
+        return None
+    return Stopper(specs.get("stop_seconds"), specs.get("stop_score"),
+                   specs.get("stop_window"), specs.get("stop_epsilon", 0.0))
+
+
+def final_step(stopper, end: int)-> int:
+    """ Returns the step at which an evolution meant to run up to [end]
+    ended. """
+    if stopper is not None and stopper.reason is not None:
+        return stopper.step
+    return end
@@ -0,0 +1,43 @@
+import random
+import numpy as np
+
+# =============================================================================
+# Random streams. Every part of a run that draws random numbers (the
+# population, an island, a member of a population, ...) gets its own stream,
+# spawned from a single seed. The streams are independent of each other, so a
+# run is reproducible no matter in which order or process its parts run.
+#
+# A seed is None (fresh entropy), an int, a numpy SeedSequence, a numpy
+# Generator or a python Random. Generators are only drawn from once, to seed
+# the streams.
+
+
+def seed_sequence(seed)-> np.random.SeedSequence:
+    """ Returns the seed sequence of any kind of seed. """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(seed.integers(2**32, size=4).tolist())
+    if isinstance(seed, random.Random):
+        return np.random.SeedSequence(seed.getrandbits(128))
+    return np.random.SeedSequence(seed)
+
+
+def spawn(seed, n: int)-> list:
+    """ Returns the seed sequences of [n] independent streams. Unlike
+    SeedSequence.spawn, the same seed always gives the same streams. """
+    seq = seed_sequence(seed)
+    return [np.random.SeedSequence(seq.entropy, spawn_key=seq.spawn_key + (k,),
+                                   pool_size=seq.pool_size)
+            for k in range(n)]
+
+
+def python_random(seed)-> random.Random:
+    """ Returns a python generator of the stream of [seed]. """
+    state = seed_sequence(seed).generate_state(4)
+    return random.Random(int.from_bytes(state.tobytes(), "little"))
+
+
+def numpy_random(seed)-> np.random.Generator:
+    """ Returns a numpy generator of the stream of [seed]. """
+    return np.random.default_rng(seed_sequence(seed))
@@ -0,0 +1,279 @@
+import numpy as np
+from PIL import Image, ImageChops
+
+tyBox = tuple  # (left, top, right, bottom)
+
+# =============================================================================
+# Fitness metrics. A metric compares the target pixels with the pixels of a
+# drawing (both int16 arrays of shape (h, w, 3)) and returns an error, lower is
+# better. [weights] is None or a float array of shape (h, w) that makes some
+# regions of the picture count more than others. Local metrics are sums over
+# pixels, so a part of the picture can be scored on its own.
+
+# Luminance weights of the red, green and blue channels
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+SSIM_WINDOW = 8
+SSIM_LEVELS = 3
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+
+def l1_metric(pixels, drawn, weights=None):
+    """ Sum of absolute differences of all channels. """
+    diff = np.abs(pixels - drawn)
+    if weights is None:
+        return int(diff.sum(dtype=np.int64))
+    return float((diff.sum(axis=2, dtype=np.int64) * weights).sum())
+
+
+def l2_metric(pixels, drawn, weights=None):
+    """ Sum of squared differences of all channels. """
+    diff = (pixels - drawn).astype(np.int64)
+    diff = diff * diff
+    if weights is None:
+        return int(diff.sum())
+    return float((diff.sum(axis=2) * weights).sum())
+
+
+def luminance_metric(pixels, drawn, weights=None):
+    """ Sum of absolute differences in brightness, times 3 so that it is in the
+    same range as [l1_metric]. Colors only matter through their brightness. """
+    diff = np.abs((pixels - drawn) @ LUMA) * 3
+    if weights is not None:
+        diff = diff * weights
+    return float(diff.sum())
+
+
+def block_means(values, size: int):
+    """ Returns the means of non-overlapping [size] x [size] blocks. Pixels
+    that do not fill a whole block are left out. """
+    h, w = values.shape[0] // size, values.shape[1] // size
+    blocks = values[:h*size, :w*size].reshape(h, size, w, size)
+    return blocks.mean(axis=(1, 3))
+
+
+def ssim_metric(pixels, drawn, weights=None):
+    """ Structural dissimilarity of the brightness. The structural similarity
+    is computed over non-overlapping windows on a pyramid of [SSIM_LEVELS]
+    halved images and averaged. The result is scaled to the range of
+    [l1_metric]. """
+    h, w = pixels.shape[:2]
+    x = pixels @ LUMA
+    y = drawn @ LUMA
+
+    total, levels = 0, 0
+    for _ in range(SSIM_LEVELS):
+        size = min(SSIM_WINDOW, *x.shape)
+        mu_x, mu_y = block_means(x, size), block_means(y, size)
+        var_x = block_means(x * x, size) - mu_x * mu_x
+        var_y = block_means(y * y, size) - mu_y * mu_y
+        cov = block_means(x * y, size) - mu_x * mu_y
+        ssim = ((2 * mu_x * mu_y + SSIM_C1) * (2 * cov + SSIM_C2) /
+                ((mu_x * mu_x + mu_y * mu_y + SSIM_C1) *
+                 (var_x + var_y + SSIM_C2)))
+        if weights is None:
+            total += ssim.mean()
+        else:
+            block_weights = block_means(weights, size)
+            total += (ssim * block_weights).sum() / max(block_weights.sum(),
+                                                        1e-9)
+        levels += 1
+
+        if min(x.shape) < 2 * SSIM_WINDOW:
+            break
+        x, y = block_means(x, 2), block_means(y, 2)
+        if weights is not None:
+            weights = block_means(weights, 2)
+
+    return float((1 - total / levels) * h * w * 3 * 255)
+
+
+# Registered metrics, name: (function, local)
+METRICS = {
+    "l1": (l1_metric, True),
+    "l2": (l2_metric, True),
+    "luminance": (luminance_metric, True),
+    "ssim": (ssim_metric, False),
+}
+
+
+def register_metric(name: str, metric, local=False):
+    """ Adds a metric, so that targets can be created with its [name]. """
+    METRICS[name] = (metric, local)
+
+
+# Errors of single pixels under the local metrics above, from the differences
+# between the target and the drawing (an int16 array of shape (n, 3)). They
+# add up to the metric. Used to score many small changes of a drawing at once
+# (see greedy.py of shape-genetics).
+def l1_pixels(diff):
+    diff = np.abs(diff)
+    return diff[:, 0] + diff[:, 1] + diff[:, 2]
+
+
+def l2_pixels(diff):
+    diff = diff.astype(np.int32)
+    diff *= diff
+    return diff[:, 0] + diff[:, 1] + diff[:, 2]
+
+
+def luminance_pixels(diff):
+    return np.abs(diff @ LUMA) * 3
+
+
+PIXEL_ERRORS = {"l1": l1_pixels, "l2": l2_pixels,
+                "luminance": luminance_pixels}
+
+
+# =============================================================================
+# The image that is being approximated. It is decoded once and kept both as a
+# PIL image and as a contiguous array, so that scoring a drawing is a single
+# pass over the pixels instead of a difference image followed by histograms.
+
+
+class Target:
+
+    def __init__(self, img: Image, metric="l1", scale=1, weights=None):
+        """ Drawings are scored with the named [metric]. If [scale] is above
+        1, they are scored on a [scale] times smaller proxy of the target,
+        which is faster but less exact. [weights] is a grayscale mask (an
+        image, a path to one or an array with values in [0, 1]) that makes the
+        brighter regions of the target count more. """
+        if metric not in METRICS:
+            raise Exception(f"Unknown metric `{metric}`")
+
+        self.img = img.convert("RGB")  # also forces the image to be decoded
+        self.width, self.height = self.img.size
+        self.size = self.img.size
+        self.pixels = np.ascontiguousarray(self.img, dtype=np.int16)
+
+        # the path of the weights, kept to recreate the target from settings
+        self.weights_path = weights if isinstance(weights, str) else None
+        if isinstance(weights, str):
+            weights = Image.open(weights)
+        if isinstance(weights, Image.Image):
+            weights = weights.convert("L").resize(self.size, Image.BILINEAR)
+            weights = np.asarray(weights, dtype=np.float32) / 255
+        elif weights is not None:
+            weights = np.asarray(weights, dtype=np.float32)
+        self.metric, self.scale, self.weights = metric, scale, weights
+
+        self.proxy = None
+        if scale > 1:
+            small_weights = None
+            if weights is not None:
+                small_weights = np.asarray(
+                    Image.fromarray(weights, "F").reduce(scale))
+            self.proxy = Target(self.img.reduce(scale), metric, 1,
+                                small_weights)
+
+    @property
+    def local(self)-> bool:
+        """ Whether a part of a drawing can be scored on its own. """
+        return METRICS[self.metric][1] and self.proxy is None
+
+    def weights_setting(self):
+        """ Returns the weights as their path, or as nested lists if they were
+        not read from a file. """
+        if self.weights_path is not None or self.weights is None:
+            return self.weights_path
+        return self.weights.tolist()
+
+    def settings(self)-> dict:
+        """ Returns the arguments that recreate the metric of the target, as
+        json values. """
+        return {"metric": self.metric, "scale": self.scale,
+                "weights": self.weights_setting()}
+
+    def exact(self)-> "Target":
+        """ Returns the target with the same metric but without the proxy. """
+        if self.proxy is None:
+            return self
+        return Target(self.img, self.metric, 1, self.weights)
+
+    def resized(self, w: int, h: int)-> "Target":
+        """ Returns a smaller or larger target with the same metric. """
+        weights = self.weights
+        if weights is not None:
+            weights = np.asarray(
+                Image.fromarray(weights, "F").resize((w, h), Image.BOX))
+        return Target(self.img.resize((w, h), Image.BOX), self.metric,
+                      self.scale, weights)
+
+    def difference(self, drawing: Image, box: tyBox = None)-> int:
+        """ Returns the sum of absolute pixel differences between the target
+        and the drawing. If [box] is given, the drawing covers only that part
+        of the target. """
+        if box is None:
+            diff = ImageChops.difference(self.img, drawing)
+            return int(np.asarray(diff).sum(dtype=np.int64))
+
+        left, top, right, bot = box
+        pixels = self.pixels[top:bot, left:right]
+        diff = pixels - np.asarray(drawing, dtype=np.int16)
+        return int(np.abs(diff).sum(dtype=np.int64))
+
+    def score(self, drawing: Image, box: tyBox = None):
+        """ Returns the error of the drawing under the metric of the target. If
+        [box] is given, the drawing covers only that part of the target, which
+        requires a local metric. """
+        if self.proxy is not None:
+            return self.proxy.score(drawing.reduce(self.scale)) * self.scale**2
+        if self.metric == "l1" and self.weights is None:
+            return self.difference(drawing, box)
+        return self.score_pixels(np.asarray(drawing, dtype=np.int16), box)
+
+    def box_errors(self, boxes, drawn):
+        """ Returns the error of every pixel of the [boxes], row by row and box
+        after box, when they are [drawn] (a list of int arrays of shape
+        (h, w, 3), one per box). Requires a metric in PIXEL_ERRORS. """
+        sizes = [len(pixels) * len(pixels[0]) for pixels in drawn]
+        diff = np.empty((sum(sizes), 3), dtype=np.int16)
+        weights = None
+        if self.weights is not None:
+            weights = np.empty(len(diff), dtype=np.float32)
+        start = 0
+        for (left, top, right, bot), pixels, size in zip(boxes, drawn, sizes):
+            end = start + size
+            np.subtract(self.pixels[top:bot, left:right], pixels,
+                        out=diff[start:end].reshape(pixels.shape))
+            if weights is not None:
+                weights[start:end] = self.weights[top:bot, left:right].ravel()
+            start = end
+        errors = PIXEL_ERRORS[self.metric](diff)
+        return errors if weights is None else errors * weights
+
+    def score_pixels(self, drawn, box: tyBox = None):
+        """ Same as [score], for a drawing given as an int array of shape
+        (h, w, 3). """
+        if self.proxy is not None:
+            drawing = Image.fromarray(drawn.astype(np.uint8))
+            return self.proxy.score(drawing.reduce(self.scale)) * self.scale**2
+
+        metric, local = METRICS[self.metric]
+        pixels, weights = self.pixels, self.weights
+        if box is not None:
+            if not local:
+                raise Exception(f"Metric `{self.metric}` is not local")
+            left, top, right, bot = box
+            pixels = pixels[top:bot, left:right]
+            if weights is not None:
+                weights = weights[top:bot, left:right]
+        return metric(pixels, drawn, weights)
+
+
+def as_target(img)-> Target:
+    """ Returns [img] as a target, decoding it if it is a PIL image. """
+    return img if isinstance(img, Target) else Target(img)
+
+
+def target_from_specs(img: Image, specs)-> Target:
+    """ Returns a target scored as set by the [metric], [metric_scale] and
+    [metric_weights] specs. The weights are given by their path, so that
+    the specs stay json values. """
+    weights = specs.get("metric_weights", None)
+    if weights is not None and not isinstance(weights, str):
+        raise Exception("The metric_weights spec has to be a path")
+    return Target(img, specs.get("metric", "l1"), specs.get("metric_scale", 1),
+                  weights)
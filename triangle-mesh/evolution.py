@@ -1,9 +1,13 @@
 import random
+import snapshots
+import stopping
+import streams
 import time
 import mesh as meshtools
-from random import randint
+import numpy as np
+from target import Target, as_target, target_from_specs
 from typing import List, Tuple
-from PIL import Image, ImageDraw, ImageChops, ImageStat
+from PIL import Image, ImageDraw
 
 # Type definitions
 tyPosition = Tuple[float, float]
@@ -29,36 +33,69 @@ def draw_image(width: int, height: int, mesh: tyMesh, **borderkwargs)-> Image:
     return canvas
 
 
-def evaluate_mesh(mesh: tyMesh, real_image: Image)-> float:
+def evaluate_mesh(mesh: tyMesh, real_image: Target)-> float:
     """Calculates the difference between the image and the drawing."""
+    real_image = as_target(real_image)
     drawn_image = draw_image(real_image.width, real_image.height, mesh)
 
-    diff_img = ImageChops.difference(drawn_image, real_image)
+    diff = real_image.score(drawn_image)
 
-    stats = ImageStat.Stat(diff_img)
+    return diff / (real_image.width * real_image.height) / 4
 
-    return sum(stats.mean)/4
 
+def solve_colors(mesh: tyMesh, real_image: Target)-> tyMesh:
+    """ Returns the mesh with every triangle in the mean color of the target
+    under it, which minimises the squared error. All triangles are solved in
+    one pass over a map of which triangle covers each pixel. Triangles that
+    cover no pixels keep their color. """
+    real_image = as_target(real_image)
+    vertices, colors = meshtools.copy_mesh(mesh)
+    labels = np.asarray(meshtools.draw_labels(mesh, real_image.width,
+                                              real_image.height)).ravel()
+    pixels = real_image.pixels.reshape(-1, 3)
+    weights = real_image.weights
+    weights = None if weights is None else weights.ravel()
 
-def wiggle_mesh(mesh: tyMesh, real_image: Image, wiggle_steps: int, wiggle_factor: float,
-                color_only=False, safe_only=True)-> tyMesh:
+    counts = np.bincount(labels, weights, minlength=len(colors)+1)
+    sums = [np.bincount(labels, pixels[:, c] if weights is None else
+                        pixels[:, c] * weights, minlength=len(colors)+1)
+            for c in range(3)]
+    for k in range(len(colors)):
+        if counts[k+1] > 0:
+            fill = [min(255, max(0, round(s[k+1] / counts[k+1]))) for s in sums]
+            colors[k] = (*fill, colors[k][3])
+
+    return (vertices, colors)
+
+
+def wiggle_mesh(mesh: tyMesh, real_image: Target, wiggle_steps: int, wiggle_factor: float,
+                color_only=False, safe_only=True, rng=random, solve=False)-> tyMesh:
+    """ Returns the mesh with colors and vertices wiggled one by one, keeping
+    the changes that improve it. With [solve], the colors are solved for
+    instead (see [solve_colors]). """
 
     new_mesh = meshtools.copy_mesh(mesh)
     best_fit = evaluate_mesh(new_mesh, real_image)
+    if solve:
+        solved = solve_colors(new_mesh, real_image)
+        solved_fit = evaluate_mesh(solved, real_image)
+        if solved_fit < best_fit:
+            new_mesh, best_fit = solved, solved_fit
     vertices, colors = new_mesh
 
-    for i in range(len(colors)):
-        for _ in range(wiggle_steps):
-            old_color = colors[i]
-            new_color = meshtools.wiggle_color(old_color, wiggle_factor)
+    if not solve:  # guess colors
+        for i in range(len(colors)):
+            for _ in range(wiggle_steps):
+                old_color = colors[i]
+                new_color = meshtools.wiggle_color(old_color, wiggle_factor, rng)
 
-            colors[i] = new_color
-            new_fit = evaluate_mesh(new_mesh, real_image)
+                colors[i] = new_color
+                new_fit = evaluate_mesh(new_mesh, real_image)
 
-            if new_fit < best_fit:
-                best_fit = new_fit
-            else:
-                colors[i] = old_color
+                if new_fit < best_fit:
+                    best_fit = new_fit
+                else:
+                    colors[i] = old_color
 
     if color_only:
         return new_mesh
@@ -70,7 +107,7 @@ def wiggle_mesh(mesh: tyMesh, real_image: Image, wiggle_steps: int, wiggle_facto
 
             for _ in range(wiggle_steps):
                 old_vertex = vertices[r][i]
-                new_vertex = meshtools.wiggle_vertex(old_vertex, wiggle_factor, safe_only)
+                new_vertex = meshtools.wiggle_vertex(old_vertex, wiggle_factor, safe_only, rng)
 
                 vertices[r][i] = new_vertex
                 new_fit = evaluate_mesh(new_mesh, real_image)
@@ -83,29 +120,41 @@ def wiggle_mesh(mesh: tyMesh, real_image: Image, wiggle_steps: int, wiggle_facto
     return new_mesh
 
 
-def make_population(n_meshes: int, real_image: Image, n_rows: int, points_per_row: int)-> tyPop:
+def make_population(n_meshes: int, real_image: Target, n_rows: int, points_per_row: int,
+                    rng=random)-> tyPop:
     w, h = real_image.width, real_image.height
     meshes = [
-        meshtools.make_mesh(w, h, n_rows, points_per_row)
+        meshtools.make_mesh(w, h, n_rows, points_per_row, rng)
         for _ in range(n_meshes)]
     return [(evaluate_mesh(m, real_image), m) for m in meshes]
 
 
-def evolve_population(pop: tyPop, real_image: Image)-> tyPop:
+def evolve_population(pop: tyPop, real_image: Target, rng=random)-> tyPop:
     pop.sort(key=lambda x: x[0])
     apex_members = pop[:len(pop)//2]
     offspring = []
     for _, mesh in apex_members:
-        _, partner = random.choice(apex_members)  # can select itself again
-        child = meshtools.combine_meshes(mesh, partner)
+        _, partner = rng.choice(apex_members)  # can select itself again
+        child = meshtools.combine_meshes(mesh, partner, rng=rng)
         fit = evaluate_mesh(child, real_image)
         offspring.append((fit, child))
     return apex_members+offspring
 
 
-def evolve_image(image_path: str, out_name: str, evolution_kwargs, draw_kwargs={}, report=True):
-
-    real_image = Image.open(image_path)
+def evolve_image(image_path: str, out_name: str, evolution_kwargs, draw_kwargs={}, report=True,
+                 seed=None):
+    """ Evolves a population of meshes to fit the image at [image_path]. A
+    [seed] (an int or a numpy Generator) makes the evolution reproducible.
+    Every place in the population wiggles its mesh with its own random stream,
+    the population and its evolution have another one (see streams.py). If
+    the [solve_colors] evolution argument is set, triangle colors are solved
+    for instead of wiggled (see [solve_colors]). The [stop_seconds],
+    [stop_score] (a fit), [stop_window] and [stop_epsilon] evolution
+    arguments can end the color and shape optimisations before their
+    iterations (see stopping.py), a plateau only ends its optimisation. The
+    final meshes are saved either way. """
+
+    real_image = target_from_specs(Image.open(image_path), evolution_kwargs)
     w, h = real_image.width, real_image.height
 
     # Extract arguments
@@ -116,12 +165,25 @@ def evolve_image(image_path: str, out_name: str, evolution_kwargs, draw_kwargs={
 
     iterations, wiggles = evolution_kwargs["iterations"], evolution_kwargs.get("wiggles", 10)
     color_iterations = evolution_kwargs.get("color_iterations", 0)
+    solve = evolution_kwargs.get("solve_colors", False)
+    stopper = stopping.stopper_from_specs(evolution_kwargs)
 
     safe, upscale = draw_kwargs.get("safe", True), draw_kwargs.get("upscale", 1)
     borderkwargs = {k: v for k, v in draw_kwargs.items() if k in ("borderwidth", "bordercol")}
 
+    # Intermediate meshes are upscaled, drawn and saved in the background
+    def render(mesh):
+        mesh = meshtools.scale_mesh(mesh, upscale)
+        return draw_image(w * upscale, h * upscale, mesh, **borderkwargs)
+    writer = snapshots.SnapshotWriter(render, draw_kwargs.get("steps_dir", "."),
+                                      draw_kwargs.get("steps_queue", 4))
+
     # Start evolution
-    pop = make_population(pop_size, real_image, rows, ppr)
+    main_seed, members_seed = streams.spawn(seed, 2)
+    rng = streams.python_random(main_seed)
+    member_rngs = [streams.python_random(member_seed)
+                   for member_seed in streams.spawn(members_seed, pop_size)]
+    pop = make_population(pop_size, real_image, rows, ppr, rng)
 
     sep = "="*50+"\n"
     if report:
@@ -129,9 +191,14 @@ def evolve_image(image_path: str, out_name: str, evolution_kwargs, draw_kwargs={
 
     t = time.time()
     for i in range(color_iterations):
+        if stopper and stopper.check(i, min(pop, key=lambda x: x[0])[0]):
+            if report:
+                print(f"stopped after {i} iterations: {stopper.reason}")
+            break
         new_pop = []
-        for fit, mesh in pop:
-            new = wiggle_mesh(mesh, real_image, wiggles, 0.4, color_only=True)
+        for (fit, mesh), member_rng in zip(pop, member_rngs):
+            new = wiggle_mesh(mesh, real_image, wiggles, 0.4, color_only=True,
+                              rng=member_rng, solve=solve)
             new_fit = evaluate_mesh(new, real_image)
             better = min((fit, mesh), (new_fit, new), key=lambda x: x[0])
             new_pop.append(better)
@@ -140,8 +207,7 @@ def evolve_image(image_path: str, out_name: str, evolution_kwargs, draw_kwargs={
 
         if report:
             best_fit, best_mesh = min(pop, key=lambda x: x[0])
-            best_mesh = meshtools.scale_mesh(best_mesh, upscale)
-            draw_image(w * upscale, h * upscale, best_mesh, **borderkwargs).save(f"{i+1}_{out_name}.png")
+            writer.submit(f"{i+1}_{out_name}.png", best_mesh)
             t_now = time.time()
             t, dt = t_now, t_now - t
             print(f"{i+1}/{color_iterations} complete | average fit: {best_fit:.4f} | iteration time: {dt}s")
@@ -149,14 +215,21 @@ def evolve_image(image_path: str, out_name: str, evolution_kwargs, draw_kwargs={
     if report:
         print(sep+"shape optimisation\n"+sep)
 
+    if stopper:
+        stopper.restart()
     for j in range(iterations):
+        if stopper and stopper.check(j, min(pop, key=lambda x: x[0])[0]):
+            if report:
+                print(f"stopped after {j} iterations: {stopper.reason}")
+            break
         if pop_size > 1 and evo_step is not None and j % evo_step == 0:
-            pop = evolve_population(pop, real_image)
+            pop = evolve_population(pop, real_image, rng)
 
         new_pop = []
         f = 0.4 - (0.3 * j/iterations)
-        for fit, mesh in pop:
-            new = wiggle_mesh(mesh, real_image, wiggles, f, safe_only=safe)
+        for (fit, mesh), member_rng in zip(pop, member_rngs):
+            new = wiggle_mesh(mesh, real_image, wiggles, f, safe_only=safe,
+                              rng=member_rng, solve=solve)
             new_fit = evaluate_mesh(new, real_image)
             better = min((fit, mesh), (new_fit, new), key=lambda x: x[0])
             new_pop.append(better)
@@ -165,12 +238,12 @@ def evolve_image(image_path: str, out_name: str, evolution_kwargs, draw_kwargs={
 
         if report:
             best_fit, best_mesh = min(pop, key=lambda x: x[0])
-            best_mesh = meshtools.scale_mesh(best_mesh, upscale)
-            draw_image(w*upscale, h*upscale, best_mesh, **borderkwargs).save(f"{i+j+2}_{out_name}.png")
+            writer.submit(f"{i+j+2}_{out_name}.png", best_mesh)
             t_now = time.time()
             t, dt = t_now, t_now - t
             print(f"{j+1}/{iterations} complete | average fit: {best_fit:.4f} | iteration time: {dt}s")
 
+    writer.close()
     for fit, mesh in pop:
         upscale_mesh = meshtools.scale_mesh(mesh, upscale)
         draw_image(upscale * w, upscale * h, upscale_mesh, **borderkwargs).save(f"final_{fit}_"+out_name+".png")
@@ -1,5 +1,4 @@
 import random
-from random import randint
 from typing import List, Tuple
 from PIL import Image, ImageDraw
 
@@ -17,8 +16,8 @@ tyMesh = Tuple[tyVertices, tyColors]
 # =============================================================================
 
 
-def random_color()->tyColor:
-    return (randint(0, 255), randint(0, 255), randint(0, 255), 255)
+def random_color(rng=random)->tyColor:
+    return (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255), 255)
 
 
 def make_vertex(position: tyPosition, safety_r: float, mutable=True)-> tyVertex:
@@ -30,12 +29,13 @@ def make_vertex(position: tyPosition, safety_r: float, mutable=True)-> tyVertex:
     return vertex
 
 
-def make_mesh(width: int, height: int, rows: int, points_per_row: int)-> tyMesh:
+def make_mesh(width: int, height: int, rows: int, points_per_row: int,
+              rng=random)-> tyMesh:
     n_triangles = 2 * (points_per_row - 1) * rows
     triangle_w = width / (points_per_row - 1.5)
     triangle_h = height / rows
 
-    colors = [random_color() for _ in range(n_triangles)]
+    colors = [random_color(rng) for _ in range(n_triangles)]
 
     # the maximum radius of disjoint circles with centers in vertices
     triangle_side = ((triangle_w / 2) ** 2 + triangle_h ** 2) ** 0.5
@@ -98,7 +98,9 @@ def scale_mesh(mesh: tyMesh, factor: float):
     return (vertices_copy, colors_copy)
 
 
-def draw_mesh(draw: ImageDraw, mesh: tyMesh, bordercol=None, borderwidth=None):
+def triangles(mesh: tyMesh):
+    """ Yields the points and the color index of every triangle, in the order
+    they are drawn. """
     vertices, colors = mesh
     n_rows = len(vertices) - 1
     points_per_row = len(vertices[0])
@@ -112,10 +114,7 @@ def draw_mesh(draw: ImageDraw, mesh: tyMesh, bordercol=None, borderwidth=None):
                 vertices[r][i]["current_p"],
                 vertices[r][i+1]["current_p"],
                 vertices[r+1][i+shift]["current_p"]]
-            color = colors[r * 2 * (points_per_row - 1) + i]
-            draw.polygon(points, fill=color)
-            if bordercol is not None and borderwidth is not None:
-                draw.line(points+[points[0]], width=borderwidth, fill=bordercol, joint="curve")
+            yield points, r * 2 * (points_per_row - 1) + i
 
         # bot half of triangles
         for i in range(points_per_row-1):
@@ -123,16 +122,32 @@ def draw_mesh(draw: ImageDraw, mesh: tyMesh, bordercol=None, borderwidth=None):
                 vertices[r][i+(1-shift)]["current_p"],
                 vertices[r+1][i]["current_p"],
                 vertices[r+1][i+1]["current_p"]]
-            color = colors[(r * 2 + 1) * (points_per_row - 1) + i]
-            draw.polygon(points, fill=color)
-            if bordercol is not None and borderwidth is not None:
-                draw.line(points+[points[0]], width=borderwidth, fill=bordercol, joint="curve")
+            yield points, (r * 2 + 1) * (points_per_row - 1) + i
+
+
+def draw_mesh(draw: ImageDraw, mesh: tyMesh, bordercol=None, borderwidth=None):
+    _, colors = mesh
+    for points, k in triangles(mesh):
+        draw.polygon(points, fill=colors[k])
+        if bordercol is not None and borderwidth is not None:
+            draw.line(points+[points[0]], width=borderwidth, fill=bordercol, joint="curve")
+
+
+def draw_labels(mesh: tyMesh, width: int, height: int):
+    """ Returns an image where every pixel holds 1 + the color index of the
+    triangle drawn over it, or 0 if there is none. """
+    labels = Image.new("I", (width, height), 0)
+    draw = ImageDraw.Draw(labels)
+    for points, k in triangles(mesh):
+        draw.polygon(points, fill=k+1)
+    return labels
 
 # =============================================================================
 # Mutations
 
 
-def wiggle_vertex(vertex: tyVertex, factor: float, safe_only)-> tyVertex:
+def wiggle_vertex(vertex: tyVertex, factor: float, safe_only,
+                  rng=random)-> tyVertex:
     new_vertex = {k: v for k, v in vertex.items()}  # make copy
 
     if not vertex["mutable"]:
@@ -143,8 +158,8 @@ def wiggle_vertex(vertex: tyVertex, factor: float, safe_only)-> tyVertex:
     orig_x, orig_y = vertex["original_p"]
 
     for _ in range(100):  # try a hundred times and then give up
-        new_x = random.gauss(x, move)
-        new_y = random.gauss(y, move)
+        new_x = rng.gauss(x, move)
+        new_y = rng.gauss(y, move)
         sq_dist = (orig_x - new_x)**2 + (orig_y - new_y)**2
         if sq_dist < vertex["safety_r"]**2 or not safe_only:
             new_vertex["current_p"] = (new_x, new_y)
@@ -153,25 +168,26 @@ def wiggle_vertex(vertex: tyVertex, factor: float, safe_only)-> tyVertex:
     return new_vertex  # in case we fail to find a suitable point
 
 
-def wiggle_color(color: tyColor, factor: float):
+def wiggle_color(color: tyColor, factor: float, rng=random):
     (r, g, b, a) = color
     d = 50 * factor  # wild changes rarely pay off
 
-    m_r = max(0, min(255, round(random.gauss(r, d))))
-    m_g = max(0, min(255, round(random.gauss(g, d))))
-    m_b = max(0, min(255, round(random.gauss(b, d))))
+    m_r = max(0, min(255, round(rng.gauss(r, d))))
+    m_g = max(0, min(255, round(rng.gauss(g, d))))
+    m_b = max(0, min(255, round(rng.gauss(b, d))))
 
     return (m_r, m_g, m_b, a)
 
 
-def combine_meshes(mesh1: tyMesh, mesh2: tyMesh, ratio=0.5)-> tyMesh:
+def combine_meshes(mesh1: tyMesh, mesh2: tyMesh, ratio=0.5,
+                   rng=random)-> tyMesh:
     vertices1, colors1 = mesh1
     vertices2, colors2 = mesh2
 
     vertices, colors = [], []
 
     for i in range(len(colors1)):
-        if random.random() < ratio:
+        if rng.random() < ratio:
             colors.append(colors1[i])
         else:
             colors.append(colors2[i])
@@ -179,7 +195,7 @@ def combine_meshes(mesh1: tyMesh, mesh2: tyMesh, ratio=0.5)-> tyMesh:
     for r in range(len(vertices1)):
         row = []
         for i in range(len(vertices1[r])):
-            if random.random() < ratio:
+            if rng.random() < ratio:
                 row.append(vertices1[r][i].copy())
             else:
                 row.append(vertices2[r][i].copy())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The projects share a single copy of this module, shared/snapshots.py at the
+# root of the repository.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.snapshots import *